@@ -0,0 +1,258 @@
+"""Micro-benchmarks for the delivery hot path.
+
+Covers payload construction, length checks, per-row parameter resolution and
+whole ``process_event`` runs over synthetic result sets. Every case reports
+throughput, p50/p99 per-event latency and peak traced memory; the HTTP layer
+is answered in-process so nothing leaves the machine.
+
+Results can be saved as a baseline and later runs compared against it::
+
+    uv run python benchmarks/bench_delivery.py --save baseline.json
+    uv run python benchmarks/bench_delivery.py --baseline baseline.json
+
+The comparison exits non-zero when any case loses more than ``--tolerance``
+of its baseline throughput.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional
+
+import requests
+from requests.adapters import BaseAdapter
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from package.bin.ta_pushover.modalert_pushover_helper import process_event  # noqa: E402
+from package.bin.ta_pushover.pushover_common import (  # noqa: E402
+    PushoverClient,
+    build_session,
+    event_value_or_literal,
+)
+
+DEFAULT_ROW_COUNTS = (1, 1000, 100000)
+DEFAULT_TOLERANCE = 0.2
+
+PARAMS: Dict[str, str] = {
+    "account": "bench",
+    "message": "message",
+    "title": "$result.host$ alert",
+    "priority": "priority",
+    "url": "https://splunk.example.com/app/search",
+    "sound": "siren",
+}
+
+EVENT: Dict[str, str] = {
+    "message": "host01 is down",
+    "host": "host01",
+    "priority": "1",
+    "_time": "1700000000",
+}
+
+
+def _rows(count: int) -> Iterator[Dict[str, str]]:
+    for index in range(count):
+        yield {
+            "message": f"host{index:05d} is down",
+            "host": f"host{index:05d}",
+            "priority": str(index % 3),
+            "_time": str(1700000000 + index),
+        }
+
+
+class _Answer(BaseAdapter):
+    """Transport adapter that accepts every message without a network round-trip."""
+
+    def __init__(self, on_send: Callable[[], None]) -> None:
+        super().__init__()
+        self._on_send = on_send
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        del kwargs
+        self._on_send()
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"status": 1}'
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class _BenchHelper:
+    results_file = None
+
+    def __init__(self, row_count: int, on_send: Callable[[], None]) -> None:
+        self._row_count = row_count
+        self._on_send = on_send
+        self._logger = logging.getLogger("bench_delivery")
+
+    def get_param(self, key: str) -> Optional[str]:
+        return PARAMS.get(key)
+
+    def get_user_credential_by_account_id(self, account_id: str) -> Mapping[str, str]:
+        del account_id
+        return {"user": "user_key", "app_token": "app_token"}
+
+    def get_events(self) -> Iterator[Dict[str, str]]:
+        return _rows(self._row_count)
+
+    def log_info(self, message: str) -> None:
+        del message
+
+    def get_http_session(self, pool_size: int) -> requests.Session:
+        session = build_session(pool_size)
+        session.mount("https://", _Answer(self._on_send))
+        return session
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _summarise(latencies_ns: List[float], elapsed_ns: float, peak_bytes: int) -> Dict[str, float]:
+    return {
+        "events": len(latencies_ns),
+        "throughput_per_s": len(latencies_ns) / (elapsed_ns / 1e9),
+        "p50_us": _percentile(latencies_ns, 0.50) / 1000,
+        "p99_us": _percentile(latencies_ns, 0.99) / 1000,
+        "peak_kib": peak_bytes / 1024,
+    }
+
+
+def _peak_memory(run: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_call(function: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    """Time ``function`` call by call; memory is traced in a separate pass."""
+    latencies: List[float] = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        call_started = clock()
+        function()
+        latencies.append(clock() - call_started)
+    elapsed = clock() - started
+
+    def _traced() -> None:
+        for _ in range(min(iterations, 1000)):
+            function()
+
+    return _summarise(latencies, elapsed, _peak_memory(_traced))
+
+
+def bench_process_event(row_count: int) -> Dict[str, float]:
+    """One alert run over ``row_count`` results; latency is the gap between sends."""
+    send_times: List[int] = []
+    helper = _BenchHelper(row_count, lambda: send_times.append(time.perf_counter_ns()))
+    started = time.perf_counter_ns()
+    process_event(helper)
+    elapsed = time.perf_counter_ns() - started
+    previous = [started, *send_times[:-1]]
+    latencies = [float(sent - before) for sent, before in zip(send_times, previous)]
+
+    traced_helper = _BenchHelper(row_count, lambda: None)
+    return _summarise(latencies, elapsed, _peak_memory(lambda: process_event(traced_helper)))
+
+
+def run_all(row_counts: List[int], iterations: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {
+        "build_payload": bench_call(
+            lambda: PushoverClient.build_payload(
+                token="app_token",
+                user="user_key",
+                message=EVENT["message"],
+                priority=1,
+                sound="siren",
+                timestamp=1700000000,
+                title="host01 alert",
+                url="https://splunk.example.com/app/search",
+            ),
+            iterations,
+        ),
+        "check_lengths": bench_call(
+            lambda: PushoverClient.check_lengths(
+                {"message": EVENT["message"], "title": "host01 alert", "url": PARAMS["url"]}
+            ),
+            iterations,
+        ),
+        "event_value_or_literal": bench_call(
+            lambda: [event_value_or_literal(PARAMS.get(name), EVENT) for name in PARAMS],
+            iterations,
+        ),
+    }
+    for row_count in row_counts:
+        results[f"process_event[{row_count}]"] = bench_process_event(row_count)
+    return results
+
+
+def compare(
+    results: Mapping[str, Mapping[str, float]],
+    baseline: Mapping[str, Mapping[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """Names of the cases whose throughput fell more than ``tolerance`` below baseline."""
+    regressions: List[str] = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["throughput_per_s"]
+        change = result["throughput_per_s"] / before - 1
+        print(f"{name:>28}: {change:+7.1%} throughput vs baseline")
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        default=",".join(str(count) for count in DEFAULT_ROW_COUNTS),
+        help="comma separated result set sizes for the process_event runs",
+    )
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--save", type=Path, help="write the results to this baseline file")
+    parser.add_argument("--baseline", type=Path, help="compare against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    arguments = parser.parse_args()
+
+    results = run_all([int(count) for count in arguments.rows.split(",")], arguments.iterations)
+    for name, result in results.items():
+        print(
+            f"{name:>28}: {result['throughput_per_s']:12,.0f} ev/s"
+            f"  p50 {result['p50_us']:8.2f} us  p99 {result['p99_us']:8.2f} us"
+            f"  peak {result['peak_kib']:10,.1f} KiB"
+        )
+
+    if arguments.save is not None:
+        arguments.save.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+    if arguments.baseline is not None:
+        baseline = json.loads(arguments.baseline.read_text())
+        regressions = compare(results, baseline, arguments.tolerance)
+        if regressions:
+            print(f"throughput regressed beyond {arguments.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Per-event cost of a request body: dict payload + json.dumps vs :class:`Message`.
+
+Reports time per event and what tracemalloc sees allocated while building and
+encoding every body, both in total and still alive at the end (the bodies are
+kept, as a run keeps them for retries and metrics).
+
+Run with ``uv run python benchmarks/bench_message.py``.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from package.bin.ta_pushover.message import LENGTH_LIMITS, Message  # noqa: E402
+
+TOKEN = "azGDORePK8gMaC0QOYAMyEEuzJnyUi"
+USER = "uQiRzpo4DXghDmr9QzzfQu27cmVRsG,gznej3rKEVAvPUxu9vvNnqpmZpokzF"
+
+EVENTS: List[Dict[str, str]] = [
+    {
+        "message": f"host{index:05d} is down",
+        "title": f"host{index:05d} alert",
+        "timestamp": str(1700000000 + index),
+    }
+    for index in range(10000)
+]
+
+
+def dict_body(event: Dict[str, str]) -> Tuple[Dict[str, str], bytes]:
+    """What PushoverClient.send built and requests encoded for each event before."""
+    payload = {
+        "token": TOKEN,
+        "user": USER,
+        "message": event["message"],
+        "priority": "1",
+        "sound": "siren",
+        "timestamp": event["timestamp"],
+        "title": event["title"],
+        "url": "https://splunk.example.com/app/search",
+    }
+    for key_name, max_length in LENGTH_LIMITS.items():
+        key_value: Optional[str] = payload.get(key_name)
+        if key_value is not None and len(str(key_value)) > max_length:
+            raise ValueError(f"Length of {key_name} is too long {len(str(key_value))}")
+    return payload, json.dumps(payload).encode("utf-8")
+
+
+def message_body(event: Dict[str, str]) -> Tuple[Message, bytes]:
+    payload = Message(TOKEN, USER, event["message"], "1")
+    payload["sound"] = "siren"
+    payload["timestamp"] = event["timestamp"]
+    payload["title"] = event["title"]
+    payload["url"] = "https://splunk.example.com/app/search"
+    return payload, payload.encode()
+
+
+def allocations(build: Callable[[Dict[str, str]], Any]) -> Tuple[int, int]:
+    """Bytes allocated in total and still held, building a body for every event."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build(event) for event in EVENTS]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(
+        stat.size_diff for stat in after.compare_to(before, "lineno") if stat.size_diff > 0
+    )
+    held = sum(sys.getsizeof(part) for body in kept for part in body)
+    return allocated, held
+
+
+def main() -> None:
+    for event in EVENTS[:10]:
+        assert json.loads(dict_body(event)[1]) == json.loads(message_body(event)[1])
+
+    for label, build in (("dict + json", dict_body), ("Message", message_body)):
+        best = min(timeit.repeat(lambda: [build(event) for event in EVENTS], number=1, repeat=5))
+        allocated, held = allocations(build)
+        print(
+            f"{label:>12}: {best / len(EVENTS) * 1e6:6.2f} us/event, "
+            f"{allocated / len(EVENTS):6.0f} B/event traced, "
+            f"{held / len(EVENTS):6.0f} B/event held"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Cold-start cost of an alert run: interpreter start to the first send.
+
+Splunk starts a new Python process for every alert firing, so whatever the
+alert action imports is paid on every single alert. This starts fresh
+interpreters that import the alert helper, render one result and hand it to
+the HTTP layer (answered in-process, nothing leaves the machine), and checks
+the median latency on top of a bare interpreter start against a budget. It
+also checks that a run failing validation never loads requests.
+
+splunktaucclib is not needed: the measurement starts at the helper module
+``package/bin/pushover.py`` delegates to.
+
+Run with ``uv run python benchmarks/bench_startup.py [--budget-ms N]``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BIN_DIR = Path(__file__).resolve().parents[1] / "package" / "bin"
+
+# Median first-send latency allowed on top of a bare interpreter start, in ms.
+DEFAULT_BUDGET_MS = 200.0
+
+CHILD = r"""
+import json
+import sys
+import time
+
+sys.path.insert(0, sys.argv[1])
+import ta_pushover.modalert_pushover_helper as modalert
+
+imported_at = time.time()
+first_send_at = None
+
+
+class _Helper:
+    results_file = None
+
+    def __init__(self, params):
+        self._params = params
+
+    def get_param(self, key):
+        return self._params.get(key)
+
+    def get_user_credential_by_account_id(self, account_id):
+        return {"user": "user_key", "app_token": "app_token"}
+
+    def get_events(self):
+        return iter([{"message": "host01 is down"}])
+
+    def log_info(self, message):
+        pass
+
+    def get_http_session(self, pool_size):
+        import requests
+        from requests.adapters import BaseAdapter
+
+        from ta_pushover.pushover_common import build_session
+
+        class _Answer(BaseAdapter):
+            def send(self, request, **kwargs):
+                global first_send_at
+                first_send_at = first_send_at or time.time()
+                response = requests.Response()
+                response.status_code = 200
+                response._content = b'{"status": 1}'
+                response.request = request
+                return response
+
+            def close(self):
+                pass
+
+        session = build_session(pool_size)
+        session.mount("https://", _Answer())
+        return session
+
+
+if sys.argv[2] == "invalid":
+    try:
+        modalert.process_event(_Helper({"account": "prod"}))
+    except ValueError:
+        pass
+else:
+    modalert.process_event(_Helper({"account": "prod", "message": "message"}))
+
+print(json.dumps({
+    "imported_at": imported_at,
+    "first_send_at": first_send_at,
+    "finished_at": time.time(),
+    "requests_loaded": "requests" in sys.modules,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def bare_interpreter_ms() -> float:
+    started_at = time.time()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return (time.time() - started_at) * 1000
+
+
+def run_once(mode: str) -> Dict[str, float]:
+    environment = {key: value for key, value in os.environ.items() if key != "SPLUNK_HOME"}
+    started_at = time.time()
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD, str(BIN_DIR), mode],
+        capture_output=True,
+        check=True,
+        env=environment,
+        text=True,
+    )
+    report = json.loads(completed.stdout)
+    timings = {
+        "import_ms": (report["imported_at"] - started_at) * 1000,
+        "total_ms": (report["finished_at"] - started_at) * 1000,
+        "modules": report["modules"],
+        "requests_loaded": report["requests_loaded"],
+    }
+    if report["first_send_at"] is not None:
+        timings["first_send_ms"] = (report["first_send_at"] - started_at) * 1000
+    return timings
+
+
+def summarise(label: str, samples: List[float]) -> float:
+    median = statistics.median(samples)
+    worst = max(samples)
+    print(f"{label:>24}: median {median:7.1f} ms, max {worst:7.1f} ms")
+    return median
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    arguments = parser.parse_args()
+
+    sends = [run_once("send") for _ in range(arguments.runs)]
+    invalid = [run_once("invalid") for _ in range(arguments.runs)]
+
+    interpreter = summarise(
+        "bare interpreter", [bare_interpreter_ms() for _ in range(arguments.runs)]
+    )
+    summarise("helper import", [run["import_ms"] for run in sends])
+    first_send = summarise("first send", [run["first_send_ms"] for run in sends])
+    summarise("validation failure exit", [run["total_ms"] for run in invalid])
+    print(
+        f"{'modules loaded':>24}: {sends[0]['modules']:.0f} on send, "
+        f"{invalid[0]['modules']:.0f} on validation failure"
+    )
+
+    failed = False
+    if any(run["requests_loaded"] for run in invalid):
+        print("requests was imported by a run that failed validation")
+        failed = True
+    if first_send - interpreter > arguments.budget_ms:
+        print(
+            f"first send takes {first_send - interpreter:.0f} ms over interpreter start, "
+            f"the budget is {arguments.budget_ms:.0f} ms"
+        )
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
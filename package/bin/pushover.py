@@ -8,12 +8,15 @@ except ImportError:
 
 import sys
 import traceback
-from typing import Any
-
-import requests
+from typing import TYPE_CHECKING, Any, Optional
 
 from splunktaucclib.alert_actions_base import ModularAlertBase  # type: ignore
-from ta_pushover import modalert_pushover_helper
+from ta_pushover.pushover_common import DEFAULT_POOL_SIZE, build_session
+
+# requests and the alert helpers are imported on first use, so a run that
+# fails validation exits without paying for them
+if TYPE_CHECKING:
+    import requests
 
 
 class AlertActionWorkerpushover(ModularAlertBase):  # type: ignore
@@ -22,18 +25,27 @@ class AlertActionWorkerpushover(ModularAlertBase):  # type: ignore
     def __init__(self, ta_name: str, alert_name: str) -> None:
         """init"""
         self.message_url = "https://api.pushover.net/1/messages.json"
+        self._http_session: Optional["requests.Session"] = None
         super().__init__(ta_name, alert_name)
 
+    def get_http_session(self, pool_size: int = DEFAULT_POOL_SIZE) -> "requests.Session":
+        """returns the pooled keep-alive session shared by every send in this process"""
+        if self._http_session is None:
+            self._http_session = build_session(pool_size=pool_size)
+        return self._http_session
+
     def build_http_connection(
         self,
         config: dict[str, Any],
         timeout: int = 120,
         disable_ssl_validation: bool = False,
-    ) -> requests.Response:
-        """does a thing"""
-        with requests.Session() as session:
-            session.verify = not disable_ssl_validation
-            return session.request(timeout=timeout, **config)
+    ) -> "requests.Response":
+        """sends a request over the shared pooled session"""
+        return self.get_http_session().request(
+            timeout=timeout,
+            verify=not disable_ssl_validation,
+            **config,
+        )
 
     def validate_params(self) -> bool:
         """validates input parameters"""
@@ -57,6 +69,8 @@ class AlertActionWorkerpushover(ModularAlertBase):  # type: ignore
         try:
             if not self.validate_params():
                 return 3
+            from ta_pushover import modalert_pushover_helper
+
             status = modalert_pushover_helper.process_event(self, *args, **kwargs)
         except (AttributeError, TypeError) as attribute_error:
             self.log_error(
@@ -0,0 +1,76 @@
+"""Resident Pushover delivery service that alert actions hand their messages to"""
+
+# Always put this line at the beginning of this file
+try:
+    import import_declare_test  # type: ignore[import-not-found]  # noqa: F401
+except ImportError:
+    pass
+
+import logging
+import signal
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Optional
+
+from pushover_outbox import account_resolver
+from ta_pushover.delivery_service import (
+    DEFAULT_LOG_WINDOW_SECONDS,
+    DEFAULT_MAX_LIFETIME_SECONDS,
+    DeliveryService,
+    shared_rate_scheduler,
+)
+from ta_pushover.log_sampling import LogSampler
+from ta_pushover.pushover_common import PushoverClient
+
+
+def main() -> int:
+    """serves hand-overs until splunkd stops it or its lifetime is up"""
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+    )
+    logger = logging.getLogger("ta_pushover.delivery")
+
+    session_key = sys.stdin.readline().strip()
+    if not session_key:
+        logger.error("No session key received, is passAuth set for this input?")
+        return 1
+
+    stopped = threading.Event()
+
+    def _stop(signal_number: int, frame: Optional[FrameType]) -> None:
+        del signal_number, frame
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    with PushoverClient(
+        logger=logger, log_sampler=LogSampler(), rate_scheduler_for=shared_rate_scheduler
+    ) as client:
+        service = DeliveryService(client, account_resolver(session_key), logger=logger)
+        with service:
+            logger.info("Pushover delivery service listening on %s", service.socket_path)
+            # Exits after its lifetime so splunkd restarts it with a fresh session key.
+            stop_at = time.monotonic() + DEFAULT_MAX_LIFETIME_SECONDS
+            while not stopped.wait(
+                max(min(DEFAULT_LOG_WINDOW_SECONDS, stop_at - time.monotonic()), 0)
+            ):
+                if time.monotonic() >= stop_at:
+                    break
+                service.start_log_window()
+    logger.info(
+        "Pushover delivery service stopped accepted=%s sent=%s suppressed=%s failed=%s",
+        service.accepted,
+        service.sent,
+        service.suppressed,
+        service.failed,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Replays Pushover messages deferred to the local outbox by the alert action"""
+
+# Always put this line at the beginning of this file
+try:
+    import import_declare_test  # type: ignore[import-not-found]  # noqa: F401
+except ImportError:
+    pass
+
+import logging
+import sys
+from typing import Callable, Optional, Tuple
+
+from solnlib import conf_manager  # type: ignore
+from ta_pushover.outbox import Outbox, replay
+from ta_pushover.pushover_common import PushoverClient, extract_account_credentials
+from ta_pushover.receipts import ReceiptStore
+
+APP_NAME = "TA-pushover"
+ACCOUNT_CONF = "ta_pushover_account"
+ACCOUNT_REALM = f"__REST_CREDENTIAL__#{APP_NAME}#configs/conf-{ACCOUNT_CONF}"
+
+
+def account_resolver(session_key: str) -> Callable[[str], Tuple[str, str]]:
+    """returns a function looking up (user, app_token) for an account name"""
+    accounts = conf_manager.ConfManager(
+        session_key,
+        APP_NAME,
+        realm=ACCOUNT_REALM,
+    ).get_conf(ACCOUNT_CONF)
+
+    def _resolve(account_name: str) -> Tuple[str, str]:
+        try:
+            account_data = accounts.get(account_name)
+        except conf_manager.ConfStanzaNotExistException as missing_account:
+            raise ValueError(f"Account '{account_name}' was not found") from missing_account
+        return extract_account_credentials(account_data)
+
+    return _resolve
+
+
+def main() -> int:
+    """drains the outbox using the session key splunkd passes on stdin"""
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+    )
+    logger = logging.getLogger("ta_pushover.outbox")
+
+    session_key = sys.stdin.readline().strip()
+    if not session_key:
+        logger.error("No session key received, is passAuth set for this input?")
+        return 1
+
+    outbox = Outbox(logger=logger)
+    receipts: Optional[ReceiptStore] = None
+    try:
+        if len(outbox) == 0:
+            return 0
+        receipts = ReceiptStore(logger=logger)
+        with PushoverClient(logger=logger) as client:
+            result = replay(outbox, client, account_resolver(session_key), receipts=receipts)
+    finally:
+        outbox.close()
+        if receipts is not None:
+            receipts.close()
+    logger.info(
+        "Pushover outbox replay sent=%s rejected=%s remaining=%s",
+        result.sent,
+        result.rejected,
+        result.remaining,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Polls the receipts of emergency Pushover messages sent by the alert action"""
+
+# Always put this line at the beginning of this file
+try:
+    import import_declare_test  # type: ignore[import-not-found]  # noqa: F401
+except ImportError:
+    pass
+
+import logging
+import sys
+
+from pushover_outbox import account_resolver
+from ta_pushover.receipts import ReceiptClient, ReceiptStore, poll_receipts
+
+
+def main() -> int:
+    """polls due receipts using the session key splunkd passes on stdin"""
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+    )
+    logger = logging.getLogger("ta_pushover.receipts")
+
+    session_key = sys.stdin.readline().strip()
+    if not session_key:
+        logger.error("No session key received, is passAuth set for this input?")
+        return 1
+
+    store = ReceiptStore(logger=logger)
+    try:
+        if len(store) == 0:
+            return 0
+        with ReceiptClient(logger=logger) as client:
+            result = poll_receipts(store, client, account_resolver(session_key))
+    finally:
+        store.close()
+    logger.info(
+        "Pushover receipt polling acknowledged=%s expired=%s dropped=%s pending=%s",
+        result.acknowledged,
+        result.expired,
+        result.dropped,
+        result.pending,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Image attachments, streamed from disk and kept under Pushover's size limit.
+
+Pushover accepts one image of at most 2.5 MB per message. :class:`MultipartBody`
+sends the message fields and the image as ``multipart/form-data`` while
+reading the file in chunks, so the whole image is never held in memory. Its
+length is known up front, so the request goes out with a plain
+``Content-Length`` and can be replayed on retry.
+
+:class:`AttachmentCache` checks each attachment once per alert run, so a chart
+shared by every result is only stat-ed (and, if too large, shrunk) once.
+Oversized images are downscaled and recompressed when Pillow is installed;
+without it they are left off the message with a warning.
+
+Attachment paths may come from search results, so only image files below the
+allowed directories (the dispatch area of the Splunk instance by default) are
+ever read.
+"""
+
+from __future__ import annotations
+
+import logging
+import mimetypes
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+MAX_ATTACHMENT_BYTES = 2621440
+CHUNK_SIZE = 64 * 1024
+DOWNSCALE_ATTEMPTS = 6
+JPEG_QUALITY = 85
+
+ATTACHMENT_TYPES = frozenset(
+    {"image/bmp", "image/gif", "image/jpeg", "image/png", "image/tiff", "image/webp"}
+)
+
+
+def default_attachment_roots() -> List[str]:
+    """Directories attachments may be read from: search artifacts, or the temp dir."""
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return [tempfile.gettempdir()]
+    return [os.path.join(splunk_home, "var", "run", "splunk")]
+
+
+class Attachment(NamedTuple):
+    path: str
+    filename: str
+    content_type: str
+    size: int
+
+
+class MultipartBody:
+    """``multipart/form-data`` request body that reads the attachment as it is sent."""
+
+    def __init__(
+        self,
+        fields: Mapping[str, str],
+        attachment: Attachment,
+        boundary: Optional[str] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.attachment = attachment
+        self.boundary = boundary or secrets.token_hex(16)
+        self.chunk_size = chunk_size
+        parts = [
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"'
+            f"\r\n\r\n{value}\r\n"
+            for name, value in fields.items()
+        ]
+        parts.append(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="attachment"; '
+            f'filename="{_quote(attachment.filename)}"\r\n'
+            f"Content-Type: {attachment.content_type}\r\n\r\n"
+        )
+        self._head = "".join(parts).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return len(self._head) + self.attachment.size + len(self._tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        # Reopened on every iteration so a retried request sends the file again.
+        yield self._head
+        remaining = self.attachment.size
+        with open(self.attachment.path, "rb") as attachment_file:
+            while remaining > 0:
+                chunk = attachment_file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise ValueError(f"Attachment {self.attachment.path} shrank while sending")
+                remaining -= len(chunk)
+                yield chunk
+        yield self._tail
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "").replace("\n", "")
+
+
+def _downscale(source: Attachment, target_dir: str, max_bytes: int) -> Optional[Attachment]:
+    """A smaller JPEG copy of ``source`` within ``max_bytes``, or None without Pillow."""
+    try:
+        from PIL import Image  # type: ignore[import-not-found]
+    except ImportError:
+        return None
+
+    target = os.path.join(target_dir, f"{secrets.token_hex(8)}.jpg")
+    with Image.open(source.path) as image:
+        image = image.convert("RGB")
+        scale = min(1.0, (max_bytes / source.size) ** 0.5)
+        for _ in range(DOWNSCALE_ATTEMPTS):
+            width = max(1, int(image.width * scale))
+            height = max(1, int(image.height * scale))
+            image.resize((width, height)).save(target, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            size = os.path.getsize(target)
+            if size <= max_bytes:
+                filename = os.path.splitext(source.filename)[0] + ".jpg"
+                return Attachment(target, filename, "image/jpeg", size)
+            scale *= 0.75
+    os.remove(target)
+    return None
+
+
+class AttachmentCache:
+    """Checked (and if needed shrunk) attachments of one run, keyed by file version."""
+
+    def __init__(
+        self,
+        allowed_roots: Optional[Sequence[str]] = None,
+        max_bytes: int = MAX_ATTACHMENT_BYTES,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        roots = default_attachment_roots() if allowed_roots is None else allowed_roots
+        self.allowed_roots = [os.path.realpath(root) for root in roots]
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._prepared: Dict[Tuple[str, int, int], Optional[Attachment]] = {}
+        self._work_dir: Optional[str] = None
+
+    def _check_path(self, path: str) -> Tuple[str, str]:
+        real_path = os.path.realpath(path)
+        if not any(
+            os.path.commonpath([real_path, root]) == root for root in self.allowed_roots
+        ):
+            raise ValueError(f"Attachment {path} is outside the allowed directories")
+        content_type = mimetypes.guess_type(real_path)[0]
+        if content_type is None or content_type not in ATTACHMENT_TYPES:
+            raise ValueError(f"Attachment {path} is not a supported image type")
+        return real_path, content_type
+
+    def prepare(self, path: str) -> Optional[Attachment]:
+        """The attachment to send for ``path``; None when it had to be left off."""
+        real_path, content_type = self._check_path(path)
+        try:
+            stat = os.stat(real_path)
+        except OSError as stat_error:
+            raise ValueError(f"Attachment {path} cannot be read: {stat_error}") from stat_error
+        key = (real_path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._prepared:
+                self.hits += 1
+                return self._prepared[key]
+            self.misses += 1
+            attachment = Attachment(
+                real_path, os.path.basename(real_path), content_type, stat.st_size
+            )
+            prepared = self._shrink(attachment) if stat.st_size > self.max_bytes else attachment
+            self._prepared[key] = prepared
+            return prepared
+
+    def _shrink(self, attachment: Attachment) -> Optional[Attachment]:
+        if self._work_dir is None:
+            self._work_dir = tempfile.mkdtemp(prefix="ta_pushover-attachments-")
+        try:
+            shrunk = _downscale(attachment, self._work_dir, self.max_bytes)
+        except (OSError, ValueError) as image_error:
+            self.logger.warning(
+                "Leaving attachment %s off, it could not be downscaled: %s",
+                attachment.path,
+                image_error,
+            )
+            return None
+        if shrunk is None:
+            self.logger.warning(
+                "Leaving attachment %s off, it is %s bytes and Pushover accepts at most %s "
+                "(install Pillow to downscale it).",
+                attachment.path,
+                attachment.size,
+                self.max_bytes,
+            )
+            return None
+        self.logger.info(
+            "Downscaled attachment %s from %s to %s bytes.",
+            attachment.path,
+            attachment.size,
+            shrunk.size,
+        )
+        return shrunk
+
+    def close(self) -> None:
+        with self._lock:
+            if self._work_dir is not None:
+                shutil.rmtree(self._work_dir, ignore_errors=True)
+                self._work_dir = None
+            self._prepared.clear()
@@ -0,0 +1,103 @@
+"""In-memory cache of resolved account credentials.
+
+Looking up an account costs a REST round-trip to splunkd and a
+storage/passwords decryption. :class:`CredentialCache` keeps the resulting
+user key and application token in process memory for a short TTL, so a
+process that resolves the same account again (the resident delivery service
+above all) asks splunkd only once per TTL. Nothing is ever written to disk.
+
+The cache is dropped whenever the account or password configuration files of
+the app change, so an edited account is picked up on the next lookup.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .pushover_common import splunk_app_dir
+
+DEFAULT_TTL_SECONDS = 300.0
+
+# UCC writes the account settings and their encrypted secrets to these files.
+ACCOUNT_CONF_FILES = ("local/ta_pushover_account.conf", "local/passwords.conf")
+
+_APP_CACHES: Dict[str, "CredentialCache"] = {}
+_APP_CACHES_LOCK = threading.Lock()
+
+
+def _fingerprint(paths: Sequence[str]) -> List[Tuple[int, int]]:
+    fingerprint: List[Tuple[int, int]] = []
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            fingerprint.append((0, 0))
+            continue
+        fingerprint.append((stat_result.st_mtime_ns, stat_result.st_size))
+    return fingerprint
+
+
+class CredentialCache:
+    """Thread-safe TTL cache of ``(user, app_token)`` per account name.
+
+    ``hits``/``misses`` count the lookups made through this cache.
+    """
+
+    def __init__(
+        self,
+        watched_paths: Sequence[str] = (),
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.watched_paths = tuple(watched_paths)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, Tuple[str, str]]] = {}
+        self._fingerprint = _fingerprint(self.watched_paths)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_app(cls) -> Optional["CredentialCache"]:
+        """This process's cache for the app, or None when not running inside Splunk."""
+        app_dir = splunk_app_dir()
+        if app_dir is None:
+            return None
+        with _APP_CACHES_LOCK:
+            cache = _APP_CACHES.get(app_dir)
+            if cache is None:
+                cache = _APP_CACHES[app_dir] = cls(
+                    watched_paths=[os.path.join(app_dir, name) for name in ACCOUNT_CONF_FILES]
+                )
+            return cache
+
+    def _check_fingerprint(self) -> None:
+        fingerprint = _fingerprint(self.watched_paths)
+        if fingerprint != self._fingerprint:
+            # Account configuration changed: start over.
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def get(self, account_name: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            self._check_fingerprint()
+            entry = self._entries.get(account_name)
+            if entry is not None and entry[0] > self._clock():
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(account_name, None)
+            self.misses += 1
+            return None
+
+    def put(self, account_name: str, credentials: Tuple[str, str]) -> None:
+        with self._lock:
+            self._check_fingerprint()
+            self._entries[account_name] = (self._clock() + self.ttl_seconds, credentials)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
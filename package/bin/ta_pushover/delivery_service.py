@@ -0,0 +1,347 @@
+"""Resident delivery service behind the Unix socket of :mod:`.handoff`.
+
+Runs inside the ``pushover_delivery.py`` scripted input for as long as
+``max_lifetime_seconds``, then exits so splunkd starts a fresh one with a new
+session key and picks up rotated credentials. While it runs, one
+:class:`PushoverClient` keeps its connections warm across every alert that
+hands messages over, paces each app token against the host-wide
+:class:`~.quota_ledger.QuotaLedger` the alerts share, and looks each account
+up once per :class:`~.credential_cache.CredentialCache` TTL.
+
+Accepted batches wait in a bounded in-memory queue for the worker threads; a
+full queue is answered with an error so the alert sends directly instead. On
+shutdown the socket is removed first, so new alerts stop handing over, and
+the queue is drained before the process exits. The outbox, receipt and
+suppression options of the alert are applied here, per handed-over batch.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+from types import TracebackType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from .credential_cache import CredentialCache
+from .handoff import MAX_REQUEST_BYTES, default_socket_path, service_running
+from .outbox import SECRET_FIELDS, Outbox, OutboxDeferral
+from .pushover_common import PushoverClient
+from .quota_ledger import QuotaLedger
+from .rate_limit import RateScheduler
+from .receipts import ReceiptRecorder, ReceiptStore
+from .suppression import (
+    DEFAULT_SUPPRESS_FIELDS,
+    SUPPRESSED_RESPONSE,
+    SuppressionStore,
+    SuppressionWindow,
+    parse_suppress_fields,
+)
+
+DEFAULT_SERVICE_WORKERS = 4
+DEFAULT_MAX_QUEUED = 10000
+DEFAULT_MAX_LIFETIME_SECONDS = 3600.0
+# The client's per-kind log line budget starts over this often.
+DEFAULT_LOG_WINDOW_SECONDS = 600.0
+
+
+def shared_rate_scheduler(app_token: str) -> RateScheduler:
+    """Scheduler of one app token, sharing the host's ledger like the alerts do."""
+    return RateScheduler(ledger=QuotaLedger.for_app(app_token))
+
+
+class HandoffJob(NamedTuple):
+    account: str
+    payloads: List[Dict[str, Any]]
+    outbox: bool
+    track_receipts: bool
+    suppress_window: Optional[float] = None
+    suppress_fields: Tuple[str, ...] = DEFAULT_SUPPRESS_FIELDS
+
+
+def parse_job(request: Any) -> HandoffJob:
+    """Validate one decoded request line of the hand-over protocol."""
+    if not isinstance(request, dict):
+        raise ValueError("request needs to be an object")
+    account = request.get("account")
+    if not isinstance(account, str) or not account:
+        raise ValueError("account is required")
+    payloads = request.get("payloads")
+    if not isinstance(payloads, list) or not all(isinstance(item, dict) for item in payloads):
+        raise ValueError("payloads needs to be a list of objects")
+    suppress_window = request.get("suppress_window")
+    if suppress_window is not None and (
+        isinstance(suppress_window, bool)
+        or not isinstance(suppress_window, (int, float))
+        or suppress_window <= 0
+    ):
+        raise ValueError("suppress_window needs to be a positive number")
+    suppress_fields = request.get("suppress_fields") or []
+    if not isinstance(suppress_fields, list) or not all(
+        isinstance(field, str) for field in suppress_fields
+    ):
+        raise ValueError("suppress_fields needs to be a list of strings")
+    return HandoffJob(
+        account,
+        [
+            {key: value for key, value in payload.items() if key not in SECRET_FIELDS}
+            for payload in payloads
+        ],
+        request.get("outbox") is True,
+        request.get("track_receipts") is True,
+        None if suppress_window is None else float(suppress_window),
+        parse_suppress_fields(",".join(suppress_fields)),
+    )
+
+
+class _HandoffHandler(socketserver.StreamRequestHandler):
+    server: "_HandoffServer"
+
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_BYTES + 1)
+            if not line:
+                return
+            if len(line) > MAX_REQUEST_BYTES:
+                self._reply({"error": f"request is over {MAX_REQUEST_BYTES} bytes"})
+                return
+            try:
+                job = parse_job(json.loads(line))
+            except ValueError as request_error:
+                reply: Dict[str, Any] = {"error": f"invalid request: {request_error}"}
+            else:
+                if self.server.service.submit(job):
+                    reply = {"accepted": len(job.payloads)}
+                else:
+                    reply = {"error": "delivery queue is full or shutting down"}
+            self._reply(reply)
+
+    def _reply(self, reply: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class _HandoffServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: "DeliveryService") -> None:
+        self.service = service
+        super().__init__(socket_path, _HandoffHandler)
+
+
+class DeliveryService:
+    """Accepts hand-overs on ``socket_path`` and sends them with ``client``.
+
+    ``resolve_account`` maps an account name to its ``(user, app_token)``,
+    as for outbox replay. Use as a context manager, or call :meth:`start`
+    and :meth:`stop`.
+    """
+
+    def __init__(
+        self,
+        client: PushoverClient,
+        resolve_account: Callable[[str], Tuple[str, str]],
+        socket_path: Optional[str] = None,
+        workers: int = DEFAULT_SERVICE_WORKERS,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers needs to be at least 1")
+        self.client = client
+        self.resolve_account = resolve_account
+        self.socket_path = socket_path or default_socket_path()
+        self.workers = workers
+        self.max_queued = max_queued
+        self.logger = logger or client.logger
+        self.accepted = 0
+        self.sent = 0
+        self.failed = 0
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[HandoffJob]]" = queue.Queue()
+        self._queued = 0
+        self._stopping = False
+        self._credentials = CredentialCache.for_app() or CredentialCache()
+        self._outbox: Optional[Outbox] = None
+        self._receipts: Optional[ReceiptStore] = None
+        self._suppression: Optional[SuppressionStore] = None
+        self._threads: List[threading.Thread] = []
+        self._server: Optional[_HandoffServer] = None
+
+    def start(self) -> None:
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        # A socket left behind by a service that did not shut down cleanly is removed.
+        if service_running(self.socket_path):
+            raise ValueError(f"A delivery service is already listening on {self.socket_path}")
+        # Only the Splunk user may hand messages over.
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = _HandoffServer(self.socket_path, self)
+        finally:
+            os.umask(previous_umask)
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"pushover-delivery-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        server_thread = threading.Thread(
+            target=self._server.serve_forever, name="pushover-handoff", daemon=True
+        )
+        server_thread.start()
+        self._threads.append(server_thread)
+
+    def start_log_window(self) -> None:
+        """Start a fresh log line budget for the client, noting what the last window left out."""
+        suppressed = self.client.log_sampler.reset()
+        if suppressed:
+            self.logger.info(
+                "Left out Pushover log lines over the limit of %s per kind (%s).",
+                self.client.log_sampler.limit,
+                ", ".join(f"{kind}: {count}" for kind, count in suppressed.items()),
+            )
+
+    def stop(self) -> None:
+        """Stop taking hand-overs, then send everything already queued."""
+        with self._lock:
+            self._stopping = True
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        with self._lock:
+            if self._outbox is not None:
+                self._outbox.close()
+                self._outbox = None
+            if self._receipts is not None:
+                self._receipts.close()
+                self._receipts = None
+            if self._suppression is not None:
+                self._suppression.close()
+                self._suppression = None
+
+    def __enter__(self) -> "DeliveryService":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def submit(self, job: HandoffJob) -> bool:
+        """Queue ``job`` unless that would go over ``max_queued`` messages."""
+        with self._lock:
+            if self._stopping or self._queued + len(job.payloads) > self.max_queued:
+                return False
+            self._queued += len(job.payloads)
+            self.accepted += len(job.payloads)
+        self._queue.put(job)
+        return True
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._queued -= len(job.payloads)
+
+    def _stores(self, job: HandoffJob) -> Tuple[Optional[Outbox], Optional[ReceiptStore]]:
+        with self._lock:
+            if job.outbox and self._outbox is None:
+                self._outbox = Outbox(logger=self.logger)
+            if job.track_receipts and self._receipts is None:
+                self._receipts = ReceiptStore(logger=self.logger)
+            return (
+                self._outbox if job.outbox else None,
+                self._receipts if job.track_receipts else None,
+            )
+
+    def _suppression_store(self) -> SuppressionStore:
+        with self._lock:
+            if self._suppression is None:
+                self._suppression = SuppressionStore()
+            return self._suppression
+
+    def _send_function(self, job: HandoffJob) -> Callable[..., Dict[str, Any]]:
+        credentials = self._credentials.get(job.account)
+        if credentials is None:
+            credentials = self.resolve_account(job.account)
+            self._credentials.put(job.account, credentials)
+        user, app_token = credentials
+
+        def _send(**payload: Any) -> Dict[str, Any]:
+            return self.client.send(token=app_token, user=user, **payload)
+
+        outbox, receipts = self._stores(job)
+        send = _send
+        if receipts is not None:
+            send = ReceiptRecorder(receipts, job.account).wrap(send)
+        if outbox is not None:
+            send = OutboxDeferral(
+                outbox, job.account, self.logger, track_receipts=job.track_receipts
+            ).wrap(send)
+        if job.suppress_window is not None:
+            send = SuppressionWindow(
+                self._suppression_store(), job.account, job.suppress_window, job.suppress_fields
+            ).wrap(send)
+        return send
+
+    def _run(self, job: HandoffJob) -> None:
+        try:
+            send = self._send_function(job)
+        except (OSError, ValueError) as account_error:
+            self.logger.error(
+                "Dropping %s handed-over Pushover message(s) for account '%s': %s",
+                len(job.payloads),
+                job.account,
+                account_error,
+            )
+            with self._lock:
+                self.failed += len(job.payloads)
+            return
+        for payload in job.payloads:
+            try:
+                response = send(**payload)
+            # A worker has to outlive any one message, whatever went wrong with it.
+            except Exception as send_error:
+                # Never sampled: the service outlives any line budget.
+                self.logger.error(
+                    "Pushover delivery for account '%s' failed: %s", job.account, send_error
+                )
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    if response is SUPPRESSED_RESPONSE:
+                        self.suppressed += 1
+                    else:
+                        self.sent += 1
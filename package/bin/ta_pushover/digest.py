@@ -0,0 +1,99 @@
+"""Pack many rendered events into as few Pushover messages as possible."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .message import LENGTH_LIMITS
+
+DEFAULT_SEPARATOR = "\n"
+
+
+def parse_separator(value: Optional[str]) -> str:
+    """Turn a configured separator into text, expanding ``\\n`` and ``\\t``.
+
+    Alert parameters are single line strings, so newlines have to be written
+    as escapes in the alert configuration.
+    """
+    if value is None or value == "":
+        return DEFAULT_SEPARATOR
+    return value.replace("\\n", "\n").replace("\\t", "\t")
+
+
+class DigestPacker:
+    """Greedy packer folding consecutive events into digest messages.
+
+    Lines are kept in result order and appended to the current message while it
+    stays within the message length limit; a line that would overflow starts
+    the next message. Lines that are too long on their own are truncated.
+
+    With ``max_messages`` set, whatever does not fit into the last allowed
+    message is summarised by a ``+K more`` footer instead of being sent.
+    Title, URL, sound and similar fields come from the first event of each
+    digest (so they already respect their own limits), and the priority is the
+    highest of the events it contains or summarises.
+    """
+
+    def __init__(
+        self,
+        separator: str = DEFAULT_SEPARATOR,
+        max_messages: Optional[int] = None,
+        max_length: int = LENGTH_LIMITS["message"],
+    ) -> None:
+        if max_messages is not None and max_messages < 1:
+            raise ValueError("max_messages needs to be at least 1")
+        self.separator = separator
+        self.max_messages = max_messages
+        self.max_length = max_length
+
+    def _footer(self, more: int) -> str:
+        return f"{self.separator}+{more} more"
+
+    def _build(
+        self, first: Dict[str, Any], lines: List[str], priority: int, more: int
+    ) -> Dict[str, Any]:
+        if more:
+            footer = self._footer(more)
+            while lines and len(self.separator.join(lines)) + len(footer) > self.max_length:
+                lines.pop()
+                more += 1
+                footer = self._footer(more)
+            if not lines:
+                return dict(first, message=f"+{more} more", priority=priority)
+            return dict(
+                first, message=self.separator.join(lines) + footer, priority=priority
+            )
+        return dict(first, message=self.separator.join(lines), priority=priority)
+
+    def pack(self, payloads: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        first: Optional[Dict[str, Any]] = None
+        lines: List[str] = []
+        length = 0
+        priority = -2
+        emitted = 0
+        more = 0
+
+        for payload in payloads:
+            line = str(payload["message"])[: self.max_length]
+            if first is not None:
+                line_priority = int(payload.get("priority") or 0)
+                fits = length + len(self.separator) + len(line) <= self.max_length
+                if fits and not more:
+                    lines.append(line)
+                    length += len(self.separator) + len(line)
+                    priority = max(priority, line_priority)
+                    continue
+                if self.max_messages is not None and emitted + 1 >= self.max_messages:
+                    # Summarised events still raise the digest's priority.
+                    more += 1
+                    priority = max(priority, line_priority)
+                    continue
+                yield self._build(first, lines, priority, 0)
+                emitted += 1
+            first = payload
+            lines = [line]
+            length = len(line)
+            priority = int(payload.get("priority") or 0)
+
+        if first is not None:
+            yield self._build(first, lines, priority, more)
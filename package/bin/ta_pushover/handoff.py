@@ -0,0 +1,137 @@
+"""Hand an alert run's messages to the resident delivery service.
+
+Every alert firing is a fresh interpreter that has to look up its account and
+open a TLS connection before the first send. When the ``pushover_delivery.py``
+input is enabled, one long-lived process (see :mod:`.delivery_service`) keeps
+warm connections and the credentials of every account it has seen, and
+listens on a Unix socket in the app's state directory. The alert action then
+only writes its rendered payloads to that socket and returns once they are
+queued.
+
+Like the outbox, handed-over payloads carry only the account *name*; the
+service looks up the token and user key itself. The protocol is one JSON
+object per line: the alert writes ``{"account", "outbox", "track_receipts",
+"payloads"}``, plus ``"suppress_window"`` and ``"suppress_fields"`` when
+repeats are suppressed, and the service answers ``{"accepted": n}`` or
+``{"error": "..."}``. Payloads only count as handed over once their batch is
+accepted, so a connection lost mid-run at worst sends a batch twice.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from .pushover_common import APP_NAME, splunk_state_dir
+
+DEFAULT_HANDOFF_BATCH = 500
+HANDOFF_TIMEOUT_SECONDS = 5.0
+PROBE_TIMEOUT_SECONDS = 0.5
+# Upper bound of one request line, enforced by the service.
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+
+def default_socket_path() -> str:
+    state_dir = splunk_state_dir() or os.path.join(tempfile.gettempdir(), APP_NAME)
+    return os.path.join(state_dir, "delivery.sock")
+
+
+def service_running(socket_path: Optional[str] = None) -> bool:
+    """Whether a delivery service answers on its socket.
+
+    A socket nothing listens on was left behind by a service that did not
+    shut down cleanly; it is removed so later alerts skip the probe.
+    """
+    path = socket_path or default_socket_path()
+    if not os.path.exists(path):
+        return False
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        probe.settimeout(PROBE_TIMEOUT_SECONDS)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return False
+        except OSError:
+            return False
+    return True
+
+
+class HandoffResult(NamedTuple):
+    accepted: int
+    # Payloads the service did not take, to be sent directly; None if it took all.
+    remaining: Optional[Iterator[Dict[str, Any]]]
+
+
+def hand_off(
+    payloads: Iterable[Dict[str, Any]],
+    account: str,
+    *,
+    outbox: bool = False,
+    track_receipts: bool = False,
+    suppress_window: Optional[float] = None,
+    suppress_fields: Sequence[str] = (),
+    socket_path: Optional[str] = None,
+    batch_size: int = DEFAULT_HANDOFF_BATCH,
+    timeout_seconds: float = HANDOFF_TIMEOUT_SECONDS,
+    logger: Optional[logging.Logger] = None,
+) -> HandoffResult:
+    """Queue ``payloads`` with the delivery service, batch by batch.
+
+    ``payloads`` must not contain the token or user key. Errors raised while
+    producing them propagate; a missing, full or failing service only ends the
+    hand-over, and whatever it did not accept comes back in ``remaining``.
+    """
+    import socket
+
+    logger = logger or logging.getLogger(__name__)
+    iterator = iter(payloads)
+    path = socket_path or default_socket_path()
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout_seconds)
+    try:
+        connection.connect(path)
+    except OSError as connect_error:
+        connection.close()
+        logger.warning("Pushover delivery service unavailable, sending directly: %s", connect_error)
+        return HandoffResult(0, iterator)
+
+    accepted = 0
+    with connection, connection.makefile("rb") as replies:
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return HandoffResult(accepted, None)
+            request: Dict[str, Any] = {
+                "account": account,
+                "outbox": outbox,
+                "track_receipts": track_receipts,
+                "payloads": batch,
+            }
+            if suppress_window is not None:
+                request["suppress_window"] = suppress_window
+                request["suppress_fields"] = list(suppress_fields)
+            try:
+                connection.sendall(json.dumps(request, separators=(",", ":")).encode() + b"\n")
+                reply = json.loads(replies.readline() or b"{}")
+                if not isinstance(reply, dict) or "accepted" not in reply:
+                    error = reply.get("error") if isinstance(reply, dict) else None
+                    raise ValueError(error or "no answer")
+            except (OSError, ValueError) as handoff_error:
+                logger.warning(
+                    "Pushover delivery service stopped taking messages after %s, "
+                    "sending the rest directly: %s",
+                    accepted,
+                    handoff_error,
+                )
+                return HandoffResult(accepted, itertools.chain(batch, iterator))
+            accepted += int(reply["accepted"])
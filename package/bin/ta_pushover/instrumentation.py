@@ -0,0 +1,111 @@
+"""Opt-in timing of the delivery path.
+
+With the alert's ``instrumentation`` option enabled, both delivery engines
+record where the time of every send went (result rendering, payload build,
+quota pacing, connection setup, network and server time, client overhead),
+how large the payloads were and which errors occurred. :meth:`DeliveryMetrics.summary`
+turns that into a single ``key=value`` line for the alert log, which Splunk
+extracts automatically so delivery performance can be charted straight from
+``_internal``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Upper bounds of the per-message latency histogram, in milliseconds.
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class DeliveryMetrics:
+    """Thread-safe phase timings, latency histogram and error counts of one run."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.phase_seconds: Dict[str, float] = {}
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.sent = 0
+        self.failed = 0
+        self.attempts = 0
+        self.new_connections = 0
+        self.payload_bytes_total = 0
+        self.payload_bytes_max = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+        self.errors: Counter[str] = Counter()
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+
+    def record_attempt(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.attempts += 1
+            if error is not None:
+                self.errors[type(error).__name__] += 1
+
+    def record_connection(self, count: int = 1) -> None:
+        with self._lock:
+            self.new_connections += count
+
+    def record_send(self, seconds: float, payload_bytes: int, succeeded: bool) -> None:
+        """One message, from the start of :meth:`send` until it succeeded or gave up."""
+        milliseconds = seconds * 1000
+        bucket = len(LATENCY_BUCKETS_MS)
+        for index, upper_bound in enumerate(LATENCY_BUCKETS_MS):
+            if milliseconds <= upper_bound:
+                bucket = index
+                break
+        with self._lock:
+            self.buckets[bucket] += 1
+            if succeeded:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self.payload_bytes_total += payload_bytes
+            self.payload_bytes_max = max(self.payload_bytes_max, payload_bytes)
+            self.latency_seconds_total += seconds
+            self.latency_seconds_max = max(self.latency_seconds_max, seconds)
+
+    def timed(self, items: Iterable[Any], phase: str) -> Iterator[Any]:
+        """Yield ``items``, adding the time spent producing each one to ``phase``."""
+        iterator = iter(items)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_phase(phase, time.perf_counter() - started)
+            yield item
+
+    def summary(self, **fields: Any) -> str:
+        """``key=value`` summary; ``fields`` (e.g. the engine) are prepended as-is."""
+        with self._lock:
+            messages = self.sent + self.failed
+            values: Dict[str, Any] = dict(fields)
+            values.update(
+                sent=self.sent,
+                failed=self.failed,
+                attempts=self.attempts,
+                new_connections=self.new_connections,
+                payload_bytes_total=self.payload_bytes_total,
+                payload_bytes_max=self.payload_bytes_max,
+                latency_ms_mean=round(
+                    self.latency_seconds_total * 1000 / messages if messages else 0.0, 1
+                ),
+                latency_ms_max=round(self.latency_seconds_max * 1000, 1),
+            )
+            for upper_bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+                values[f"latency_ms_le_{upper_bound}"] = count
+            values[f"latency_ms_gt_{LATENCY_BUCKETS_MS[-1]}"] = self.buckets[-1]
+            for phase, seconds in sorted(self.phase_seconds.items()):
+                values[f"phase_{phase}_ms"] = round(seconds * 1000, 1)
+            errors = ",".join(f"{name}:{count}" for name, count in sorted(self.errors.items()))
+
+        line = " ".join(f"{key}={value}" for key, value in values.items())
+        return f'{line} errors="{errors}"'
@@ -0,0 +1,68 @@
+"""Keep per-event log lines from flooding the alert log.
+
+An alert run over thousands of results would otherwise write the same kind
+of line (HTTP status, retry notice, payload dump) thousands of times.
+:class:`LogSampler` lets the first ``limit`` lines of each kind through and
+only counts the rest, so the run can end with a single line saying what was
+left out.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+DEFAULT_PER_EVENT_LOG_LIMIT = 100
+
+
+class LogSampler:
+    """Thread-safe per-kind line budget; ``limit=None`` lets everything through."""
+
+    def __init__(self, limit: Optional[int] = DEFAULT_PER_EVENT_LOG_LIMIT) -> None:
+        if limit is not None and limit < 0:
+            raise ValueError("limit needs to be 0 or more")
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._seen: Counter[str] = Counter()
+
+    def allow(self, kind: str) -> bool:
+        with self._lock:
+            self._seen[kind] += 1
+            return self.limit is None or self._seen[kind] <= self.limit
+
+    def should_log(self, logger: logging.Logger, level: int, kind: str) -> bool:
+        """Whether to write a ``kind`` line; disabled levels cost nothing and are not counted.
+
+        Check this before building expensive log arguments.
+        """
+        return logger.isEnabledFor(level) and self.allow(kind)
+
+    def log(
+        self, logger: logging.Logger, level: int, kind: str, message: str, *args: Any
+    ) -> None:
+        if self.should_log(logger, level, kind):
+            logger.log(level, message, *args, stacklevel=2)
+
+    @property
+    def suppressed(self) -> Dict[str, int]:
+        """Lines left out so far, by kind."""
+        with self._lock:
+            return self._suppressed()
+
+    def _suppressed(self) -> Dict[str, int]:
+        if self.limit is None:
+            return {}
+        return {
+            kind: seen - self.limit
+            for kind, seen in sorted(self._seen.items())
+            if seen > self.limit
+        }
+
+    def reset(self) -> Dict[str, int]:
+        """Give every kind a fresh budget; returns what the previous one left out."""
+        with self._lock:
+            suppressed = self._suppressed()
+            self._seen.clear()
+            return suppressed
@@ -0,0 +1,134 @@
+"""Compact Pushover message with a mostly pre-encoded JSON body.
+
+Every message an alert run sends repeats the same application token and
+user key. :class:`Message` keeps its fields in slots rather than a
+per-message dict, checks a field's length once when it is set, and encodes
+its request body as the cached ``{"token": ..., "user": ...`` prefix of the
+account followed by only the fields that vary per event. The body is kept
+until a field changes, so retries and size metrics reuse it.
+"""
+
+from __future__ import annotations
+
+import functools
+from collections.abc import MutableMapping
+from json.encoder import encode_basestring_ascii
+from typing import Iterator, Optional
+
+LENGTH_LIMITS = {
+    "title": 250,
+    "message": 1024,
+    "url": 512,
+    "url_title": 100,
+}
+# Set on a payload once its attachment is checked, not sent as form fields.
+ATTACHMENT_FILENAME = "_attachment_filename"
+ATTACHMENT_CONTENT_TYPE = "_attachment_content_type"
+
+# Fields encoded per message, in the order they appear in the body.
+VARIABLE_FIELDS = (
+    "message",
+    "priority",
+    "sound",
+    "device",
+    "timestamp",
+    "title",
+    "url",
+    "url_title",
+    "retry",
+    "expire",
+    "tags",
+    "html",
+    "monospace",
+)
+# Only sent as part of a multipart body, never in the JSON one.
+ATTACHMENT_FIELDS = ("attachment", ATTACHMENT_FILENAME, ATTACHMENT_CONTENT_TYPE)
+FIELDS = ("token", "user") + VARIABLE_FIELDS + ATTACHMENT_FIELDS
+_FIELD_NAMES = frozenset(FIELDS)
+_KEY_PREFIXES = {name: f",{encode_basestring_ascii(name)}:" for name in VARIABLE_FIELDS}
+
+
+@functools.lru_cache(maxsize=64)
+def encoded_constants(token: str, user: str) -> bytes:
+    """The opening of every JSON body sent with ``token`` to ``user``."""
+    return (
+        f'{{"token":{encode_basestring_ascii(token)},"user":{encode_basestring_ascii(user)}'
+    ).encode("ascii")
+
+
+class Message(MutableMapping[str, str]):
+    """The fields of one Pushover message; unset optional fields are left out.
+
+    Behaves like the ``dict`` payload it replaces. Setting ``title``,
+    ``message``, ``url`` or ``url_title`` past Pushover's limit raises
+    :class:`ValueError` straight away.
+    """
+
+    __slots__ = FIELDS + ("_body",)
+
+    def __init__(self, token: str, user: str, message: str, priority: str = "0") -> None:
+        self._body: Optional[bytes] = None
+        self.token = token
+        self.user = user
+        self["message"] = message
+        self.priority = priority
+
+    def __getitem__(self, key: str) -> str:
+        if key not in _FIELD_NAMES:
+            raise KeyError(key)
+        try:
+            value: str = getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+        return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        if key not in _FIELD_NAMES:
+            raise KeyError(f"Pushover messages have no {key} field")
+        max_length = LENGTH_LIMITS.get(key)
+        if max_length is not None:
+            length = len(value)
+            if length > max_length:
+                raise ValueError(f"Length of {key} is too long {length} > {max_length}")
+        setattr(self, key, value)
+        self._body = None
+
+    def __delitem__(self, key: str) -> None:
+        if key not in _FIELD_NAMES or not hasattr(self, key):
+            raise KeyError(key)
+        delattr(self, key)
+        self._body = None
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in FIELDS if hasattr(self, name))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Message({dict(self)!r})"
+
+    def replace(self, **fields: str) -> "Message":
+        """Copy of this message with ``fields`` set, e.g. another recipient batch."""
+        copy = Message.__new__(Message)
+        copy._body = None
+        for name in self:
+            setattr(copy, name, getattr(self, name))
+        for name, value in fields.items():
+            copy[name] = value
+        return copy
+
+    def encode(self) -> bytes:
+        """The JSON request body; attachment fields are left out."""
+        if self._body is None:
+            parts = []
+            for name in VARIABLE_FIELDS:
+                value = getattr(self, name, None)
+                if value is not None:
+                    parts.append(_KEY_PREFIXES[name])
+                    parts.append(encode_basestring_ascii(value))
+            parts.append("}")
+            self._body = encoded_constants(self.token, self.user) + "".join(parts).encode(
+                "ascii"
+            )
+        return self._body
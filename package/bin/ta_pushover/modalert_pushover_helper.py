@@ -1,23 +1,86 @@
-"""Helpers for the TA-pushover modular alert action."""
+"""Helpers for the TA-pushover modular alert action.
+
+Every alert firing is a fresh interpreter, so the modules only some runs need
+(requests, asyncio, sqlite3, thread pools, results file decoding) are imported
+where they are used rather than up front.
+"""
 
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, Iterator, Mapping, Optional
+import time
+from typing import (
+    TYPE_CHECKING,
+    AbstractSet,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
+from .digest import DigestPacker, parse_separator
+from .instrumentation import DeliveryMetrics
+from .log_sampling import DEFAULT_PER_EVENT_LOG_LIMIT, LogSampler
+from .message import LENGTH_LIMITS
 from .pushover_common import (
+    DEFAULT_POOL_SIZE,
+    PUSHOVER_API_URL,
     PushoverClient,
-    event_value_or_literal,
+    environment_proxy,
     extract_account_credentials,
     parse_bool,
-    parse_priority,
+    parse_optional_int,
+    parse_recipients,
+    parse_tags,
 )
+from .rate_limit import QuotaSkips, RateScheduler
+from .resolution import CompiledField, ResolutionPlan
+from .retry import RetryStats
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from .outbox import OutboxDeferral
+    from .receipts import ReceiptRecorder
+    from .send_queue import PrioritySendQueue
+    from .suppression import SuppressionWindow
 
 Pushover = PushoverClient
 
+MAX_DELIVERY_WORKERS = 32
+MAX_ASYNC_DELIVERY_WORKERS = 256
+DELIVERY_ENGINES = ("sync", "async")
+
+
+def _stream_results_file(
+    helper: Any, results_file: str, fields: Optional[AbstractSet[str]]
+) -> Iterator[Dict[str, str]]:
+    from .results import iter_results_file, prefetch
+
+    # Mirrors ModularAlertBase.pre_handle so per-result logging context still works.
+    update = getattr(helper, "update", None)
+    for row_number, row in enumerate(prefetch(iter_results_file(results_file, fields))):
+        row.setdefault("rid", str(row_number))
+        if callable(update):
+            update(row)
+        yield row
+
 
-def _iter_events(helper: Any) -> Iterator[Dict[str, str]]:
-    events = helper.get_events()
+def _iter_events(
+    helper: Any, fields: Optional[AbstractSet[str]] = None
+) -> Iterator[Dict[str, str]]:
+    results_file = getattr(helper, "results_file", None)
+    if isinstance(results_file, str) and results_file:
+        events: Optional[Iterable[Dict[str, str]]] = _stream_results_file(
+            helper, results_file, fields
+        )
+    else:
+        events = helper.get_events()
     if events is None:
         yield {}
         return
@@ -32,6 +95,8 @@ def _iter_events(helper: Any) -> Iterator[Dict[str, str]]:
 
 
 def _resolve_account(helper: Any, account_name: str) -> tuple[str, str]:
+    # Every alert run is a new process, so there is nothing to cache here; the
+    # delivery service keeps credentials warm for the alerts it serves.
     account_data = helper.get_user_credential_by_account_id(account_name)
     if account_data is None:
         raise ValueError(f"Account '{account_name}' was not found")
@@ -40,16 +105,419 @@ def _resolve_account(helper: Any, account_name: str) -> tuple[str, str]:
     return extract_account_credentials(account_data)
 
 
-def _to_optional_int(value: Optional[str]) -> Optional[int]:
-    if value is None or value == "":
+def _build_client(
+    helper: Any,
+    logger: logging.Logger,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    rate_scheduler: Optional[RateScheduler] = None,
+    retry_stats: Optional[RetryStats] = None,
+    metrics: Optional[DeliveryMetrics] = None,
+    log_sampler: Optional[LogSampler] = None,
+) -> PushoverClient:
+    # The alert worker owns a pooled session for the life of the process;
+    # share it when available so every event reuses the same connection.
+    get_http_session = getattr(helper, "get_http_session", None)
+    if callable(get_http_session):
+        return PushoverClient(
+            logger=logger,
+            session=get_http_session(pool_size),
+            rate_scheduler=rate_scheduler,
+            retry_stats=retry_stats,
+            metrics=metrics,
+            log_sampler=log_sampler,
+        )
+    return PushoverClient(
+        logger=logger,
+        pool_size=pool_size,
+        rate_scheduler=rate_scheduler,
+        retry_stats=retry_stats,
+        metrics=metrics,
+        log_sampler=log_sampler,
+    )
+
+
+def _parse_delivery_engine(value: Optional[str]) -> str:
+    engine = (value or "sync").strip().lower()
+    if engine not in DELIVERY_ENGINES:
+        raise ValueError(
+            f"delivery_engine needs to be one of {', '.join(DELIVERY_ENGINES)}"
+        )
+    return engine
+
+
+def _parse_delivery_workers(
+    value: Optional[str], maximum: int = MAX_DELIVERY_WORKERS
+) -> int:
+    workers = parse_optional_int(value)
+    if workers is None:
+        return 1
+    if workers < 1 or workers > maximum:
+        raise ValueError(f"delivery_workers needs to be between 1 and {maximum}")
+    return workers
+
+
+def _parse_quota_burst(value: Optional[str]) -> Optional[int]:
+    burst = parse_optional_int(value)
+    if burst is None or burst == 0:
+        return None
+    if burst < 0:
+        raise ValueError("quota_burst needs to be 0 (disabled) or a positive number")
+    return burst
+
+
+def _parse_per_event_log_limit(value: Optional[str]) -> Optional[int]:
+    limit = parse_optional_int(value)
+    if limit is None:
+        return DEFAULT_PER_EVENT_LOG_LIMIT
+    if limit == 0:
+        return None
+    if limit < 0:
+        raise ValueError("per_event_log_limit needs to be 0 (unlimited) or a positive number")
+    return limit
+
+
+def _parse_suppress_window(value: Optional[str]) -> Optional[int]:
+    window = parse_optional_int(value)
+    if window is None or window == 0:
         return None
-    return int(value)
+    if window < 0:
+        raise ValueError("suppress_window needs to be 0 (disabled) or a number of seconds")
+    return window
+
+
+def _parse_delivery_deadline(value: Optional[str]) -> Optional[int]:
+    deadline = parse_optional_int(value)
+    if deadline is None or deadline == 0:
+        return None
+    if deadline < 0:
+        raise ValueError("delivery_deadline needs to be 0 (none) or a number of seconds")
+    return deadline
+
+
+def _log_shed(helper: Any, send_queue: Optional[PrioritySendQueue]) -> None:
+    if send_queue is None or not send_queue.shed:
+        return
+    helper.log_info(
+        f"Shed {sum(send_queue.shed.values())} low-priority Pushover message(s) to stay "
+        f"within the {' and '.join(send_queue.shed_reasons)} (priority "
+        + ", ".join(f"{priority}: {count}" for priority, count in sorted(send_queue.shed.items()))
+        + "), "
+        + ("deferred to the outbox." if send_queue.outbox is not None else "dropped.")
+    )
+
+
+def _log_suppressed(helper: Any, suppression: Optional[SuppressionWindow]) -> None:
+    if suppression is None or not suppression.suppressed:
+        return
+    helper.log_info(
+        f"Suppressed {suppression.suppressed} Pushover message(s) already sent within "
+        f"the last {suppression.window_seconds}s."
+    )
+
+
+def _log_quota(helper: Any, rate_scheduler: RateScheduler) -> None:
+    budget = rate_scheduler.budget
+    if budget is None:
+        return
+    host_sends = ""
+    if rate_scheduler.ledger is not None:
+        host_sends = (
+            f" {rate_scheduler.recent_sends()} sent from this host in the last "
+            f"{rate_scheduler.ledger.window_seconds:.0f}s."
+        )
+    helper.log_info(
+        f"Pushover quota: {budget.remaining} of {budget.limit} message(s) remaining, "
+        f"resets at {budget.reset_at}.{host_sends}"
+    )
+
+
+def _coalesce_payloads(
+    payloads: Iterable[Dict[str, Any]], logger: logging.Logger
+) -> Iterator[Dict[str, Any]]:
+    """Send each distinct rendered payload once, noting how often it occurred.
+
+    Every row has to be rendered before the first send so the counts are final;
+    only the distinct payloads are held in memory.
+    """
+    first_seen: Dict[Tuple[Tuple[str, Any], ...], Dict[str, Any]] = {}
+    occurrences: Dict[Tuple[Tuple[str, Any], ...], int] = {}
+    event_count = 0
+    for payload in payloads:
+        event_count += 1
+        fingerprint = tuple(sorted(payload.items()))
+        first_seen.setdefault(fingerprint, payload)
+        occurrences[fingerprint] = occurrences.get(fingerprint, 0) + 1
+
+    if event_count != len(first_seen):
+        logger.info(
+            "Coalesced %s event(s) into %s Pushover message(s).",
+            event_count,
+            len(first_seen),
+        )
+
+    for fingerprint, payload in first_seen.items():
+        count = occurrences[fingerprint]
+        if count > 1:
+            suffix = f" (\u00d7{count})"
+            max_message = LENGTH_LIMITS["message"] - len(suffix)
+            payload = dict(payload, message=payload["message"][:max_message] + suffix)
+        yield payload
+
+
+def _send_sequential(
+    send: Callable[..., Dict[str, Any]], payloads: Iterable[Dict[str, Any]]
+) -> int:
+    sent_count = 0
+    for payload in payloads:
+        send(**payload)
+        sent_count += 1
+    return sent_count
+
+
+def _collect_results(
+    finished: Set["Future[Dict[str, Any]]"],
+) -> Tuple[int, Optional[BaseException], int]:
+    sent_count = 0
+    error_count = 0
+    first_error: Optional[BaseException] = None
+    for future in finished:
+        error = future.exception()
+        if error is None:
+            sent_count += 1
+            continue
+        error_count += 1
+        if first_error is None:
+            first_error = error
+    return sent_count, first_error, error_count
+
+
+def _send_concurrent(
+    send: Callable[..., Dict[str, Any]],
+    payloads: Iterable[Dict[str, Any]],
+    max_workers: int,
+    logger: logging.Logger,
+) -> int:
+    """Fan sends out over a thread pool with at most ``max_workers`` in flight.
+
+    The next event is only rendered once a slot frees up, and no new work is
+    admitted after a send has failed; in-flight sends are allowed to finish.
+    Every payload taken from ``payloads`` is submitted.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    sent_count = 0
+    error_count = 0
+    first_error: Optional[BaseException] = None
+    in_flight: Set["Future[Dict[str, Any]]"] = set()
+    iterator = iter(payloads)
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="pushover-send"
+    ) as executor:
+        while first_error is None:
+            if len(in_flight) >= max_workers:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                sent, error, errors = _collect_results(finished)
+                sent_count += sent
+                error_count += errors
+                first_error = first_error or error
+                continue
+            # Only taken once it can be submitted, so a failure never strands one.
+            payload = next(iterator, None)
+            if payload is None:
+                break
+            in_flight.add(executor.submit(send, **payload))
+
+        finished, _ = wait(in_flight)
+        sent, error, errors = _collect_results(finished)
+        sent_count += sent
+        error_count += errors
+        first_error = first_error or error
+
+    if first_error is not None:
+        logger.error(
+            "Pushover delivery failed for %s message(s) after %s were sent.",
+            error_count,
+            sent_count,
+        )
+        raise first_error
+    return sent_count
+
+
+async def _send_async(
+    payloads: Iterable[Dict[str, Any]],
+    concurrency: int,
+    logger: logging.Logger,
+    rate_scheduler: RateScheduler,
+    retry_stats: RetryStats,
+    deferral: Optional[OutboxDeferral],
+    metrics: Optional[DeliveryMetrics] = None,
+    log_sampler: Optional[LogSampler] = None,
+    recorder: Optional[ReceiptRecorder] = None,
+    suppression: Optional[SuppressionWindow] = None,
+    skips: Optional[QuotaSkips] = None,
+) -> int:
+    from .pushover_async import AsyncPushoverClient
+
+    async with AsyncPushoverClient(
+        logger=logger,
+        concurrency=concurrency,
+        rate_scheduler=rate_scheduler,
+        retry_stats=retry_stats,
+        metrics=metrics,
+        log_sampler=log_sampler,
+    ) as client:
+        send = client.send if recorder is None else recorder.wrap_async(client.send)
+        if deferral is not None:
+            send = deferral.wrap_async(send)
+        if suppression is not None:
+            send = suppression.wrap_async(send)
+        if skips is not None:
+            send = skips.wrap_async(send)
+        return await client.send_all(payloads, send)
+
+
+def _deliver(
+    helper: Any,
+    *,
+    payloads: Iterable[Dict[str, Any]],
+    delivery_engine: str,
+    delivery_workers: int,
+    logger: logging.Logger,
+    rate_scheduler: RateScheduler,
+    retry_stats: RetryStats,
+    deferral: Optional[OutboxDeferral],
+    metrics: Optional[DeliveryMetrics] = None,
+    log_sampler: Optional[LogSampler] = None,
+    recorder: Optional[ReceiptRecorder] = None,
+    suppression: Optional[SuppressionWindow] = None,
+    skips: Optional[QuotaSkips] = None,
+) -> int:
+    if delivery_engine == "async":
+        import asyncio
+
+        return asyncio.run(
+            _send_async(
+                payloads,
+                delivery_workers,
+                logger,
+                rate_scheduler,
+                retry_stats,
+                deferral,
+                metrics,
+                log_sampler,
+                recorder,
+                suppression,
+                skips,
+            )
+        )
+
+    with _build_client(
+        helper,
+        logger,
+        pool_size=max(DEFAULT_POOL_SIZE, delivery_workers),
+        rate_scheduler=rate_scheduler,
+        retry_stats=retry_stats,
+        metrics=metrics,
+        log_sampler=log_sampler,
+    ) as client:
+        send = client.send if recorder is None else recorder.wrap(client.send)
+        if deferral is not None:
+            send = deferral.wrap(send)
+        # Outside the deferral, so only sends that were neither made nor deferred are released.
+        if suppression is not None:
+            send = suppression.wrap(send)
+        if skips is not None:
+            send = skips.wrap(send)
+        if delivery_workers > 1:
+            return _send_concurrent(send, payloads, delivery_workers, logger)
+        return _send_sequential(send, payloads)
+
+
+def _render_payloads(
+    helper: Any,
+    plan: ResolutionPlan,
+    logger: logging.Logger,
+) -> Iterable[Dict[str, Any]]:
+    payloads: Iterable[Dict[str, Any]] = (
+        plan.render(event) for event in _iter_events(helper, plan.referenced_fields)
+    )
+    if parse_bool(helper.get_param("coalesce")):
+        payloads = _coalesce_payloads(payloads, logger)
+    if parse_bool(helper.get_param("digest")):
+        packer = DigestPacker(
+            separator=parse_separator(helper.get_param("digest_separator")),
+            max_messages=parse_optional_int(helper.get_param("digest_max_messages")) or None,
+        )
+        payloads = packer.pack(payloads)
+    return payloads
+
+
+def _hand_off(
+    helper: Any,
+    account: str,
+    logger: logging.Logger,
+    suppression: Optional[SuppressionWindow] = None,
+) -> Tuple[int, Optional[Iterator[Dict[str, Any]]]]:
+    """Queue the run's messages with the delivery service; returns what it did not take.
+
+    The payloads are rendered without the token and user key, the service
+    looks those up itself. It also applies the suppression window as it sends.
+    """
+    from .handoff import hand_off
+
+    result = hand_off(
+        _render_payloads(helper, ResolutionPlan(helper.get_param), logger),
+        account,
+        outbox=parse_bool(helper.get_param("outbox")),
+        track_receipts=parse_bool(helper.get_param("track_receipts")),
+        suppress_window=None if suppression is None else suppression.window_seconds,
+        suppress_fields=() if suppression is None else suppression.fields,
+        logger=logger,
+    )
+    return result.accepted, result.remaining
+
+
+def _cancel_emergencies(
+    helper: Any, account: str, app_token: str, logger: logging.Logger
+) -> int:
+    """Cancel the emergency messages carrying the alert's tags, resolved per result."""
+    from .receipts import ReceiptClient, ReceiptStore
+
+    tag_field = CompiledField(helper.get_param("tags"), parse_tags)
+    tags: Dict[str, None] = {}
+    for event in _iter_events(helper, tag_field.referenced_fields):
+        tags.update(dict.fromkeys(tag_field.resolve(event)))
+    if not tags:
+        raise ValueError("'tags' is required to cancel emergency messages")
+
+    get_http_session = getattr(helper, "get_http_session", None)
+    session = get_http_session(1) if callable(get_http_session) else None
+    cancelled = 0
+    with ReceiptClient(session=session, logger=logger) as client:
+        for tag in tags:
+            cancelled += client.cancel_by_tag(app_token, tag)
+
+    if parse_bool(helper.get_param("track_receipts")):
+        store = ReceiptStore(logger=logger)
+        try:
+            for tag in tags:
+                store.remove_tagged(account, tag)
+        finally:
+            store.close()
+
+    helper.log_info(
+        f"Cancelled {cancelled} emergency Pushover message(s) tagged "
+        f"{', '.join(tags)} using account '{account}'."
+    )
+    return cancelled
 
 
 def process_event(helper: Any, *args: Any, **kwargs: Any) -> int:
     del args, kwargs  # Unused by this implementation.
 
     helper.log_info("Alert action pushover process_event started.")
+    started = time.monotonic()
 
     account = helper.get_param("account")
     if not account:
@@ -59,46 +527,188 @@ def process_event(helper: Any, *args: Any, **kwargs: Any) -> int:
     if not message_template:
         raise ValueError("'message' is required")
 
-    user_key, app_token = _resolve_account(helper, account)
+    delivery_engine = _parse_delivery_engine(helper.get_param("delivery_engine"))
+    delivery_workers = _parse_delivery_workers(
+        helper.get_param("delivery_workers"),
+        MAX_ASYNC_DELIVERY_WORKERS if delivery_engine == "async" else MAX_DELIVERY_WORKERS,
+    )
+    if delivery_engine == "async" and environment_proxy(PUSHOVER_API_URL) is not None:
+        helper.log_info(
+            "The async delivery engine cannot send through the configured proxy, "
+            "using the sync engine."
+        )
+        delivery_engine = "sync"
+        delivery_workers = min(delivery_workers, MAX_DELIVERY_WORKERS)
+
+    quota_burst = _parse_quota_burst(helper.get_param("quota_burst"))
+    retry_stats = RetryStats()
+    log_sampler = LogSampler(
+        _parse_per_event_log_limit(helper.get_param("per_event_log_limit"))
+    )
+
     logger = getattr(helper, "_logger", logging.getLogger(__name__))
-    client = PushoverClient(logger=logger)
-
-    title_template = helper.get_param("title")
-    url_template = helper.get_param("url") or helper.get_param("additional_url")
-    url_title_template = helper.get_param("url_title")
-    priority_template = helper.get_param("priority")
-    sound_template = helper.get_param("sound")
-    html_template = helper.get_param("html")
-    monospace_template = helper.get_param("monospace")
-    timestamp_template = helper.get_param("timestamp")
-    device_template = helper.get_param("device")
+    cancel_emergency = parse_bool(helper.get_param("cancel_emergency"))
+    instrumentation = parse_bool(helper.get_param("instrumentation"))
+    suppress_window = _parse_suppress_window(helper.get_param("suppress_window"))
+    priority_order = parse_bool(helper.get_param("priority_order"))
+    delivery_deadline = _parse_delivery_deadline(helper.get_param("delivery_deadline"))
+    suppression: Optional[SuppressionWindow] = None
+    if suppress_window is not None and not cancel_emergency:
+        from .suppression import SuppressionStore, SuppressionWindow, parse_suppress_fields
 
-    sent_count = 0
-    for event in _iter_events(helper):
-        message = event_value_or_literal(message_template, event)
-        if message is None:
-            raise ValueError("Message resolved to an empty value")
-
-        priority = parse_priority(event_value_or_literal(priority_template, event), 0)
-        timestamp = _to_optional_int(event_value_or_literal(timestamp_template, event))
-
-        client.send(
-            token=app_token,
-            user=user_key,
-            message=message,
-            priority=priority,
-            html=parse_bool(event_value_or_literal(html_template, event)),
-            monospace=parse_bool(event_value_or_literal(monospace_template, event)),
-            device=event_value_or_literal(device_template, event),
-            sound=event_value_or_literal(sound_template, event),
-            timestamp=timestamp,
-            title=event_value_or_literal(title_template, event),
-            url=event_value_or_literal(url_template, event),
-            url_title=event_value_or_literal(url_title_template, event),
+        suppress_fields = parse_suppress_fields(helper.get_param("suppress_fields"))
+        suppression = SuppressionWindow(
+            SuppressionStore(), account, suppress_window, suppress_fields
         )
-        sent_count += 1
 
+    handed_off = 0
+    remaining: Optional[Iterator[Dict[str, Any]]] = None
+    # Cancelling and instrumented runs need the sends to happen in this process.
+    if not cancel_emergency and not instrumentation:
+        from .handoff import service_running
+
+        if service_running():
+            handed_off, remaining = _hand_off(helper, account, logger, suppression)
+            if remaining is None:
+                if suppression is not None:
+                    suppression.store.close()
+                _log_suppressed(helper, suppression)
+                helper.log_info(
+                    f"Handed {handed_off} Pushover message(s) to the delivery service "
+                    f"using account '{account}'."
+                )
+                return 0
+
+    user_key, app_token = _resolve_account(helper, account)
+    if cancel_emergency:
+        _cancel_emergencies(helper, account, app_token, logger)
+        return 0
+
+    from .quota_ledger import QuotaLedger
+
+    # Shares the budget with every other alert process on the host sending with this token.
+    rate_scheduler = RateScheduler(burst=quota_burst, ledger=QuotaLedger.for_app(app_token))
+    payloads: Iterable[Dict[str, Any]]
+    if remaining is None:
+        payloads = _render_payloads(
+            helper,
+            ResolutionPlan(helper.get_param, {"token": app_token, "user": user_key}),
+            logger,
+        )
+    else:
+        payloads = (dict(payload, token=app_token, user=user_key) for payload in remaining)
+
+    track_receipts = parse_bool(helper.get_param("track_receipts"))
+    deferral: Optional[OutboxDeferral] = None
+    if parse_bool(helper.get_param("outbox")):
+        from .outbox import Outbox, OutboxDeferral
+
+        deferral = OutboxDeferral(
+            Outbox(logger=logger), account, logger, track_receipts=track_receipts
+        )
+
+    # Without an outbox to defer to, what the quota cannot fit fails the run
+    # unless the alert opted in to skipping it.
+    skips: Optional[QuotaSkips] = None
+    if deferral is None and parse_bool(helper.get_param("skip_over_quota")):
+        skips = QuotaSkips(logger, log_sampler)
+
+    recorder: Optional[ReceiptRecorder] = None
+    if track_receipts:
+        from .receipts import ReceiptRecorder, ReceiptStore
+
+        recorder = ReceiptRecorder(ReceiptStore(logger=logger), account)
+
+    send_queue: Optional[PrioritySendQueue] = None
+    if priority_order:
+        from .send_queue import PrioritySendQueue
+
+        send_queue = PrioritySendQueue(
+            payloads,
+            rate_scheduler,
+            deadline_at=None if delivery_deadline is None else started + delivery_deadline,
+            outbox=None if deferral is None else deferral.outbox,
+            account=account,
+        )
+        payloads = send_queue
+
+    metrics: Optional[DeliveryMetrics] = None
+    if instrumentation:
+        metrics = DeliveryMetrics()
+        payloads = metrics.timed(payloads, "render")
+
+    try:
+        sent_count = _deliver(
+            helper,
+            payloads=payloads,
+            delivery_engine=delivery_engine,
+            delivery_workers=delivery_workers,
+            logger=logger,
+            rate_scheduler=rate_scheduler,
+            retry_stats=retry_stats,
+            deferral=deferral,
+            metrics=metrics,
+            log_sampler=log_sampler,
+            recorder=recorder,
+            suppression=suppression,
+            skips=skips,
+        )
+    finally:
+        if deferral is not None:
+            deferral.outbox.close()
+        if recorder is not None:
+            recorder.store.close()
+        if suppression is not None:
+            suppression.store.close()
+        if metrics is not None:
+            helper.log_info(
+                "Pushover delivery metrics: "
+                + metrics.summary(
+                    engine=delivery_engine,
+                    workers=delivery_workers,
+                    retries=retry_stats.retries,
+                )
+            )
+        suppressed = log_sampler.suppressed
+        if suppressed:
+            helper.log_info(
+                f"Suppressed {sum(suppressed.values())} per-event log line(s) over the "
+                f"limit of {log_sampler.limit} per kind ("
+                + ", ".join(f"{kind}={count}" for kind, count in suppressed.items())
+                + ")."
+            )
+
+    if deferral is not None and deferral.deferred:
+        sent_count -= deferral.deferred
+        helper.log_info(
+            f"Deferred {deferral.deferred} Pushover message(s) to the outbox for later delivery."
+        )
+    if suppression is not None:
+        sent_count -= suppression.suppressed
+    if skips is not None and skips.skipped:
+        sent_count -= skips.skipped
+        helper.log_info(
+            f"Skipped {skips.skipped} Pushover message(s) the quota could not fit "
+            f"({skips.last_error}). Enable the outbox to send them later."
+        )
+    if recorder is not None and recorder.recorded:
+        helper.log_info(
+            f"Tracking {recorder.recorded} emergency Pushover receipt(s) until acknowledged."
+        )
+    _log_shed(helper, send_queue)
+    _log_suppressed(helper, suppression)
+    if handed_off:
+        helper.log_info(
+            f"Handed {handed_off} Pushover message(s) to the delivery service before it "
+            "stopped taking them."
+        )
+    recipients = len(parse_recipients(user_key))
     helper.log_info(
-        f"Sent {sent_count} Pushover message(s) using account '{account}'."
+        f"Sent {sent_count} Pushover message(s)"
+        + (f" to {recipients} recipients" if recipients > 1 else "")
+        + f" using account '{account}' "
+        f"({retry_stats.retries} retried, {retry_stats.backoff_seconds:.1f}s in backoff)."
     )
+    _log_quota(helper, rate_scheduler)
     return 0
+
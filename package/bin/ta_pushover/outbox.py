@@ -0,0 +1,398 @@
+"""Durable on-disk outbox for messages that could not be delivered.
+
+When Pushover is unreachable, throttling us or the quota scheduler defers a
+send, the rendered payload is written to a small SQLite database instead of
+being lost with the alert. The ``pushover_outbox.py`` scripted input drains it
+later, oldest first.
+
+Only the account *name* is stored with each payload; the application token
+and user key are looked up again at replay time so no secrets touch the disk.
+Replay is paced per application token through the host-wide quota ledger,
+so a drained backlog shares the monthly budget with the live alerts. Entries
+deferred by an alert that tracks receipts keep that setting, so the receipt of
+a replayed emergency message is recorded like that of a direct send.
+Row count, total size and age are capped so a long outage cannot fill the
+disk: the oldest messages are dropped first.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .pushover_common import APP_NAME, PushoverClient, splunk_state_dir
+from .quota_ledger import QuotaLedger
+from .rate_limit import QuotaExhaustedError, RateScheduler
+from .receipts import ReceiptRecorder, ReceiptStore
+from .retry import RetryableError
+
+DEFAULT_MAX_ROWS = 10000
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 24 * 60 * 60
+# Messages replayed back to back before sends are paced near the quota limit.
+DEFAULT_REPLAY_BURST = 10
+
+# Failures worth trying again later; anything else is a permanent rejection.
+DEFERRABLE_ERRORS = (RetryableError, QuotaExhaustedError)
+
+# Never persisted, re-resolved from the account at replay time.
+SECRET_FIELDS = frozenset({"token", "user"})
+
+DEFERRED_RESPONSE: Dict[str, Any] = {"status": 1, "deferred": True}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    account TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    track_receipts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def default_outbox_path() -> str:
+    state_dir = splunk_state_dir() or os.path.join(tempfile.gettempdir(), APP_NAME)
+    return os.path.join(state_dir, "outbox.sqlite3")
+
+
+class OutboxEntry(NamedTuple):
+    entry_id: int
+    created_at: float
+    account: str
+    payload: Dict[str, Any]
+    attempts: int
+    track_receipts: bool = False
+
+
+class Outbox:
+    """SQLite-backed FIFO of payloads waiting to be sent."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+        logger: Optional[logging.Logger] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path or default_outbox_path()
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.logger = logger or logging.getLogger(__name__)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(outbox)")}
+        if "track_receipts" not in columns:
+            # Outboxes written before receipts were tracked for deferred messages.
+            self._connection.execute(
+                "ALTER TABLE outbox ADD COLUMN track_receipts INTEGER NOT NULL DEFAULT 0"
+            )
+        self._rows, self._bytes = self._totals()
+
+    def _totals(self) -> Tuple[int, int]:
+        rows, total_bytes = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox"
+        ).fetchone()
+        return int(rows), int(total_bytes)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._totals()[0]
+
+    def put(
+        self,
+        account: str,
+        payload: Dict[str, Any],
+        error: Optional[str] = None,
+        track_receipts: bool = False,
+    ) -> None:
+        stored_payload = {
+            key: value for key, value in payload.items() if key not in SECRET_FIELDS
+        }
+        encoded = json.dumps(stored_payload, separators=(",", ":"))
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO outbox "
+                "(created_at, account, payload, size, last_error, track_receipts) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._clock(), account, encoded, len(encoded), error, int(track_receipts)),
+            )
+            self._rows += 1
+            self._bytes += len(encoded)
+            if self._rows > self.max_rows or self._bytes > self.max_bytes:
+                self._compact()
+
+    def peek(self, limit: int, after_id: int = 0) -> List[OutboxEntry]:
+        """The oldest ``limit`` entries past ``after_id``, in the order they were deferred."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, created_at, account, payload, attempts, track_receipts "
+                "FROM outbox WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            ).fetchall()
+        return [
+            OutboxEntry(
+                entry_id, created_at, account, json.loads(payload), attempts, bool(track_receipts)
+            )
+            for entry_id, created_at, account, payload, attempts, track_receipts in rows
+        ]
+
+    def remove(self, entry_ids: Sequence[int]) -> None:
+        if not entry_ids:
+            return
+        with self._lock:
+            placeholders = ",".join("?" * len(entry_ids))
+            self._delete(f"id IN ({placeholders})", tuple(entry_ids))
+
+    def _delete(self, condition: str, parameters: Tuple[Any, ...]) -> int:
+        """Delete the rows matching ``condition``, keeping the running totals current."""
+        # One write transaction, so the rows counted are exactly the rows deleted.
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows, total_bytes = self._connection.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox WHERE {condition}",
+                parameters,
+            ).fetchone()
+            if rows:
+                self._connection.execute(f"DELETE FROM outbox WHERE {condition}", parameters)
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._rows -= int(rows)
+        self._bytes -= int(total_bytes)
+        return int(rows)
+
+    def mark_failed(self, entry_id: int, error: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (error, entry_id),
+            )
+
+    def compact(self) -> int:
+        """Expire old entries, enforce the size caps and reclaim free pages.
+
+        Returns the number of entries dropped.
+        """
+        with self._lock:
+            # Other processes add entries too; start from the true totals.
+            self._rows, self._bytes = self._totals()
+            return self._compact()
+
+    def _compact(self) -> int:
+        dropped = self._delete("created_at < ?", (self._clock() - self.max_age_seconds,))
+        if self._rows > self.max_rows:
+            dropped += self._delete(
+                "id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)",
+                (self._rows - self.max_rows,),
+            )
+        if self._bytes > self.max_bytes:
+            # Drop the oldest entries until the newest ones fit in the byte budget.
+            dropped += self._delete(
+                "id <= (SELECT id FROM ("
+                " SELECT id, SUM(size) OVER (ORDER BY id DESC) AS newer_bytes FROM outbox"
+                ") WHERE newer_bytes > ? ORDER BY id DESC LIMIT 1)",
+                (self.max_bytes,),
+            )
+
+        if dropped:
+            self.logger.warning("Dropped %s message(s) from the Pushover outbox.", dropped)
+            free_pages = self._connection.execute("PRAGMA freelist_count").fetchone()[0]
+            page_count = self._connection.execute("PRAGMA page_count").fetchone()[0]
+            if page_count and free_pages * 2 > page_count:
+                self._connection.execute("VACUUM")
+        return int(dropped)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class OutboxDeferral:
+    """Wraps a send function so deferrable failures land in the outbox.
+
+    After the first deferrable failure the circuit is open: the rest of the
+    run's messages go straight to the outbox instead of each waiting out its
+    own retries against an API that is down or out of quota. With
+    ``track_receipts`` set, the receipts of the deferred emergency messages
+    are recorded when they are replayed.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        account: str,
+        logger: logging.Logger,
+        track_receipts: bool = False,
+    ) -> None:
+        self.outbox = outbox
+        self.account = account
+        self.logger = logger
+        self.track_receipts = track_receipts
+        self.deferred = 0
+        self._tripped = False
+        self._lock = threading.Lock()
+
+    def defer(self, payload: Dict[str, Any], error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if error is not None and not self._tripped:
+                self.logger.warning(
+                    "Pushover unavailable, deferring remaining messages to the outbox: %s",
+                    error,
+                )
+            self._tripped = self._tripped or error is not None
+            self.deferred += 1
+        self.outbox.put(
+            self.account,
+            payload,
+            None if error is None else str(error),
+            track_receipts=self.track_receipts,
+        )
+
+    def wrap(self, send: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        def _send(**payload: Any) -> Dict[str, Any]:
+            if self._tripped:
+                self.defer(payload)
+                return DEFERRED_RESPONSE
+            try:
+                return send(**payload)
+            except DEFERRABLE_ERRORS as error:
+                self.defer(payload, error)
+                return DEFERRED_RESPONSE
+
+        return _send
+
+    def wrap_async(
+        self, send: Callable[..., Awaitable[Dict[str, Any]]]
+    ) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        async def _send(**payload: Any) -> Dict[str, Any]:
+            if self._tripped:
+                self.defer(payload)
+                return DEFERRED_RESPONSE
+            try:
+                return await send(**payload)
+            except DEFERRABLE_ERRORS as error:
+                self.defer(payload, error)
+                return DEFERRED_RESPONSE
+
+        return _send
+
+
+class ReplayResult(NamedTuple):
+    sent: int
+    rejected: int
+    remaining: int
+
+
+def default_rate_scheduler(app_token: str) -> RateScheduler:
+    return RateScheduler(burst=DEFAULT_REPLAY_BURST, ledger=QuotaLedger.for_app(app_token))
+
+
+def replay(
+    outbox: Outbox,
+    client: PushoverClient,
+    resolve_account: Callable[[str], Tuple[str, str]],
+    batch_size: int = 50,
+    max_batches: int = 20,
+    rate_scheduler_for: Callable[[str], RateScheduler] = default_rate_scheduler,
+    receipts: Optional[ReceiptStore] = None,
+) -> ReplayResult:
+    """Send outbox entries oldest first, in batches.
+
+    ``resolve_account`` maps an account name to its ``(user, app_token)``.
+    Each send goes through the scheduler ``rate_scheduler_for`` returns for
+    its app token, so the replay is paced against the shared quota.
+    Delivered entries are removed one at a time so a crash never re-sends a
+    whole batch. Permanently rejected entries are dropped; the first
+    deferrable failure stops the replay so ordering is kept for the next run.
+    Entries of an account that cannot be looked up are kept for a later run.
+    Emergency receipts of entries deferred with receipt tracking go to
+    ``receipts``.
+    """
+    outbox.compact()
+    credentials: Dict[str, Tuple[str, str]] = {}
+    unresolved: Dict[str, str] = {}
+    schedulers: Dict[str, RateScheduler] = {}
+    recorders: Dict[str, ReceiptRecorder] = {}
+    sent = 0
+    rejected = 0
+    last_id = 0
+    for _ in range(max_batches):
+        entries = outbox.peek(batch_size, after_id=last_id)
+        if not entries:
+            break
+        for entry in entries:
+            last_id = entry.entry_id
+            if entry.account not in credentials and entry.account not in unresolved:
+                try:
+                    credentials[entry.account] = resolve_account(entry.account)
+                except (OSError, ValueError) as error:
+                    unresolved[entry.account] = str(error)
+                    client.logger.error(
+                        "Keeping Pushover outbox entries of account '%s', it could not be "
+                        "looked up: %s",
+                        entry.account,
+                        error,
+                    )
+            if entry.account in unresolved:
+                outbox.mark_failed(entry.entry_id, unresolved[entry.account])
+                continue
+            user, app_token = credentials[entry.account]
+            if app_token not in schedulers:
+                schedulers[app_token] = rate_scheduler_for(app_token)
+            client.rate_scheduler = schedulers[app_token]
+            try:
+                response = client.send(token=app_token, user=user, **entry.payload)
+            except DEFERRABLE_ERRORS as error:
+                outbox.mark_failed(entry.entry_id, str(error))
+                client.logger.warning("Pushover outbox replay paused: %s", error)
+                return ReplayResult(sent, rejected, len(outbox))
+            except (TypeError, ValueError) as error:
+                client.logger.error(
+                    "Dropping Pushover outbox entry %s after permanent failure: %s",
+                    entry.entry_id,
+                    error,
+                )
+                rejected += 1
+            else:
+                sent += 1
+                if entry.track_receipts and receipts is not None:
+                    if entry.account not in recorders:
+                        recorders[entry.account] = ReceiptRecorder(receipts, entry.account)
+                    recorders[entry.account].record(entry.payload, response)
+            outbox.remove([entry.entry_id])
+    return ReplayResult(sent, rejected, len(outbox))
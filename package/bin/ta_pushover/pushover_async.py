@@ -0,0 +1,483 @@
+"""asyncio delivery engine for Pushover messages.
+
+Keeps many requests in flight from a single thread over a small pool of
+keep-alive HTTP/1.1 connections, using only the standard library so nothing
+extra has to be bundled into the app. It connects to Pushover directly, so
+it refuses to run where the environment routes the API through a proxy; the
+requests-based :class:`PushoverClient` honours the proxy settings instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import ssl
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    from .attachments import AttachmentCache, MultipartBody
+
+from .instrumentation import DeliveryMetrics
+from .log_sampling import LogSampler
+from .message import Message
+from .pushover_common import (
+    EMERGENCY_PRIORITY,
+    PUSHOVER_API_URL,
+    PushoverClient,
+    environment_proxy,
+    merge_recipient_outcomes,
+    multipart_body,
+    parse_priority,
+    prepare_attachment,
+    recipient_batches,
+    redact,
+)
+from .rate_limit import RateScheduler
+from .retry import RetryableError, RetryPolicy, RetryStats, classify_response
+
+DEFAULT_CONCURRENCY = 50
+
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class _StaleConnection(Exception):
+    """The server closed the connection without sending a single response byte."""
+
+
+async def _read_response(
+    reader: asyncio.StreamReader,
+) -> Tuple[int, Dict[str, str], bytes]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise _StaleConnection()
+    parts = status_line.decode("latin-1").split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ValueError(f"Invalid HTTP status line from Pushover: {status_line!r}")
+    status_code = int(parts[1])
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks: List[bytes] = []
+        while True:
+            size_line = await reader.readline()
+            chunk_size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if chunk_size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(chunk_size))
+            await reader.readline()
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        headers["connection"] = "close"
+    return status_code, headers, body
+
+
+class AsyncPushoverClient:
+    """asyncio sibling of :class:`PushoverClient`.
+
+    Payloads are built and validated exactly like the blocking client; at most
+    ``concurrency`` requests are in flight at once and connections are reused
+    between them. ``metrics`` works as for the blocking client; connection
+    setup (DNS, TCP and TLS, also part of the request time) and the wait for a
+    free request slot are timed as well.
+    """
+
+    def __init__(
+        self,
+        logger: Optional[logging.Logger] = None,
+        api_url: str = PUSHOVER_API_URL,
+        timeout_seconds: float = 30,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        verify: Union[bool, str] = True,
+        rate_scheduler: Optional[RateScheduler] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_stats: Optional[RetryStats] = None,
+        metrics: Optional[DeliveryMetrics] = None,
+        log_sampler: Optional[LogSampler] = None,
+        attachments: Optional[AttachmentCache] = None,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency needs to be at least 1")
+        if environment_proxy(api_url) is not None:
+            raise ValueError(
+                "The async delivery engine cannot send through the proxy set in the "
+                "environment, use the sync engine"
+            )
+        self.logger = logger or logging.getLogger(__name__)
+        self.api_url = api_url
+        self.timeout_seconds = timeout_seconds
+        self.concurrency = concurrency
+        self.rate_scheduler = rate_scheduler or RateScheduler()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_stats = retry_stats or RetryStats()
+        self.metrics = metrics
+        self.log_sampler = log_sampler or LogSampler(limit=None)
+        self._attachments = attachments
+        self._owns_attachments = attachments is None
+
+        parsed_url = urlsplit(api_url)
+        self._host = parsed_url.hostname or ""
+        self._path = parsed_url.path or "/"
+        if parsed_url.query:
+            self._path = f"{self._path}?{parsed_url.query}"
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        if parsed_url.scheme == "https":
+            self._port = parsed_url.port or 443
+            if isinstance(verify, str):
+                self._ssl_context = ssl.create_default_context(cafile=verify)
+            else:
+                self._ssl_context = ssl.create_default_context()
+                if not verify:
+                    self._ssl_context.check_hostname = False
+                    self._ssl_context.verify_mode = ssl.CERT_NONE
+        else:
+            self._port = parsed_url.port or 80
+        self._host_header = self._host
+        if parsed_url.port is not None:
+            self._host_header = f"{self._host}:{parsed_url.port}"
+
+        self._idle: List[_Connection] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def attachments(self) -> AttachmentCache:
+        if self._attachments is None:
+            from .attachments import AttachmentCache
+
+            self._attachments = AttachmentCache(logger=self.logger)
+        return self._attachments
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _open_connection(self) -> _Connection:
+        started = time.perf_counter()
+        connection = await asyncio.open_connection(
+            self._host,
+            self._port,
+            ssl=self._ssl_context,
+        )
+        if self.metrics is not None:
+            self.metrics.add_phase("connect", time.perf_counter() - started)
+            self.metrics.record_connection()
+        return connection
+
+    @staticmethod
+    async def _exchange(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request_head: bytes,
+        body: Union[bytes, MultipartBody],
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        if isinstance(body, bytes):
+            writer.write(request_head + body)
+        else:
+            # Attachments are streamed from disk a chunk at a time, each read in
+            # the default executor so a slow disk does not stall the event loop.
+            loop = asyncio.get_running_loop()
+            writer.write(request_head)
+            chunks = iter(body)
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        await writer.drain()
+        return await _read_response(reader)
+
+    async def _request(
+        self, body: Union[bytes, MultipartBody]
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        content_type = "application/json" if isinstance(body, bytes) else body.content_type
+        request_head = (
+            f"POST {self._path} HTTP/1.1\r\n"
+            f"Host: {self._host_header}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            "Accept: application/json\r\n"
+            "Connection: keep-alive\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode("latin-1")
+
+        while True:
+            reused = False
+            while self._idle:
+                reader, writer = self._idle.pop()
+                if reader.at_eof() or writer.is_closing():
+                    # Closed by the server while idle, nothing was written to it.
+                    writer.close()
+                    continue
+                reused = True
+                break
+            if not reused:
+                try:
+                    reader, writer = await asyncio.wait_for(
+                        self._open_connection(), timeout=self.timeout_seconds
+                    )
+                except (OSError, asyncio.TimeoutError) as connect_error:
+                    # Nothing was sent yet, so trying again cannot duplicate the message.
+                    raise RetryableError(
+                        f"Pushover request failed: {connect_error!r}"
+                    ) from connect_error
+            try:
+                status_code, headers, response_body = await asyncio.wait_for(
+                    self._exchange(reader, writer, request_head, body),
+                    timeout=self.timeout_seconds,
+                )
+            except _StaleConnection:
+                writer.close()
+                if reused:
+                    # Not a byte of response: the server dropped the idle keep-alive
+                    # connection as the request went out, so retry on a fresh one.
+                    continue
+                raise ConnectionError("Pushover closed the connection without a response")
+            except asyncio.IncompleteReadError as read_error:
+                writer.close()
+                # The server had started answering, so it has the request.
+                raise ConnectionError(
+                    "Pushover closed the connection in the middle of its response"
+                ) from read_error
+            except BaseException:
+                writer.close()
+                raise
+
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return status_code, headers, response_body
+
+    async def send(self, **kwargs: Any) -> Dict[str, Any]:
+        """Send one message, accepting the same arguments as :meth:`PushoverClient.send`."""
+        started = time.perf_counter()
+        message_payload = PushoverClient.build_payload(**kwargs)
+        if "attachment" in message_payload:
+            # Checking (and maybe downscaling) the file is disk work; keep it off the loop.
+            await asyncio.get_running_loop().run_in_executor(
+                None, prepare_attachment, message_payload, self.attachments
+            )
+
+        if self.log_sampler.should_log(self.logger, logging.DEBUG, "payload"):
+            self.logger.debug(
+                "Sending Pushover payload: %s",
+                json.dumps(redact(message_payload), default=str),
+            )
+
+        metrics = self.metrics
+        if metrics is None:
+            return await self._send_packed(message_payload)
+        metrics.add_phase("build", time.perf_counter() - started)
+        succeeded = False
+        try:
+            response_data = await self._send_packed(message_payload)
+            succeeded = True
+            return response_data
+        finally:
+            metrics.record_send(
+                time.perf_counter() - started,
+                len(message_payload.encode()),
+                succeeded,
+            )
+
+    async def _send_packed(self, message_payload: Message) -> Dict[str, Any]:
+        """Send to every recipient, one request per batch, batches in parallel."""
+        batches = recipient_batches(message_payload["user"])
+        if sum(len(batch) for batch in batches) < 2:
+            return await self._send_with_retries(message_payload)
+        responses = await asyncio.gather(
+            *(
+                self._send_with_retries(message_payload.replace(user=",".join(batch)))
+                for batch in batches
+            ),
+            return_exceptions=True,
+        )
+        outcomes: List[Tuple[Tuple[str, ...], Union[Dict[str, Any], Exception]]] = []
+        for batch, response in zip(batches, responses):
+            if isinstance(response, BaseException) and not isinstance(
+                response, (RetryableError, ValueError)
+            ):
+                raise response
+            outcomes.append((batch, response))
+        return merge_recipient_outcomes(outcomes, self.logger, self.log_sampler)
+
+    async def _send_with_retries(self, message_payload: Message) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._post(message_payload)
+            except RetryableError as error:
+                delay = self.retry_policy.backoff_seconds(attempt, error)
+                if delay is None:
+                    self.retry_stats.record_exhausted()
+                    raise
+                self.log_sampler.log(
+                    self.logger,
+                    logging.WARNING,
+                    "retry",
+                    "Retrying Pushover send in %.1fs after attempt %s: %s",
+                    delay,
+                    attempt,
+                    error,
+                )
+                self.retry_stats.record_retry(delay)
+                await asyncio.sleep(delay)
+
+    async def _post(self, message_payload: Message) -> Dict[str, Any]:
+        metrics = self.metrics
+        if metrics is None:
+            return await self._post_once(message_payload)
+        try:
+            response_data = await self._post_once(message_payload)
+        except Exception as error:
+            metrics.record_attempt(error)
+            raise
+        metrics.record_attempt()
+        return response_data
+
+    async def _post_once(self, message_payload: Message) -> Dict[str, Any]:
+        metrics = self.metrics
+        loop = asyncio.get_running_loop()
+        # The scheduler may wait on the host-wide ledger's file lock, which
+        # would stall every request in flight if done on the event loop.
+        urgent = parse_priority(message_payload.priority) == EMERGENCY_PRIORITY
+        delay = await loop.run_in_executor(None, self.rate_scheduler.reserve, urgent)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if metrics is not None:
+            metrics.add_phase("rate_wait", delay)
+        try:
+            queued = time.perf_counter()
+            async with self.semaphore:
+                started = time.perf_counter()
+                status_code, headers, response_body = await self._request(
+                    multipart_body(message_payload)
+                    if "attachment" in message_payload
+                    else message_payload.encode()
+                )
+                if metrics is not None:
+                    metrics.add_phase("queue", started - queued)
+                    metrics.add_phase("request", time.perf_counter() - started)
+        except (OSError, asyncio.TimeoutError) as request_error:
+            # Connect failures were already raised as retryable; this one struck
+            # after the request went out and Pushover may have delivered it.
+            raise ValueError(
+                "Pushover request failed after it was sent, not retrying so the "
+                f"message is not delivered twice: {request_error!r}"
+            ) from request_error
+        self.log_sampler.log(
+            self.logger, logging.INFO, "http_status", "Pushover HTTP status: %s", status_code
+        )
+        await loop.run_in_executor(None, self.rate_scheduler.update_from_headers, headers)
+        classify_response(status_code, headers)
+        try:
+            response_data: Dict[str, Any] = json.loads(response_body)
+        except json.JSONDecodeError as decode_error:
+            raise ValueError(
+                f"Pushover response was not valid JSON: {response_body.decode('utf-8', 'replace')}"
+            ) from decode_error
+
+        PushoverClient.check_response_data(response_data)
+        return response_data
+
+    async def send_all(
+        self,
+        payloads: Iterable[Dict[str, Any]],
+        send: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+    ) -> int:
+        """Send every payload with at most ``concurrency`` in flight.
+
+        Returns the number of messages sent. Once a send fails no new work is
+        admitted, in-flight sends are allowed to finish and the first error is
+        raised; every payload taken from ``payloads`` is sent. ``send``
+        replaces :meth:`send`, e.g. to wrap it.
+        """
+        send = send or self.send
+        sent_count = 0
+        error_count = 0
+        first_error: Optional[BaseException] = None
+        in_flight: "set[asyncio.Task[Dict[str, Any]]]" = set()
+        iterator = iter(payloads)
+
+        def _collect(finished: "set[asyncio.Task[Dict[str, Any]]]") -> None:
+            nonlocal sent_count, error_count, first_error
+            for task in finished:
+                error = task.exception()
+                if error is None:
+                    sent_count += 1
+                    continue
+                error_count += 1
+                if first_error is None:
+                    first_error = error
+
+        try:
+            while first_error is None:
+                if len(in_flight) >= self.concurrency:
+                    finished, in_flight = await asyncio.wait(
+                        in_flight, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    _collect(finished)
+                    continue
+                payload = next(iterator, None)
+                if payload is None:
+                    break
+                in_flight.add(asyncio.ensure_future(send(**payload)))
+        finally:
+            if in_flight:
+                finished, _ = await asyncio.wait(in_flight)
+                _collect(finished)
+
+        if first_error is not None:
+            self.logger.error(
+                "Pushover delivery failed for %s message(s) after %s were sent.",
+                error_count,
+                sent_count,
+            )
+            raise first_error
+        return sent_count
+
+    async def close(self) -> None:
+        if self._owns_attachments and self._attachments is not None:
+            self._attachments.close()
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+    async def __aenter__(self) -> "AsyncPushoverClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
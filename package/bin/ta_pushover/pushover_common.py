@@ -4,11 +4,105 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any, Mapping, Optional, Tuple
+import os
+import threading
+import time
+from types import TracebackType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
-import requests
+from .instrumentation import DeliveryMetrics
+from .log_sampling import LogSampler
+from .message import ATTACHMENT_CONTENT_TYPE, ATTACHMENT_FILENAME, LENGTH_LIMITS, Message
+from .rate_limit import RateScheduler
+from .retry import RetryableError, RetryPolicy, RetryStats, classify_response
+
+if TYPE_CHECKING:
+    import requests
+
+    from .attachments import AttachmentCache, MultipartBody
+
+APP_NAME = "TA-pushover"
+# Payload, account and configuration fields that are never logged in full.
+SECRET_KEYS = frozenset(
+    {
+        "token",
+        "user",
+        "app_token",
+        "user_key",
+        "application_token",
+        "password",
+        "clear_password",
+        "session_key",
+    }
+)
 
 PUSHOVER_API_URL = "https://api.pushover.net/1/messages.json"
+DEFAULT_POOL_SIZE = 10
+# Pushover accepts up to 50 comma separated user or group keys per message.
+MAX_RECIPIENTS_PER_REQUEST = 50
+# Emergency (priority 2) messages repeat every ``retry`` seconds until
+# acknowledged or ``expire`` seconds have passed; these are Pushover's bounds.
+EMERGENCY_PRIORITY = 2
+DEFAULT_EMERGENCY_RETRY_SECONDS = 60
+DEFAULT_EMERGENCY_EXPIRE_SECONDS = 3600
+MIN_EMERGENCY_RETRY_SECONDS = 30
+MAX_EMERGENCY_EXPIRE_SECONDS = 10800
+
+
+def splunk_state_dir() -> Optional[str]:
+    """Where the app keeps local state, or None outside a Splunk instance."""
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return None
+    return os.path.join(splunk_home, "var", "lib", "splunk", APP_NAME)
+
+
+def splunk_app_dir() -> Optional[str]:
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return None
+    return os.path.join(splunk_home, "etc", "apps", APP_NAME)
+
+
+def environment_proxy(url: str) -> Optional[str]:
+    """The proxy ``HTTPS_PROXY``/``HTTP_PROXY`` set for ``url``, unless ``NO_PROXY`` exempts it."""
+    from urllib.parse import urlsplit
+    from urllib.request import getproxies, proxy_bypass
+
+    parsed_url = urlsplit(url)
+    proxies = getproxies()
+    proxy = proxies.get(parsed_url.scheme) or proxies.get("all")
+    if not proxy or proxy_bypass(parsed_url.hostname or ""):
+        return None
+    return proxy
+
+
+def mask_secret(value: Any) -> str:
+    """Keep only the last four characters of a token or key, for logging."""
+    text = str(value)
+    if len(text) <= 8:
+        return "****"
+    return f"****{text[-4:]}"
+
+
+def redact(data: Mapping[str, Any]) -> Dict[str, Any]:
+    """Copy of ``data`` with every token, user key and password masked."""
+    return {
+        key: mask_secret(value) if key in SECRET_KEYS and value else value
+        for key, value in data.items()
+    }
 
 
 def _as_optional_string(value: Any) -> Optional[str]:
@@ -38,6 +132,76 @@ def parse_priority(value: Any, default: int = 0) -> int:
     return parsed_value
 
 
+def parse_optional_int(value: Optional[str]) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _parse_list(value: Optional[str]) -> Tuple[str, ...]:
+    items: Dict[str, None] = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            items[item.strip()] = None
+    return tuple(items)
+
+
+def parse_tags(value: Optional[str]) -> Tuple[str, ...]:
+    """Comma separated receipt tags, stripped and without duplicates."""
+    return _parse_list(value)
+
+
+def parse_recipients(value: Optional[str]) -> Tuple[str, ...]:
+    """Comma separated user or group keys, stripped and without duplicates."""
+    return _parse_list(value)
+
+
+def recipient_batches(
+    user: str, batch_size: int = MAX_RECIPIENTS_PER_REQUEST
+) -> List[Tuple[str, ...]]:
+    """The recipients of ``user`` packed into as few requests as the API allows."""
+    recipients = parse_recipients(user)
+    return [
+        recipients[start : start + batch_size]
+        for start in range(0, len(recipients), batch_size)
+    ]
+
+
+def merge_recipient_outcomes(
+    outcomes: Sequence[Tuple[Tuple[str, ...], Union[Dict[str, Any], Exception]]],
+    logger: logging.Logger,
+    log_sampler: LogSampler,
+) -> Dict[str, Any]:
+    """One response for a packed send, with every recipient's result under ``recipients``.
+
+    ``outcomes`` pairs each batch with its response or error. Pushover answers
+    a batch as a whole, so its recipients share that result. The first error
+    is raised only when no batch went through.
+    """
+    results: Dict[str, str] = {}
+    response_data: Optional[Dict[str, Any]] = None
+    first_error: Optional[Exception] = None
+    for batch, outcome in outcomes:
+        if isinstance(outcome, Exception):
+            first_error = first_error or outcome
+            results.update(dict.fromkeys(batch, f"failed: {outcome}"))
+            log_sampler.log(
+                logger,
+                logging.WARNING,
+                "recipients",
+                "Pushover send to %s recipient(s) (%s) failed: %s",
+                len(batch),
+                ", ".join(mask_secret(recipient) for recipient in batch),
+                outcome,
+            )
+        else:
+            response_data = response_data or outcome
+            results.update(dict.fromkeys(batch, "sent"))
+    if response_data is None:
+        raise first_error or ValueError("Pushover message has no recipients")
+    return dict(response_data, recipients=results)
+
+
 def event_value_or_literal(
     configured_value: Optional[str], event: Optional[Mapping[str, Any]]
 ) -> Optional[str]:
@@ -59,43 +223,186 @@ def extract_account_credentials(account_data: Mapping[str, Any]) -> Tuple[str, s
     app_token = _as_optional_string(account_data.get("app_token")) or _as_optional_string(
         account_data.get("password")
     )
-    if user is None:
+    if not parse_recipients(user):
         raise ValueError("Account is missing a Pushover user key")
     if app_token is None:
         raise ValueError("Account is missing a Pushover application token")
-    return user, app_token
+    return ",".join(parse_recipients(user)), app_token
+
+
+def prepare_attachment(message_payload: Message, attachments: AttachmentCache) -> None:
+    """Swap the attachment path for the file to send, or drop it if it cannot be."""
+    attachment = attachments.prepare(message_payload["attachment"])
+    if attachment is None:
+        del message_payload["attachment"]
+        return
+    message_payload["attachment"] = attachment.path
+    message_payload[ATTACHMENT_FILENAME] = attachment.filename
+    message_payload[ATTACHMENT_CONTENT_TYPE] = attachment.content_type
+
+
+def multipart_body(message_payload: Mapping[str, str]) -> MultipartBody:
+    """Streaming form body for a payload that went through :func:`prepare_attachment`."""
+    from .attachments import Attachment, MultipartBody
+
+    fields = {
+        key: value
+        for key, value in message_payload.items()
+        if key not in ("attachment", ATTACHMENT_FILENAME, ATTACHMENT_CONTENT_TYPE)
+    }
+    path = message_payload["attachment"]
+    attachment = Attachment(
+        path,
+        message_payload[ATTACHMENT_FILENAME],
+        message_payload[ATTACHMENT_CONTENT_TYPE],
+        os.path.getsize(path),
+    )
+    return MultipartBody(fields, attachment)
+
+
+def build_session(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    verify: Union[bool, str] = True,
+) -> requests.Session:
+    """Build a keep-alive session with a bounded connection pool.
+
+    ``verify`` follows the requests convention: a bool toggles certificate
+    validation, a string is the path to a CA bundle.
+    """
+    if pool_size < 1:
+        raise ValueError("pool_size needs to be at least 1")
+    # Imported on first use: requests costs more start-up time than the rest of
+    # the alert action put together, and runs that fail validation never send.
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = verify
+    return session
+
+
+def _never_sent(error: requests.RequestException) -> bool:
+    """Whether ``error`` struck before the request reached Pushover, so retrying cannot duplicate it."""
+    import requests
+    from urllib3.exceptions import MaxRetryError
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # With retries off, urllib3 wraps only failures to connect in MaxRetryError;
+    # read timeouts and connections dropped after the request went out are not.
+    return isinstance(error, requests.ConnectionError) and bool(error.args) and isinstance(
+        error.args[0], MaxRetryError
+    )
 
 
 class PushoverClient:
-    """Lightweight client for Pushover message delivery."""
+    """Lightweight client for Pushover message delivery.
+
+    The client keeps one pooled session for its whole life so consecutive
+    sends reuse the same TCP/TLS connection. Pass ``session`` to share a pool
+    owned by someone else; it is left open by :meth:`close`.
+
+    Every response feeds ``rate_scheduler`` with the quota headers, so
+    ``client.rate_scheduler.budget`` always holds the latest known budget.
+    A client sending with several app tokens passes ``rate_scheduler_for``
+    instead: it builds one scheduler per token, and each send is paced
+    against the budget of its own token (see :meth:`scheduler_for`).
+    Throttled (429), server-side (5xx) and connection failures are retried
+    according to ``retry_policy`` and counted in ``retry_stats``. With
+    ``metrics`` set, phase timings, payload sizes and errors of every send are
+    recorded there. Per-event log lines go through ``log_sampler`` and never
+    show the token or user key.
+
+    ``attachment`` is the path of an image, streamed from disk and checked
+    through ``attachments`` (one cache per client unless shared).
+
+    ``user`` may list several comma separated recipients. They are packed into
+    as few requests as the API allows, and the response then maps every
+    recipient to ``"sent"`` or its failure under ``recipients``.
+    """
 
     def __init__(
         self,
         logger: Optional[logging.Logger] = None,
         api_url: str = PUSHOVER_API_URL,
-        timeout_seconds: int = 30,
+        timeout_seconds: float = 30,
+        session: Optional[requests.Session] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        verify: Union[bool, str] = True,
+        rate_scheduler: Optional[RateScheduler] = None,
+        rate_scheduler_for: Optional[Callable[[str], RateScheduler]] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_stats: Optional[RetryStats] = None,
+        metrics: Optional[DeliveryMetrics] = None,
+        log_sampler: Optional[LogSampler] = None,
+        attachments: Optional[AttachmentCache] = None,
     ) -> None:
         self.logger = logger or logging.getLogger(__name__)
         self.api_url = api_url
         self.timeout_seconds = timeout_seconds
+        self.rate_scheduler = rate_scheduler or RateScheduler()
+        self.rate_scheduler_for = rate_scheduler_for
+        self._schedulers: Dict[str, RateScheduler] = {}
+        self._schedulers_lock = threading.Lock()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_stats = retry_stats or RetryStats()
+        self.metrics = metrics
+        self.log_sampler = log_sampler or LogSampler(limit=None)
+        self._attachments = attachments
+        self._owns_attachments = attachments is None
+        self._owns_session = session is None
+        self.session = session or build_session(pool_size=pool_size, verify=verify)
+
+    def scheduler_for(self, app_token: str) -> RateScheduler:
+        """The scheduler pacing sends made with ``app_token``."""
+        if self.rate_scheduler_for is None:
+            return self.rate_scheduler
+        with self._schedulers_lock:
+            scheduler = self._schedulers.get(app_token)
+            if scheduler is None:
+                scheduler = self._schedulers[app_token] = self.rate_scheduler_for(app_token)
+            return scheduler
+
+    @property
+    def attachments(self) -> AttachmentCache:
+        if self._attachments is None:
+            from .attachments import AttachmentCache
+
+            self._attachments = AttachmentCache(logger=self.logger)
+        return self._attachments
+
+    def close(self) -> None:
+        if self._owns_session:
+            self.session.close()
+        if self._owns_attachments and self._attachments is not None:
+            self._attachments.close()
+
+    def __enter__(self) -> "PushoverClient":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
 
     @staticmethod
     def check_lengths(message_payload: Mapping[str, Any]) -> None:
-        length_checks = {
-            "title": 250,
-            "message": 1024,
-            "url": 512,
-            "url_title": 100,
-        }
-        for key_name, max_length in length_checks.items():
+        for key_name, max_length in LENGTH_LIMITS.items():
             key_value = message_payload.get(key_name)
-            if key_value is not None and len(str(key_value)) > max_length:
-                raise ValueError(
-                    f"Length of {key_name} is too long {len(str(key_value))} > {max_length}"
-                )
+            if key_value is None:
+                continue
+            length = len(str(key_value))
+            if length > max_length:
+                raise ValueError(f"Length of {key_name} is too long {length} > {max_length}")
 
     @staticmethod
-    def validate_msg_format(message_payload: dict[str, str], html: bool, monospace: bool) -> None:
+    def validate_msg_format(message_payload: Message, html: bool, monospace: bool) -> None:
         if monospace and html:
             raise ValueError("You need to set either monospace or html, not both")
         if monospace:
@@ -103,8 +410,29 @@ class PushoverClient:
         if html:
             message_payload["html"] = "1"
 
-    def send(
-        self,
+    @staticmethod
+    def validate_emergency(
+        message_payload: Message,
+        retry: Optional[int],
+        expire: Optional[int],
+        tags: Optional[str],
+    ) -> None:
+        retry = DEFAULT_EMERGENCY_RETRY_SECONDS if retry is None else int(retry)
+        expire = DEFAULT_EMERGENCY_EXPIRE_SECONDS if expire is None else int(expire)
+        if retry < MIN_EMERGENCY_RETRY_SECONDS:
+            raise ValueError(f"retry needs to be at least {MIN_EMERGENCY_RETRY_SECONDS} seconds")
+        if expire < 1 or expire > MAX_EMERGENCY_EXPIRE_SECONDS:
+            raise ValueError(
+                f"expire needs to be between 1 and {MAX_EMERGENCY_EXPIRE_SECONDS} seconds"
+            )
+        message_payload["retry"] = str(retry)
+        message_payload["expire"] = str(expire)
+        if parse_tags(tags):
+            message_payload["tags"] = ",".join(parse_tags(tags))
+
+    @classmethod
+    def build_payload(
+        cls,
         *,
         token: str,
         user: str,
@@ -118,13 +446,18 @@ class PushoverClient:
         title: Optional[str] = None,
         url: Optional[str] = None,
         url_title: Optional[str] = None,
-    ) -> dict[str, Any]:
-        message_payload: dict[str, str] = {
-            "token": token,
-            "user": user,
-            "message": message,
-            "priority": str(parse_priority(priority)),
-        }
+        retry: Optional[int] = None,
+        expire: Optional[int] = None,
+        tags: Optional[str] = None,
+        attachment: Optional[str] = None,
+    ) -> Message:
+        """The message to send; lengths are checked as each field is set."""
+        message_payload = Message(
+            token,
+            ",".join(parse_recipients(user)) or user,
+            message,
+            str(parse_priority(priority)),
+        )
 
         if _as_optional_string(sound) not in {None, "_"}:
             message_payload["sound"] = str(sound)
@@ -138,28 +471,16 @@ class PushoverClient:
             message_payload["url"] = url
             if url_title is not None:
                 message_payload["url_title"] = url_title
+        if attachment:
+            message_payload["attachment"] = attachment
+        if message_payload["priority"] == str(EMERGENCY_PRIORITY):
+            cls.validate_emergency(message_payload, retry, expire, tags)
 
-        self.validate_msg_format(message_payload, html, monospace)
-        self.check_lengths(message_payload)
-
-        self.logger.debug(
-            "Sending Pushover payload: %s",
-            json.dumps(message_payload, default=str),
-        )
-
-        response = requests.post(
-            self.api_url,
-            json=message_payload,
-            timeout=self.timeout_seconds,
-        )
-        self.logger.info("Pushover HTTP status: %s", response.status_code)
-        try:
-            response_data: dict[str, Any] = response.json()
-        except json.JSONDecodeError as decode_error:
-            raise ValueError(
-                f"Pushover response was not valid JSON: {response.text}"
-            ) from decode_error
+        cls.validate_msg_format(message_payload, html, monospace)
+        return message_payload
 
+    @staticmethod
+    def check_response_data(response_data: Mapping[str, Any]) -> None:
         if "status" not in response_data:
             raise ValueError(f"status not returned in response: {response_data}")
 
@@ -171,4 +492,188 @@ class PushoverClient:
                 f"Status code returned from API was: '{response_data['status']}'"
             )
 
+    def send(
+        self,
+        *,
+        token: str,
+        user: str,
+        message: str,
+        priority: int = 0,
+        html: bool = False,
+        monospace: bool = False,
+        device: Optional[str] = None,
+        sound: Optional[str] = None,
+        timestamp: Optional[int] = None,
+        title: Optional[str] = None,
+        url: Optional[str] = None,
+        url_title: Optional[str] = None,
+        retry: Optional[int] = None,
+        expire: Optional[int] = None,
+        tags: Optional[str] = None,
+        attachment: Optional[str] = None,
+    ) -> dict[str, Any]:
+        started = time.perf_counter()
+        message_payload = self.build_payload(
+            token=token,
+            user=user,
+            message=message,
+            priority=priority,
+            html=html,
+            monospace=monospace,
+            device=device,
+            sound=sound,
+            timestamp=timestamp,
+            title=title,
+            url=url,
+            url_title=url_title,
+            retry=retry,
+            expire=expire,
+            tags=tags,
+            attachment=attachment,
+        )
+        if "attachment" in message_payload:
+            prepare_attachment(message_payload, self.attachments)
+
+        if self.log_sampler.should_log(self.logger, logging.DEBUG, "payload"):
+            self.logger.debug(
+                "Sending Pushover payload: %s",
+                json.dumps(redact(message_payload), default=str),
+            )
+
+        metrics = self.metrics
+        if metrics is None:
+            return self._send_packed(message_payload)
+        metrics.add_phase("build", time.perf_counter() - started)
+        succeeded = False
+        try:
+            response_data = self._send_packed(message_payload)
+            succeeded = True
+            return response_data
+        finally:
+            metrics.record_send(
+                time.perf_counter() - started,
+                len(message_payload.encode()),
+                succeeded,
+            )
+
+    def _send_packed(self, message_payload: Message) -> dict[str, Any]:
+        batches = recipient_batches(message_payload["user"])
+        if sum(len(batch) for batch in batches) < 2:
+            return self._send_with_retries(message_payload)
+        outcomes: List[Tuple[Tuple[str, ...], Union[Dict[str, Any], Exception]]] = []
+        for batch in batches:
+            try:
+                outcome: Union[Dict[str, Any], Exception] = self._send_with_retries(
+                    message_payload.replace(user=",".join(batch))
+                )
+            except (RetryableError, ValueError) as error:
+                outcome = error
+            outcomes.append((batch, outcome))
+        return merge_recipient_outcomes(outcomes, self.logger, self.log_sampler)
+
+    def _send_with_retries(self, message_payload: Message) -> dict[str, Any]:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self._post(message_payload)
+            except RetryableError as error:
+                delay = self.retry_policy.backoff_seconds(attempt, error)
+                if delay is None:
+                    self.retry_stats.record_exhausted()
+                    raise
+                self.log_sampler.log(
+                    self.logger,
+                    logging.WARNING,
+                    "retry",
+                    "Retrying Pushover send in %.1fs after attempt %s: %s",
+                    delay,
+                    attempt,
+                    error,
+                )
+                self.retry_stats.record_retry(delay)
+                time.sleep(delay)
+
+    def _connection_count(self) -> Optional[int]:
+        """Connections the session's pools have opened so far, if they tell."""
+        adapter = self.session.get_adapter(self.api_url)
+        pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+        if pools is None:
+            return None
+        return sum(
+            int(getattr(pools.get(key), "num_connections", 0)) for key in pools.keys()
+        )
+
+    def _post(self, message_payload: Message) -> dict[str, Any]:
+        metrics = self.metrics
+        if metrics is None:
+            return self._post_once(message_payload)
+        try:
+            response_data = self._post_once(message_payload)
+        except Exception as error:
+            metrics.record_attempt(error)
+            raise
+        metrics.record_attempt()
+        return response_data
+
+    def _post_once(self, message_payload: Message) -> dict[str, Any]:
+        import requests
+
+        rate_scheduler = self.scheduler_for(message_payload.token)
+        waited = rate_scheduler.acquire(
+            urgent=parse_priority(message_payload.priority) == EMERGENCY_PRIORITY
+        )
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.add_phase("rate_wait", waited)
+            connections_before = self._connection_count()
+            started = time.perf_counter()
+        try:
+            if "attachment" in message_payload:
+                body = multipart_body(message_payload)
+                response = self.session.post(
+                    self.api_url,
+                    data=body,
+                    headers={"Content-Type": body.content_type},
+                    timeout=self.timeout_seconds,
+                )
+            else:
+                response = self.session.post(
+                    self.api_url,
+                    data=message_payload.encode(),
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout_seconds,
+                )
+        except (requests.ConnectionError, requests.Timeout) as request_error:
+            if _never_sent(request_error):
+                raise RetryableError(
+                    f"Pushover request failed: {request_error}"
+                ) from request_error
+            raise ValueError(
+                "Pushover request failed after it was sent, not retrying so the "
+                f"message is not delivered twice: {request_error}"
+            ) from request_error
+        if metrics is not None:
+            # requests only reports the time from sending the request until the
+            # response headers arrived (connection setup included); the rest is
+            # request preparation and reading the body.
+            network = response.elapsed.total_seconds()
+            metrics.add_phase("network", network)
+            metrics.add_phase("client", max(time.perf_counter() - started - network, 0.0))
+            connections_after = self._connection_count()
+            if connections_before is not None and connections_after is not None:
+                metrics.record_connection(connections_after - connections_before)
+        self.log_sampler.log(
+            self.logger, logging.INFO, "http_status", "Pushover HTTP status: %s", response.status_code
+        )
+        rate_scheduler.update_from_headers(response.headers)
+        classify_response(response.status_code, response.headers)
+        try:
+            response_data: dict[str, Any] = response.json()
+        except json.JSONDecodeError as decode_error:
+            raise ValueError(
+                f"Pushover response was not valid JSON: {response.text}"
+            ) from decode_error
+
+        self.check_response_data(response_data)
         return response_data
@@ -0,0 +1,140 @@
+"""Host-wide view of the Pushover quota, shared by concurrent alert runs.
+
+Scheduled searches often fire together, and each alert process would
+otherwise pace itself against its own stale copy of the budget. Together they
+overshoot it and get throttled. :class:`QuotaLedger` keeps the budget last
+reported by Pushover, the pacing bucket and per-second counts of recent sends
+per application token in one small JSON file under the app's state directory.
+Every read-modify-write happens under an exclusive ``flock`` of a companion
+lock file, so the :class:`~.rate_limit.RateScheduler` of every process
+reserves its sends through the same numbers. The ledger is rewritten through a
+temporary file and ``os.replace``, so a crash never leaves a torn file behind.
+
+Tokens are stored only as a truncated SHA-256 digest. Without ``fcntl``
+(Windows) or outside a Splunk instance there is no ledger and each process
+paces on its own, as before.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .pushover_common import splunk_state_dir
+
+LEDGER_FILENAME = "quota.ledger"
+RECENT_SEND_WINDOW_SECONDS = 60.0
+
+
+def token_key(app_token: str) -> str:
+    return hashlib.sha256(app_token.encode("utf-8")).hexdigest()[:32]
+
+
+def _live_sends(entry: Dict[str, Any], since: float) -> List[List[int]]:
+    """The ``[second, count]`` send buckets of ``entry`` later than ``since``."""
+    return [
+        bucket
+        for bucket in entry.get("sends", [])
+        if isinstance(bucket, list) and len(bucket) == 2 and bucket[0] > since
+    ]
+
+
+class QuotaLedger:
+    """File-locked quota state of one application token, shared across processes."""
+
+    def __init__(
+        self,
+        path: str,
+        app_token: str,
+        window_seconds: float = RECENT_SEND_WINDOW_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self.key = token_key(app_token)
+        self.window_seconds = window_seconds
+        self._clock = clock
+
+    @classmethod
+    def for_app(cls, app_token: str) -> Optional["QuotaLedger"]:
+        """The host's ledger, or None outside Splunk or without file locking."""
+        state_dir = splunk_state_dir()
+        if state_dir is None:
+            return None
+        try:
+            import fcntl  # noqa: F401
+        except ImportError:
+            return None
+        return cls(os.path.join(state_dir, LEDGER_FILENAME), app_token)
+
+    @contextlib.contextmanager
+    def entry(self) -> Iterator[Dict[str, Any]]:
+        """Lock the ledger and yield this token's entry; changes are saved on exit.
+
+        The entry holds ``budget`` (``[limit, remaining, reset_at]`` or None),
+        ``tokens`` and ``last_refill`` of the pacing bucket, and ``sends``,
+        ``[second, count]`` buckets of the sends reserved within the
+        recent-send window (see :meth:`add_sends`).
+        """
+        import fcntl
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        lock_descriptor = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_descriptor, fcntl.LOCK_EX)
+            try:
+                with open(self.path, encoding="utf-8") as ledger_file:
+                    state: Dict[str, Any] = json.loads(ledger_file.read() or "{}")
+            except (OSError, ValueError):
+                state = {}
+            now = self._clock()
+            entry = state.setdefault(self.key, {})
+            entry.setdefault("budget", None)
+            entry["sends"] = _live_sends(entry, now - self.window_seconds)
+            yield entry
+            file_descriptor, temporary_path = tempfile.mkstemp(
+                dir=directory, prefix=LEDGER_FILENAME + "."
+            )
+            try:
+                with os.fdopen(file_descriptor, "w", encoding="utf-8") as temporary_file:
+                    json.dump(self._prune(state, now), temporary_file, separators=(",", ":"))
+                os.replace(temporary_path, self.path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        finally:
+            # Closing the descriptor releases the lock.
+            os.close(lock_descriptor)
+
+    @staticmethod
+    def add_sends(entry: Dict[str, Any], count: int, at: float) -> None:
+        """Count ``count`` sends at time ``at`` into the per-second buckets of ``entry``."""
+        if count <= 0:
+            return
+        second = int(at)
+        sends = entry["sends"]
+        for bucket in sends:
+            if bucket[0] == second:
+                bucket[1] += count
+                return
+        sends.append([second, count])
+
+    def _prune(self, state: Dict[str, Any], now: float) -> Dict[str, Any]:
+        """Drop other tokens' entries that have neither a live budget nor recent sends."""
+        return {
+            key: entry
+            for key, entry in state.items()
+            if key == self.key
+            or _live_sends(entry, now - self.window_seconds)
+            or (entry.get("budget") and entry["budget"][2] > now)
+        }
+
+    def recent_sends(self) -> int:
+        """Sends reserved on this host with this token within the window."""
+        with self.entry() as entry:
+            return sum(count for _, count in entry["sends"])
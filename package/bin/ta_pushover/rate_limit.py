@@ -0,0 +1,312 @@
+"""Quota-aware pacing for Pushover sends.
+
+Pushover reports the application's monthly budget on every response through
+the ``X-Limit-App-*`` headers. :class:`RateScheduler` keeps the latest view of
+that budget and, when pacing is enabled, hands out send slots from a token
+bucket whose refill rate spreads the remaining quota evenly until the reset.
+Spread over a month that rate is minutes per message, so pacing only starts
+once the budget is down to its last ``pace_below`` share; until then sends are
+only checked against the quota. With a :class:`~.quota_ledger.QuotaLedger`
+the budget and bucket are shared by every alert process on the host instead.
+
+Without an outbox to defer to, :class:`QuotaSkips` turns a send the quota
+cannot fit into a logged, counted skip rather than the end of the alert run.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+)
+
+from .log_sampling import LogSampler
+
+if TYPE_CHECKING:
+    from .quota_ledger import QuotaLedger
+
+LIMIT_HEADER = "X-Limit-App-Limit"
+REMAINING_HEADER = "X-Limit-App-Remaining"
+RESET_HEADER = "X-Limit-App-Reset"
+
+DEFAULT_MAX_WAIT_SECONDS = 30.0
+# Pacing starts once no more than this share of the monthly limit is left.
+DEFAULT_PACE_BELOW = 0.1
+# Far from pacing, a scheduler with a ledger only syncs with it this often,
+# and only while more than this multiple of the pacing threshold is left.
+LEDGER_SYNC_SECONDS = 30.0
+LEDGER_SYNC_MARGIN = 2.0
+
+SKIPPED_RESPONSE: Dict[str, Any] = {"status": 1, "skipped": True}
+
+
+class QuotaExhaustedError(ValueError):
+    """Raised when a send cannot be scheduled within the quota budget."""
+
+
+class QuotaBudget(NamedTuple):
+    """The application's message budget as last reported by Pushover."""
+
+    limit: int
+    remaining: int
+    reset_at: int
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    value = headers.get(name)
+    if value is None:
+        value = headers.get(name.lower())
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def parse_quota_headers(headers: Mapping[str, str]) -> Optional[QuotaBudget]:
+    limit = _header_int(headers, LIMIT_HEADER)
+    remaining = _header_int(headers, REMAINING_HEADER)
+    reset_at = _header_int(headers, RESET_HEADER)
+    if limit is None or remaining is None or reset_at is None:
+        return None
+    return QuotaBudget(limit=limit, remaining=remaining, reset_at=reset_at)
+
+
+class RateScheduler:
+    """Token bucket paced by the remaining monthly quota.
+
+    ``burst`` is the bucket capacity, i.e. how many messages may go out back to
+    back before pacing kicks in. With ``burst=None`` the scheduler only tracks
+    the budget and never delays a send. Until the first response headers are
+    seen there is nothing to pace against, and while more than ``pace_below``
+    of the limit remains there is no need to, so sends are not delayed.
+
+    An ``urgent`` reservation (an emergency message) is never refused: it waits
+    for its slot when that is within ``max_wait_seconds`` and goes out right
+    away otherwise, leaving the final word to Pushover.
+
+    With ``ledger`` set, the budget and bucket are read from and written back
+    to the host-wide ledger around every reservation and header update once
+    the budget nears the pacing threshold. Well above it, sends are booked
+    locally and the ledger is synced at most every ``LEDGER_SYNC_SECONDS``
+    (and by :meth:`recent_sends`), which keeps file locking off the hot path.
+    """
+
+    def __init__(
+        self,
+        burst: Optional[int] = None,
+        max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+        clock: Callable[[], float] = time.time,
+        ledger: Optional[QuotaLedger] = None,
+        pace_below: float = DEFAULT_PACE_BELOW,
+    ) -> None:
+        if burst is not None and burst < 1:
+            raise ValueError("burst needs to be at least 1")
+        self.burst = burst
+        self.max_wait_seconds = max_wait_seconds
+        self.pace_below = pace_below
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._budget: Optional[QuotaBudget] = None
+        self._tokens = float(burst or 0)
+        self._last_refill = clock()
+        self.ledger = ledger
+        self._synced_at: Optional[float] = None
+        self._unsynced_sends = 0
+
+    def _load(self, shared: Dict[str, Any]) -> None:
+        if shared["budget"] is not None:
+            self._budget = QuotaBudget(*shared["budget"])
+        if "tokens" in shared:
+            self._tokens = float(shared["tokens"])
+            self._last_refill = float(shared["last_refill"])
+
+    def _store(self, ledger: QuotaLedger, shared: Dict[str, Any]) -> None:
+        shared["budget"] = None if self._budget is None else list(self._budget)
+        if self.burst is not None:
+            shared["tokens"] = self._tokens
+            shared["last_refill"] = self._last_refill
+        self._flush_sends(ledger, shared)
+
+    def _flush_sends(self, ledger: QuotaLedger, shared: Dict[str, Any]) -> None:
+        ledger.add_sends(shared, self._unsynced_sends, self._clock())
+        self._unsynced_sends = 0
+        self._synced_at = self._clock()
+
+    def _far_from_pacing(self) -> bool:
+        """Whether the local budget can be trusted without reading the ledger."""
+        now = self._clock()
+        budget = self._budget
+        return (
+            budget is not None
+            and now < budget.reset_at
+            and budget.remaining > budget.limit * self.pace_below * LEDGER_SYNC_MARGIN
+            and self._synced_at is not None
+            and now - self._synced_at < LEDGER_SYNC_SECONDS
+        )
+
+    @property
+    def budget(self) -> Optional[QuotaBudget]:
+        """The current budget, with local reservations already subtracted."""
+        with self._lock:
+            return self._budget
+
+    def remaining(self) -> Optional[int]:
+        """Messages the budget still allows, None if unknown or already reset."""
+        with self._lock:
+            if self._budget is None or self._clock() >= self._budget.reset_at:
+                return None
+            return max(self._budget.remaining, 0)
+
+    def refill_rate(self) -> Optional[float]:
+        """Messages per second that spread the remaining quota until the reset."""
+        with self._lock:
+            return self._refill_rate(self._clock())
+
+    def _refill_rate(self, now: float) -> Optional[float]:
+        if self._budget is None or now >= self._budget.reset_at:
+            return None
+        seconds_to_reset = max(self._budget.reset_at - now, 1.0)
+        return max(self._budget.remaining, 0) / seconds_to_reset
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        budget = parse_quota_headers(headers)
+        if budget is None:
+            return
+        with self._lock:
+            self._budget = budget
+            if self.ledger is not None and not self._far_from_pacing():
+                with self.ledger.entry() as shared:
+                    self._load(shared)
+                    self._budget = budget
+                    self._store(self.ledger, shared)
+
+    def reserve(self, urgent: bool = False) -> float:
+        """Book one send and return how many seconds the caller must wait first.
+
+        Raises :class:`QuotaExhaustedError` if the quota is used up or the slot
+        is further away than ``max_wait_seconds``, unless ``urgent`` is set;
+        nothing is booked then.
+        """
+        with self._lock:
+            if self.ledger is None:
+                return self._reserve(urgent)
+            if self._far_from_pacing():
+                delay = self._reserve(urgent)
+                self._unsynced_sends += 1
+                return delay
+            with self.ledger.entry() as shared:
+                self._load(shared)
+                delay = self._reserve(urgent)
+                self._unsynced_sends += 1
+                self._store(self.ledger, shared)
+                return delay
+
+    def recent_sends(self) -> Optional[int]:
+        """Sends of this host within the ledger's window, None without a ledger.
+
+        Sends booked locally since the last sync are written to the ledger first.
+        """
+        with self._lock:
+            if self.ledger is None:
+                return None
+            with self.ledger.entry() as shared:
+                self._flush_sends(self.ledger, shared)
+                sends: List[List[int]] = shared["sends"]
+                return sum(count for _, count in sends)
+
+    def _reserve(self, urgent: bool) -> float:
+        now = self._clock()
+        budget = self._budget
+        if budget is not None and now < budget.reset_at and budget.remaining <= 0 and not urgent:
+            raise QuotaExhaustedError(
+                f"Pushover monthly quota of {budget.limit} is used up until {budget.reset_at}"
+            )
+
+        delay = 0.0
+        rate = self._refill_rate(now)
+        near_limit = budget is not None and budget.remaining <= budget.limit * self.pace_below
+        # Nothing left to spread (an urgent send past the quota) means nothing to pace.
+        if self.burst is not None and rate and near_limit:
+            self._tokens = min(
+                float(self.burst),
+                self._tokens + (now - self._last_refill) * rate,
+            )
+            self._last_refill = now
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / rate
+                if delay > self.max_wait_seconds and urgent:
+                    delay = 0.0
+                elif delay > self.max_wait_seconds:
+                    raise QuotaExhaustedError(
+                        f"Next Pushover send slot is {delay:.0f}s away, "
+                        f"over the {self.max_wait_seconds:.0f}s limit"
+                    )
+            self._tokens -= 1
+
+        if budget is not None:
+            self._budget = budget._replace(remaining=budget.remaining - 1)
+        return delay
+
+    def acquire(self, urgent: bool = False) -> float:
+        """Blocking :meth:`reserve`; returns the number of seconds slept."""
+        delay = self.reserve(urgent)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class QuotaSkips:
+    """Wraps a send function so a send the quota cannot fit is skipped, not fatal.
+
+    Each skip is logged through ``log_sampler`` and counted in ``skipped``;
+    the wrapped send then returns :data:`SKIPPED_RESPONSE`. Emergency messages
+    are never refused by the scheduler, so they are never skipped.
+    """
+
+    def __init__(self, logger: logging.Logger, log_sampler: Optional[LogSampler] = None) -> None:
+        self.logger = logger
+        self.log_sampler = log_sampler or LogSampler(limit=None)
+        self.skipped = 0
+        self.last_error: Optional[QuotaExhaustedError] = None
+        self._lock = threading.Lock()
+
+    def skip(self, error: QuotaExhaustedError) -> Dict[str, Any]:
+        with self._lock:
+            self.skipped += 1
+            self.last_error = error
+        self.log_sampler.log(
+            self.logger, logging.WARNING, "quota_skip", "Skipping Pushover message: %s", error
+        )
+        return SKIPPED_RESPONSE
+
+    def wrap(self, send: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        def _send(**payload: Any) -> Dict[str, Any]:
+            try:
+                return send(**payload)
+            except QuotaExhaustedError as error:
+                return self.skip(error)
+
+        return _send
+
+    def wrap_async(
+        self, send: Callable[..., Awaitable[Dict[str, Any]]]
+    ) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        async def _send(**payload: Any) -> Dict[str, Any]:
+            try:
+                return await send(**payload)
+            except QuotaExhaustedError as error:
+                return self.skip(error)
+
+        return _send
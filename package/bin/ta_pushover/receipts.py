@@ -0,0 +1,411 @@
+"""Follow-up of emergency (priority 2) messages through their receipts.
+
+Pushover keeps repeating an emergency message until someone acknowledges it
+or it expires, and answers the send with a receipt ID to follow it up. With
+the alert's ``track_receipts`` option enabled those receipts are written to a
+small SQLite database; the ``pushover_receipts.py`` scripted input then polls
+them in batches on its own schedule and logs one ``key=value`` line per
+receipt once it is acknowledged or expired.
+
+Pushover asks for each receipt to be polled no more than once every five
+seconds, so every receipt carries its own next poll time and each run sends at
+most ``batch_size * max_batches`` paced requests. A throttled or failing API
+pauses the run until the next scheduled one.
+
+Like the outbox, only the account *name* is stored; the application token is
+looked up again when polling.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from types import TracebackType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+from urllib.parse import quote
+
+from .pushover_common import (
+    APP_NAME,
+    DEFAULT_EMERGENCY_EXPIRE_SECONDS,
+    PushoverClient,
+    build_session,
+    parse_optional_int,
+    parse_tags,
+    splunk_state_dir,
+)
+from .retry import RetryableError, classify_response
+
+if TYPE_CHECKING:
+    import requests
+
+RECEIPTS_API_URL = "https://api.pushover.net/1/receipts"
+DEFAULT_POLL_INTERVAL_SECONDS = 30.0
+# Pushover's guidance: poll a receipt no more than once every 5 seconds.
+MIN_POLL_INTERVAL_SECONDS = 5.0
+DEFAULT_REQUEST_INTERVAL_SECONDS = 0.2
+DEFAULT_MAX_RECEIPTS = 10000
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS receipts (
+        receipt TEXT PRIMARY KEY,
+        account TEXT NOT NULL,
+        tags TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        next_poll_at REAL NOT NULL,
+        polls INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS receipts_next_poll ON receipts (next_poll_at)",
+)
+
+
+def default_receipts_path() -> str:
+    state_dir = splunk_state_dir() or os.path.join(tempfile.gettempdir(), APP_NAME)
+    return os.path.join(state_dir, "receipts.sqlite3")
+
+
+class ReceiptEntry(NamedTuple):
+    receipt: str
+    account: str
+    tags: Tuple[str, ...]
+    created_at: float
+    expires_at: float
+    polls: int
+
+
+class ReceiptStore:
+    """SQLite-backed set of receipts still waiting for an outcome."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        poll_interval_seconds: float = DEFAULT_POLL_INTERVAL_SECONDS,
+        max_receipts: int = DEFAULT_MAX_RECEIPTS,
+        logger: Optional[logging.Logger] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if poll_interval_seconds < MIN_POLL_INTERVAL_SECONDS:
+            raise ValueError(
+                f"poll_interval_seconds needs to be at least {MIN_POLL_INTERVAL_SECONDS:.0f}"
+            )
+        self.path = path or default_receipts_path()
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_receipts = max_receipts
+        self.logger = logger or logging.getLogger(__name__)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._connection.execute("SELECT COUNT(*) FROM receipts").fetchone()[0])
+
+    def add(
+        self,
+        account: str,
+        receipt: str,
+        tags: Sequence[str] = (),
+        expire_seconds: float = DEFAULT_EMERGENCY_EXPIRE_SECONDS,
+    ) -> None:
+        now = self._clock()
+        # Tags are stored comma-wrapped so a tag matches with a plain instr().
+        stored_tags = f",{','.join(tags)}," if tags else ""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO receipts "
+                "(receipt, account, tags, created_at, expires_at, next_poll_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    receipt,
+                    account,
+                    stored_tags,
+                    now,
+                    now + expire_seconds,
+                    now + self.poll_interval_seconds,
+                ),
+            )
+            dropped = self._connection.execute(
+                "DELETE FROM receipts WHERE receipt IN (SELECT receipt FROM receipts "
+                "ORDER BY created_at LIMIT max(0, (SELECT COUNT(*) FROM receipts) - ?))",
+                (self.max_receipts,),
+            ).rowcount
+        if dropped:
+            self.logger.warning("Stopped tracking %s old Pushover receipt(s).", dropped)
+
+    def due(self, limit: int) -> List[ReceiptEntry]:
+        """Up to ``limit`` receipts whose next poll is due, longest waiting first."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT receipt, account, tags, created_at, expires_at, polls FROM receipts "
+                "WHERE next_poll_at <= ? ORDER BY next_poll_at LIMIT ?",
+                (self._clock(), limit),
+            ).fetchall()
+        return [
+            ReceiptEntry(receipt, account, parse_tags(tags), created_at, expires_at, polls)
+            for receipt, account, tags, created_at, expires_at, polls in rows
+        ]
+
+    def reschedule(self, receipt: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE receipts SET polls = polls + 1, next_poll_at = ? WHERE receipt = ?",
+                (self._clock() + self.poll_interval_seconds, receipt),
+            )
+
+    def remove(self, receipts: Sequence[str]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM receipts WHERE receipt = ?", [(receipt,) for receipt in receipts]
+            )
+
+    def remove_tagged(self, account: str, tag: str) -> int:
+        """Forget the account's receipts carrying ``tag``; returns how many there were."""
+        with self._lock:
+            return int(
+                self._connection.execute(
+                    "DELETE FROM receipts WHERE account = ? AND instr(tags, ?) > 0",
+                    (account, f",{tag},"),
+                ).rowcount
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class ReceiptRecorder:
+    """Wraps a send function so every emergency receipt it gets back is stored."""
+
+    def __init__(self, store: ReceiptStore, account: str) -> None:
+        self.store = store
+        self.account = account
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, payload: Mapping[str, Any], response: Mapping[str, Any]) -> None:
+        receipt = response.get("receipt")
+        if not receipt:
+            return
+        expire = parse_optional_int(payload.get("expire"))
+        self.store.add(
+            self.account,
+            str(receipt),
+            parse_tags(payload.get("tags")),
+            DEFAULT_EMERGENCY_EXPIRE_SECONDS if expire is None else expire,
+        )
+        with self._lock:
+            self.recorded += 1
+
+    def wrap(self, send: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        def _send(**payload: Any) -> Dict[str, Any]:
+            response = send(**payload)
+            self.record(payload, response)
+            return response
+
+        return _send
+
+    def wrap_async(
+        self, send: Callable[..., Awaitable[Dict[str, Any]]]
+    ) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        async def _send(**payload: Any) -> Dict[str, Any]:
+            response = await send(**payload)
+            self.record(payload, response)
+            return response
+
+        return _send
+
+
+class ReceiptClient:
+    """Receipts API calls over one keep-alive session, paced apart."""
+
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        timeout_seconds: float = 10.0,
+        request_interval_seconds: float = DEFAULT_REQUEST_INTERVAL_SECONDS,
+        logger: Optional[logging.Logger] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.api_url = (api_url or RECEIPTS_API_URL).rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.request_interval_seconds = request_interval_seconds
+        self.logger = logger or logging.getLogger(__name__)
+        self._clock = clock
+        self._sleep = sleep
+        self._next_request_at = 0.0
+        self._owns_session = session is None
+        self.session = session or build_session(pool_size=1)
+
+    def close(self) -> None:
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self) -> "ReceiptClient":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def status(self, token: str, receipt: str) -> Dict[str, Any]:
+        return self._request("GET", f"{quote(receipt, safe='')}.json", token)
+
+    def cancel(self, token: str, receipt: str) -> None:
+        self._request("POST", f"{quote(receipt, safe='')}/cancel.json", token)
+
+    def cancel_by_tag(self, token: str, tag: str) -> int:
+        """Cancel every emergency message of the application with ``tag``."""
+        response_data = self._request("POST", f"cancel_by_tag/{quote(tag, safe='')}.json", token)
+        return int(response_data.get("canceled") or 0)
+
+    def _request(self, method: str, path: str, token: str) -> Dict[str, Any]:
+        import requests
+
+        wait = self._next_request_at - self._clock()
+        if wait > 0:
+            self._sleep(wait)
+        self._next_request_at = self._clock() + self.request_interval_seconds
+
+        url = f"{self.api_url}/{path}"
+        try:
+            if method == "GET":
+                response = self.session.get(
+                    url, params={"token": token}, timeout=self.timeout_seconds
+                )
+            else:
+                response = self.session.post(
+                    url, data={"token": token}, timeout=self.timeout_seconds
+                )
+        except (requests.ConnectionError, requests.Timeout) as request_error:
+            raise RetryableError(
+                f"Pushover receipts request failed: {request_error}"
+            ) from request_error
+        classify_response(response.status_code, response.headers)
+        try:
+            response_data: Dict[str, Any] = response.json()
+        except ValueError as decode_error:
+            raise ValueError(
+                f"Pushover response was not valid JSON: {response.text}"
+            ) from decode_error
+        PushoverClient.check_response_data(response_data)
+        return response_data
+
+
+class PollResult(NamedTuple):
+    acknowledged: int
+    expired: int
+    dropped: int
+    pending: int
+
+
+def _log_outcome(
+    logger: logging.Logger, entry: ReceiptEntry, outcome: str, **fields: Any
+) -> None:
+    details = " ".join(f"{key}={value}" for key, value in fields.items())
+    logger.info(
+        "Pushover receipt receipt=%s account=%s outcome=%s tags=\"%s\" polls=%s %s",
+        entry.receipt,
+        entry.account,
+        outcome,
+        ",".join(entry.tags),
+        entry.polls + 1,
+        details,
+    )
+
+
+def _resolve_token(resolve_account: Callable[[str], Tuple[str, str]], account: str) -> str:
+    try:
+        return resolve_account(account)[1]
+    except OSError as error:
+        # Also covers requests' errors: splunkd was unreachable, not the account gone.
+        raise RetryableError(f"Account '{account}' could not be looked up: {error}") from error
+
+
+def poll_receipts(
+    store: ReceiptStore,
+    client: ReceiptClient,
+    resolve_account: Callable[[str], Tuple[str, str]],
+    batch_size: int = 50,
+    max_batches: int = 10,
+) -> PollResult:
+    """Poll the due receipts, finishing acknowledged and expired ones.
+
+    ``resolve_account`` maps an account name to its ``(user, app_token)``.
+    Receipts Pushover no longer knows, or whose account is gone, are dropped.
+    The first retryable failure, including an account lookup that could not
+    reach splunkd, ends the run; the rest wait for the next one.
+    """
+    tokens: Dict[str, str] = {}
+    acknowledged = expired = dropped = 0
+    for _ in range(max_batches):
+        entries = store.due(batch_size)
+        if not entries:
+            break
+        for entry in entries:
+            try:
+                if entry.account not in tokens:
+                    tokens[entry.account] = _resolve_token(resolve_account, entry.account)
+                status = client.status(tokens[entry.account], entry.receipt)
+            except RetryableError as error:
+                client.logger.warning("Pushover receipt polling paused: %s", error)
+                return PollResult(acknowledged, expired, dropped, len(store))
+            except ValueError as error:
+                _log_outcome(client.logger, entry, "dropped", error=f'"{error}"')
+                store.remove([entry.receipt])
+                dropped += 1
+                continue
+
+            if int(status.get("acknowledged") or 0):
+                _log_outcome(
+                    client.logger,
+                    entry,
+                    "acknowledged",
+                    acknowledged_at=status.get("acknowledged_at"),
+                    acknowledged_by=status.get("acknowledged_by") or "-",
+                    acknowledged_by_device=status.get("acknowledged_by_device") or "-",
+                )
+                store.remove([entry.receipt])
+                acknowledged += 1
+            elif int(status.get("expired") or 0):
+                _log_outcome(client.logger, entry, "expired", expires_at=status.get("expires_at"))
+                store.remove([entry.receipt])
+                expired += 1
+            else:
+                store.reschedule(entry.receipt)
+    return PollResult(acknowledged, expired, dropped, len(store))
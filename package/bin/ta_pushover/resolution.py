@@ -0,0 +1,248 @@
+"""Compile alert parameter templates once per alert run.
+
+Every alert parameter is either the name of a result field or a literal
+fallback (see :func:`~ta_pushover.pushover_common.event_value_or_literal`).
+The templates never change within a run, so :class:`ResolutionPlan` works out
+once what each field needs: parameters that are unset resolve to a constant,
+literal fallbacks are parsed and validated a single time, and each field gets
+a resolver specialised to its template, so only the field lookup itself is
+repeated per result.
+
+Literals may also interpolate result fields Splunk-style, e.g.
+``"$result.host$ is down"``; a missing field interpolates as an empty string.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from .pushover_common import parse_bool, parse_optional_int, parse_priority
+
+T = TypeVar("T")
+
+_RESULT_TOKEN = re.compile(r"\$result\.([^$]+)\$")
+
+# Alert parameters passed through to the payload as plain text.
+TEXT_FIELDS = ("device", "sound", "title", "url", "url_title", "tags", "attachment")
+
+
+def _identity(value: Optional[str]) -> Optional[str]:
+    return value
+
+
+def _priority(value: Optional[str]) -> int:
+    return parse_priority(value, 0)
+
+
+class CompiledField(Generic[T]):
+    """One alert parameter, ready to resolve against any number of results."""
+
+    __slots__ = (
+        "template",
+        "_parser",
+        "_lookup",
+        "_key",
+        "_parts",
+        "_literal",
+        "_literal_error",
+        "resolve",
+    )
+
+    def __init__(self, template: Optional[str], parser: Callable[[Optional[str]], T]) -> None:
+        self.template = template
+        self._parser = parser
+        self._lookup = template is not None
+        self._key = template or ""
+        self._parts: Optional[List[Union[str, Tuple[str]]]] = None
+        self._literal: Optional[T] = None
+        self._literal_error: Optional[Exception] = None
+
+        if template is not None and _RESULT_TOKEN.search(template):
+            self._parts = self._split(template)
+        else:
+            # An invalid literal only fails the alert if a result actually falls back to it.
+            try:
+                self._literal = parser(template if template != "" else None)
+            except (TypeError, ValueError) as parse_error:
+                self._literal_error = parse_error
+        self.resolve: Callable[[Mapping[str, Any]], T] = self._compile()
+
+    @staticmethod
+    def _split(template: str) -> List[Union[str, Tuple[str]]]:
+        parts: List[Union[str, Tuple[str]]] = []
+        position = 0
+        for match in _RESULT_TOKEN.finditer(template):
+            if match.start() > position:
+                parts.append(template[position : match.start()])
+            parts.append((match.group(1),))
+            position = match.end()
+        if position < len(template):
+            parts.append(template[position:])
+        return parts
+
+    @property
+    def referenced_fields(self) -> FrozenSet[str]:
+        """Result fields this parameter may read."""
+        fields = {part[0] for part in self._parts or () if isinstance(part, tuple)}
+        if self._lookup:
+            fields.add(self._key)
+        return frozenset(fields)
+
+    @property
+    def is_constant(self) -> bool:
+        """True when the parameter is unset and resolves the same for every result."""
+        return not self._lookup
+
+    def _interpolate(self, event: Mapping[str, Any], parts: List[Union[str, Tuple[str]]]) -> str:
+        rendered: List[str] = []
+        for part in parts:
+            if isinstance(part, tuple):
+                value = event.get(part[0])
+                rendered.append("" if value is None else str(value))
+            else:
+                rendered.append(part)
+        return "".join(rendered)
+
+    def _fallback(self, event: Mapping[str, Any]) -> T:
+        """The value when the result has no such field: interpolated or the literal."""
+        if self._parts is not None:
+            rendered = self._interpolate(event, self._parts)
+            return self._parser(rendered if rendered != "" else None)
+        if self._literal_error is not None:
+            raise self._literal_error
+        return self._literal  # type: ignore[return-value]
+
+    def _compile(self) -> Callable[[Mapping[str, Any]], T]:
+        """A resolver for this template, with its branches and attributes bound up front.
+
+        Rendering calls it for every field of every result, so the common
+        shapes (a field with a plain literal fallback, text passed through as
+        is) skip the attribute lookups and the no-op parser call.
+        """
+        if not self._lookup:
+            return self._fallback
+        key = self._key
+        parser = self._parser
+        fallback = self._fallback
+        if self._parts is not None or self._literal_error is not None:
+
+            def resolve(event: Mapping[str, Any]) -> T:
+                value = event.get(key)
+                if value is not None:
+                    if value.__class__ is not str:
+                        value = str(value)
+                    if value != "":
+                        return parser(value)
+                return fallback(event)
+
+            return resolve
+
+        literal = self._literal
+        if parser is _identity:
+
+            def resolve_text(event: Mapping[str, Any]) -> T:
+                value = event.get(key)
+                if value is not None:
+                    if value.__class__ is not str:
+                        value = str(value)
+                    if value != "":
+                        return value  # type: ignore[return-value]
+                return literal  # type: ignore[return-value]
+
+            return resolve_text
+
+        def resolve_parsed(event: Mapping[str, Any]) -> T:
+            value = event.get(key)
+            if value is not None:
+                if value.__class__ is not str:
+                    value = str(value)
+                if value != "":
+                    return parser(value)
+            return literal  # type: ignore[return-value]
+
+        return resolve_parsed
+
+
+class ResolutionPlan:
+    """Compiled alert parameters that render a send payload for each result.
+
+    ``constants`` (the account's token and user key) are copied into every
+    payload as-is.
+    """
+
+    def __init__(
+        self,
+        get_param: Callable[[str], Optional[str]],
+        constants: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        self.constants: Dict[str, Any] = dict(constants or {})
+        url_template = get_param("url") or get_param("additional_url")
+        self.message = CompiledField(get_param("message"), _identity)
+        self.priority = CompiledField(get_param("priority"), _priority)
+        self.timestamp = CompiledField(get_param("timestamp"), parse_optional_int)
+        self.html = CompiledField(get_param("html"), parse_bool)
+        self.monospace = CompiledField(get_param("monospace"), parse_bool)
+        self.retry = CompiledField(get_param("retry"), parse_optional_int)
+        self.expire = CompiledField(get_param("expire"), parse_optional_int)
+        self.text_fields: List[Tuple[str, CompiledField[Optional[str]]]] = [
+            (
+                field_name,
+                CompiledField(
+                    url_template if field_name == "url" else get_param(field_name),
+                    _identity,
+                ),
+            )
+            for field_name in TEXT_FIELDS
+        ]
+
+        fields: List[Tuple[str, CompiledField[Any]]] = [
+            ("priority", self.priority),
+            ("html", self.html),
+            ("monospace", self.monospace),
+            ("timestamp", self.timestamp),
+            ("retry", self.retry),
+            ("expire", self.expire),
+            *self.text_fields,
+        ]
+        # Unset parameters are folded into the base payload up front so only
+        # the fields that can really come from a result are evaluated per row.
+        self._base: Dict[str, Any] = dict(self.constants)
+        self._dynamic: List[Tuple[str, Callable[[Mapping[str, Any]], Any]]] = []
+        self._fields = [field for _, field in fields]
+        for field_name, field in fields:
+            if field.is_constant:
+                self._base[field_name] = field.resolve({})
+            else:
+                self._dynamic.append((field_name, field.resolve))
+
+    @property
+    def referenced_fields(self) -> FrozenSet[str]:
+        """Every result field the plan may read; other columns can be skipped."""
+        fields = set(self.message.referenced_fields)
+        for field in self._fields:
+            fields.update(field.referenced_fields)
+        return frozenset(fields)
+
+    def render(self, event: Mapping[str, Any]) -> Dict[str, Any]:
+        message = self.message.resolve(event)
+        if message is None:
+            raise ValueError("Message resolved to an empty value")
+
+        payload = self._base.copy()
+        payload["message"] = message
+        for field_name, resolve in self._dynamic:
+            payload[field_name] = resolve(event)
+        return payload
@@ -0,0 +1,110 @@
+"""Retry classification and backoff for Pushover sends."""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Callable, Mapping, Optional
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RetryableError(ValueError):
+    """A send failed in a way that may succeed if tried again later."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(
+    value: Optional[str], clock: Callable[[], float] = time.time
+) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if value is None or value.strip() == "":
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    # HTTP dates are rare and email.utils is slow to import, so defer it.
+    from email.utils import parsedate_to_datetime
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - clock(), 0.0)
+
+
+def classify_response(status_code: int, headers: Mapping[str, str]) -> None:
+    """Raise :class:`RetryableError` for throttling and server-side failures.
+
+    Anything else is left to the caller's normal response handling, where a
+    Pushover ``status`` other than 1 is a permanent rejection.
+    """
+    if status_code not in RETRYABLE_STATUS_CODES:
+        return
+    retry_after = headers.get("Retry-After")
+    if retry_after is None:
+        retry_after = headers.get("retry-after")
+    raise RetryableError(
+        f"Pushover returned retryable HTTP status {status_code}",
+        retry_after=parse_retry_after(retry_after),
+    )
+
+
+class RetryStats:
+    """Thread-safe counters reported in the alert's final log summary."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.exhausted = 0
+
+    def record_retry(self, delay: float) -> None:
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+
+    def record_exhausted(self) -> None:
+        with self._lock:
+            self.exhausted += 1
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter.
+
+    Attempt ``n`` (1-based) sleeps a random duration up to
+    ``min(max_delay_seconds, base_delay_seconds * 2 ** (n - 1))``. A
+    ``Retry-After`` from the server is used as the delay instead; if it asks
+    for longer than ``max_delay_seconds`` the send is not retried.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay_seconds: float = 1.0,
+        max_delay_seconds: float = 30.0,
+        random_source: Callable[[], float] = random.random,
+    ) -> None:
+        if max_attempts < 1:
+            raise ValueError("max_attempts needs to be at least 1")
+        self.max_attempts = max_attempts
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._random = random_source
+
+    def backoff_seconds(self, attempt: int, error: RetryableError) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if attempt >= self.max_attempts:
+            return None
+        if error.retry_after is not None:
+            if error.retry_after > self.max_delay_seconds:
+                return None
+            return error.retry_after
+        ceiling = min(
+            self.max_delay_seconds, self.base_delay_seconds * 2.0 ** (attempt - 1)
+        )
+        return self._random() * ceiling
@@ -0,0 +1,103 @@
+"""Send the most urgent messages first, and shed the least urgent under pressure.
+
+Result order says nothing about urgency: a flood of priority -2 and -1 rows
+can hold up a priority 2 page further down the results while the quota is
+paced or Pushover is slow. With the alert's ``priority_order`` option the
+rendered messages are buffered and sent highest priority first, in result
+order within each priority.
+
+Before handing out each message, :class:`PrioritySendQueue` estimates how
+many more sends still fit: the quota the rate scheduler has left and, with a
+delivery deadline, how many sends the run's throughput so far allows before
+it passes. Whatever does not fit is shed from the back of the queue, lowest
+priority first, into the outbox when it is enabled and dropped otherwise.
+Emergency messages are never shed; if they cannot go out, the send fails as
+it would without the queue. Buffering claims nothing: repeat suppression
+only claims a message as it is sent, so whatever is left in the queue when a
+run stops is free to go out with the next firing.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import Counter, deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+from .pushover_common import EMERGENCY_PRIORITY, parse_priority
+from .rate_limit import RateScheduler
+
+if TYPE_CHECKING:
+    from .outbox import Outbox
+
+
+def payload_priority(payload: Dict[str, Any]) -> int:
+    return parse_priority(payload.get("priority"))
+
+
+class PrioritySendQueue:
+    """Payloads by descending priority, stable within a priority, shed under pressure.
+
+    ``deadline_at`` is a ``clock`` time by which the run should be done.
+    Shed messages go to ``outbox`` under ``account`` when one is given;
+    otherwise they are dropped.
+    ``shed`` counts them per priority and ``shed_reasons`` names what forced it.
+    """
+
+    def __init__(
+        self,
+        payloads: Iterable[Dict[str, Any]],
+        rate_scheduler: RateScheduler,
+        deadline_at: Optional[float] = None,
+        outbox: Optional[Outbox] = None,
+        account: str = "",
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._payloads = payloads
+        self.rate_scheduler = rate_scheduler
+        self.deadline_at = deadline_at
+        self.outbox = outbox
+        self.account = account
+        self._clock = clock
+        self.shed: Counter[int] = Counter()
+        self.shed_reasons: Dict[str, None] = {}
+        self._handed_out = 0
+        self._first_handed_out: Optional[float] = None
+
+    def _capacity(self) -> Tuple[float, str]:
+        """How many more messages fit, and the constraint that decided it."""
+        capacity, reason = math.inf, ""
+        remaining = self.rate_scheduler.remaining()
+        if remaining is not None:
+            capacity, reason = remaining, "quota"
+        if self.deadline_at is not None:
+            now = self._clock()
+            time_left = self.deadline_at - now
+            if time_left <= 0:
+                return 0, "delivery deadline"
+            if self._first_handed_out is not None and now > self._first_handed_out:
+                throughput = self._handed_out / (now - self._first_handed_out)
+                if throughput * time_left < capacity:
+                    capacity, reason = throughput * time_left, "delivery deadline"
+        return capacity, reason
+
+    def _shed_over(self, queue: Deque[Dict[str, Any]]) -> None:
+        capacity, reason = self._capacity()
+        while len(queue) > capacity and payload_priority(queue[-1]) < EMERGENCY_PRIORITY:
+            payload = queue.pop()
+            self.shed[payload_priority(payload)] += 1
+            self.shed_reasons[reason] = None
+            if self.outbox is not None:
+                self.outbox.put(self.account, payload, f"shed to stay within the {reason}")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # sorted() is stable, also in reverse, so result order holds within a priority.
+        queue = deque(sorted(self._payloads, key=payload_priority, reverse=True))
+        while queue:
+            self._shed_over(queue)
+            if not queue:
+                return
+            if self._first_handed_out is None:
+                self._first_handed_out = self._clock()
+            self._handed_out += 1
+            yield queue.popleft()
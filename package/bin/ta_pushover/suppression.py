@@ -0,0 +1,230 @@
+"""Suppress repeat notifications across searches and scheduled runs.
+
+Splunk throttles per search, but one incident often fires from several
+searches and again on every schedule. With the alert's ``suppress_window``
+set, each message is fingerprinted from the account and the
+``suppress_fields`` of its payload right before it is sent, and a message
+whose fingerprint was sent within the window is left out. Fingerprints live
+in a small SQLite table under the app's state directory, shared by every
+alert process and the delivery service on the host.
+
+Each check is one primary key lookup and write. The table is capped at
+``max_entries``: once over it, expired fingerprints go first, then the ones
+closest to expiry, down to 90% of the cap. Only messages that are about to
+be posted are claimed, and a send that fails gives its fingerprint back, so
+the next firing is not suppressed for a notification that never went out.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .pushover_common import APP_NAME, splunk_state_dir
+
+DEFAULT_SUPPRESS_FIELDS = ("title", "message")
+SUPPRESSIBLE_FIELDS = frozenset(
+    {"message", "title", "url", "url_title", "priority", "sound", "device", "tags", "attachment"}
+)
+DEFAULT_MAX_ENTRIES = 100000
+# Eviction trims the table to this share of the cap, so it runs only now and then.
+EVICT_TO_FRACTION = 0.9
+
+SUPPRESSED_RESPONSE: Dict[str, Any] = {"status": 1, "suppressed": True}
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS suppression (
+        fingerprint TEXT PRIMARY KEY,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS suppression_expires_at ON suppression (expires_at)",
+)
+
+
+def default_suppression_path() -> str:
+    state_dir = splunk_state_dir() or os.path.join(tempfile.gettempdir(), APP_NAME)
+    return os.path.join(state_dir, "suppression.sqlite3")
+
+
+def parse_suppress_fields(value: Optional[str]) -> Tuple[str, ...]:
+    """Comma separated payload fields identifying a notification."""
+    fields = tuple(
+        dict.fromkeys(field.strip() for field in (value or "").split(",") if field.strip())
+    ) or DEFAULT_SUPPRESS_FIELDS
+    unknown = [field for field in fields if field not in SUPPRESSIBLE_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"suppress_fields can only use {', '.join(sorted(SUPPRESSIBLE_FIELDS))}, "
+            f"not {', '.join(unknown)}"
+        )
+    return fields
+
+
+def fingerprint(account: str, payload: Mapping[str, Any], fields: Sequence[str]) -> str:
+    values = [account] + [payload.get(field) for field in fields]
+    encoded = json.dumps(values, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SuppressionStore:
+    """SQLite-backed set of fingerprints, each suppressed until it expires."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries needs to be at least 1")
+        self.path = path or default_suppression_path()
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        # Other processes add rows too, so this is recounted before evicting.
+        self._entries = self._count()
+
+    def _count(self) -> int:
+        return int(self._connection.execute("SELECT COUNT(*) FROM suppression").fetchone()[0])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def claim(self, key: str, window_seconds: float) -> bool:
+        """Record ``key`` as sent for ``window_seconds``; False if it still is."""
+        now = self._clock()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT expires_at FROM suppression WHERE fingerprint = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    self._connection.execute("COMMIT")
+                    return False
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO suppression (fingerprint, expires_at) VALUES (?, ?)",
+                    (key, now + window_seconds),
+                )
+                if row is None:
+                    self._entries += 1
+                    if self._entries > self.max_entries:
+                        self._evict(now)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return True
+
+    def _evict(self, now: float) -> None:
+        self._connection.execute("DELETE FROM suppression WHERE expires_at <= ?", (now,))
+        self._connection.execute(
+            "DELETE FROM suppression WHERE fingerprint IN (SELECT fingerprint FROM suppression "
+            "ORDER BY expires_at LIMIT max(0, (SELECT COUNT(*) FROM suppression) - ?))",
+            (int(self.max_entries * EVICT_TO_FRACTION),),
+        )
+        self._entries = self._count()
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM suppression WHERE fingerprint = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class SuppressionWindow:
+    """One alert run's view of the store, claiming each message as it is sent.
+
+    Wrapped sends return :data:`SUPPRESSED_RESPONSE` for a repeat instead of
+    posting it, counted in ``suppressed``, and give the claim back if they fail.
+    """
+
+    def __init__(
+        self,
+        store: SuppressionStore,
+        account: str,
+        window_seconds: float,
+        fields: Sequence[str] = DEFAULT_SUPPRESS_FIELDS,
+    ) -> None:
+        if window_seconds <= 0:
+            raise ValueError("window_seconds needs to be positive")
+        self.store = store
+        self.account = account
+        self.window_seconds = window_seconds
+        self.fields = tuple(fields)
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def claim(self, payload: Mapping[str, Any]) -> bool:
+        """Claim ``payload`` for sending; False (and counted) if it is a repeat."""
+        if self.store.claim(fingerprint(self.account, payload, self.fields), self.window_seconds):
+            return True
+        with self._lock:
+            self.suppressed += 1
+        return False
+
+    def release(self, payload: Mapping[str, Any]) -> None:
+        """Give back the claim of a payload that was not sent after all."""
+        self.store.release(fingerprint(self.account, payload, self.fields))
+
+    def wrap(self, send: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        def _send(**payload: Any) -> Dict[str, Any]:
+            if not self.claim(payload):
+                return SUPPRESSED_RESPONSE
+            try:
+                return send(**payload)
+            except BaseException:
+                self.release(payload)
+                raise
+
+        return _send
+
+    def wrap_async(
+        self, send: Callable[..., Awaitable[Dict[str, Any]]]
+    ) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        import asyncio
+
+        async def _send(**payload: Any) -> Dict[str, Any]:
+            loop = asyncio.get_running_loop()
+            # The store may wait on other processes' SQLite locks; keep that off the loop.
+            if not await loop.run_in_executor(None, self.claim, payload):
+                return SUPPRESSED_RESPONSE
+            try:
+                return await send(**payload)
+            except BaseException:
+                await loop.run_in_executor(None, self.release, payload)
+                raise
+
+        return _send
@@ -1,30 +1,56 @@
 """pushover alert action for splunk"""
 
-# pylint: disable=logging-fstring-interpolation
-
+from io import BytesIO
 import json
 import logging
-from ssl import SSLCertVerificationError
 import sys
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from urllib.parse import urlparse
+from urllib.parse import quote, urlparse
 import requests
 
 from splunklib import client  # type: ignore
-from splunklib.binding import ResponseReader  # type: ignore
+from splunklib.binding import HTTPError, ResponseReader, UrlEncoded  # type: ignore
+
+# UCC stores the encrypted settings of conf-ta_pushover_settings under this realm
+PASSWORD_REALM = "__REST_CREDENTIAL__#{app}#configs/conf-ta_pushover_settings"
+PASSWORD_USERNAME = "additional_parameters"
+# upper bound on entries returned by the realm-filtered lookup
+PASSWORD_SEARCH_LIMIT = 50
+# never logged in full
+SECRET_FIELDS = frozenset(
+    {
+        "token",
+        "user",
+        "user_key",
+        "app_token",
+        "application_token",
+        "password",
+        "clear_password",
+        "session_key",
+    }
+)
+
+logger = logging.getLogger("TA-pushover")
+coalesce_logger = logging.getLogger("TA-pushover.coalesce")
+
+
+def redact(data: Dict[str, Any]) -> Dict[str, Any]:
+    """copy of data with tokens, user keys and passwords masked, for logging"""
+    redacted = dict(data)
+    for key in SECRET_FIELDS.intersection(redacted):
+        value = str(redacted[key] or "")
+        if value:
+            redacted[key] = f"****{value[-4:]}" if len(value) > 8 else "****"
+    return redacted
 
 
 class Pushover:
     """pushover handler"""
 
     api_url = "https://api.pushover.net/1/messages.json"
-
-    # TODO: handle http 429 - rate limiting
-    # TODO: maybe print headers?
-    # X-Limit-App-Limit: 10000
-    # X-Limit-App-Remaining: 7496
-    # X-Limit-App-Reset: 1393653600
+    # seconds to wait on the Pushover API before giving up
+    timeout_seconds = 30
 
     def __init__(self, token: Optional[str] = None) -> None:
         """setter"""
@@ -39,7 +65,7 @@ class Pushover:
         else:
             raise ValueError("Please set a token")
         url = f"https://api.pushover.net/1/apps/limits.json?token={check_token}"
-        return requests.get(url).json()
+        return requests.get(url, timeout=self.timeout_seconds).json()
 
     @classmethod
     def check_lengths(cls, message_payload: Dict[str, str]) -> None:
@@ -93,7 +119,6 @@ class Pushover:
         token: str,
         user: str,
         message: str,
-        # attachment: Optional[str]=None, # yeah nah
         priority: int = 0,
         html: bool = False,
         monospace: bool = False,
@@ -133,15 +158,32 @@ class Pushover:
         self.validate_msg_format(message_payload, html, monospace)
         self.check_lengths(message_payload)
 
-        logger.debug(
-            f"event message payload: {json.dumps(message_payload, default=str)}"
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "event message payload: %s",
+                json.dumps(redact(message_payload), default=str),
+            )
 
         message_send_response = requests.post(
             self.api_url,
             json=message_payload,
+            timeout=self.timeout_seconds,
         )
         logger.info("message send response content: %s", message_send_response.content)
+        logger.info(
+            "app quota: %s of %s remaining, resets at %s",
+            message_send_response.headers.get("X-Limit-App-Remaining"),
+            message_send_response.headers.get("X-Limit-App-Limit"),
+            message_send_response.headers.get("X-Limit-App-Reset"),
+        )
+
+        if message_send_response.status_code == 429:
+            raise ValueError(
+                "Pushover rate limit hit, "
+                f"{message_send_response.headers.get('X-Limit-App-Remaining')} of "
+                f"{message_send_response.headers.get('X-Limit-App-Limit')} messages left, "
+                f"resets at {message_send_response.headers.get('X-Limit-App-Reset')}"
+            )
 
         responsedata = message_send_response.json()
         if "status" not in responsedata:
@@ -183,28 +225,120 @@ def pull_config(
     return configdata
 
 
-def get_password(
+def rest_session_handler(
+    session: requests.Session,
+    timeout: Optional[float] = None,
+) -> Callable[..., Dict[str, Any]]:
+    """splunklib HTTP handler sending every REST call over one keep-alive session
+
+    The default splunklib handler opens (and TLS-negotiates) a new connection
+    for each request. If certificate verification fails the session falls
+    back to unverified requests once, like the connection fallback it replaces.
+    """
+
+    def request(url: str, message: Dict[str, Any], **_: Any) -> Dict[str, Any]:
+        arguments: Dict[str, Any] = {
+            "headers": dict(message.get("headers", [])),
+            "data": message.get("body") or None,
+            "timeout": timeout,
+        }
+        method = message.get("method", "GET")
+        try:
+            response = session.request(method, url, **arguments)
+        except requests.exceptions.SSLError:
+            if session.verify is False:
+                raise
+            logger.debug("REST API (%s) failed ssl verification, falling back", url)
+            session.verify = False
+            response = session.request(method, url, **arguments)
+        return {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": list(response.headers.items()),
+            "body": BytesIO(response.content),
+        }
+
+    return request
+
+
+def _password_entries(
     service: client.Service,
     app: str,
-) -> str:
-    """pulls the passwords from the app endpoint"""
+    path: Any = "storage/passwords",
+    **filters: Any,
+) -> List[Dict[str, Any]]:
+    """returns the storage/passwords entries matching the filters"""
     response = service.request(
-        "storage/passwords",
+        path,
         app=app,
-        body={
-            "output_mode": "json",
-        },
+        body={"output_mode": "json", **filters},
     )
     responsebody: ResponseReader = response["body"]
+    response_dict: Dict[str, Any] = json.loads(responsebody.read())
+    return list(response_dict.get("entry", []))
+
+
+def _application_token(entry: Dict[str, Any]) -> Optional[str]:
+    """pulls the application_token out of a stored password entry"""
+    clear_password = entry.get("content", {}).get("clear_password", "")
+    if "application_token" not in clear_password:
+        return None
+    token: Optional[str] = json.loads(clear_password).get("application_token")
+    return token
+
+
+def get_password(
+    service: client.Service,
+    app: str,
+) -> str:
+    """pulls the application token from the app's password storage
+
+    Looks the credential up by realm and name first, then with a realm search
+    limited to a handful of entries. Only when both miss is the whole
+    storage/passwords collection fetched and indexed.
+    """
+    realm = PASSWORD_REALM.format(app=app)
     try:
-        response_dict: Dict[str, Any] = json.loads(responsebody.read())
-        if "entry" in response_dict:
-            for entry in response_dict["entry"]:
-                if "application_token" in entry.get("content", {}).get(
-                    "clear_password", {}
-                ):
-                    password_data = json.loads(entry["content"]["clear_password"])
-                    return password_data["application_token"]
+        try:
+            direct = _password_entries(
+                service,
+                app,
+                UrlEncoded(
+                    "storage/passwords/"
+                    + quote(f"{realm}:{PASSWORD_USERNAME}:", safe=""),
+                    skip_encode=True,
+                ),
+            )
+        except HTTPError as http_error:
+            if http_error.status != 404:
+                raise
+            direct = []
+        for entry in direct:
+            token = _application_token(entry)
+            if token:
+                return token
+        # long secrets are stored in chunks, which only the realm search finds
+        for entry in _password_entries(
+            service,
+            app,
+            search=f'realm="{realm}"',
+            count=PASSWORD_SEARCH_LIMIT,
+        ):
+            token = _application_token(entry)
+            if token:
+                return token
+
+        logger.warning(
+            "application_token not found in realm %s, scanning all stored passwords",
+            realm,
+        )
+        token_index: Dict[str, str] = {}
+        for entry in _password_entries(service, app, count=0):
+            token = _application_token(entry)
+            if token:
+                token_index.setdefault(entry.get("content", {}).get("realm", ""), token)
+        if token_index:
+            return token_index.get(realm) or next(iter(token_index.values()))
     except json.JSONDecodeError as json_error:
         logger.error(
             "JSONDecodeError handling REST call to storage/passwords: %s",
@@ -223,13 +357,11 @@ def coalesce(
     default_value: Optional[str] = None,
 ) -> Optional[str]:
     """coalesce dicts, order is event -> config -> None"""
-    coalescelogger = logging.getLogger("coalesce")
-    coalescelogger.setLevel(logging.DEBUG)
     if event_data.get(key) is not None:
-        coalescelogger.debug("eventdata - %s = '%s'", key, event_data.get(key))
+        coalesce_logger.debug("eventdata - %s = '%s'", key, event_data[key])
         return event_data[key]
     if app_data.get(key) is not None:
-        coalescelogger.debug("configdata - %s = '%s'", key, app_data.get(key))
+        coalesce_logger.debug("configdata - %s = '%s'", key, app_data[key])
         return app_data[key]
     return default_value
 
@@ -248,7 +380,8 @@ def send_pushover_alert(
     if "message" not in event:
         raise ValueError("You need to have a message field in each event.")
 
-    logger_class.error(f"event={event}")
+    if logger_class.isEnabledFor(logging.DEBUG):
+        logger_class.debug("event=%s", json.dumps(redact(event), default=str))
 
     html = False
     if coalesce("html", event, event_config) is not None:
@@ -265,7 +398,7 @@ def send_pushover_alert(
         logger.debug("setting priority to 0")
         priority = 0
     else:
-        logger.debug(f"Setting priority to int({prival})")
+        logger.debug("Setting priority to int(%s)", prival)
         priority = int(prival)
 
     Pushover().send(
@@ -286,39 +419,26 @@ def send_pushover_alert(
 
 if __name__ == "__main__":
     # setup logging
-    logger = logging.getLogger("TA-pushover")
     logger.setLevel(logging.DEBUG)
     for value in sys.argv:
-        logger.debug(f"argv: {value}")
+        logger.debug("argv: %s", value)
 
-    # config data and results
-    stdin = sys.stdin.read()
-    logger.debug(f"stdin: {json.dumps(stdin)}")
+    # config data and results, the session key masked in the log
+    config = json.loads(sys.stdin.read())
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("stdin: %s", json.dumps(redact(config), default=str))
 
-    config = json.loads(stdin)
-
-    # connect to the REST API to pull app config data
+    # connect to the REST API to pull app config data, config and password
+    # lookups share one keep-alive connection
     parsed_url = urlparse(config["server_uri"])
-    try:
-        splunkclient = client.connect(
-            host=parsed_url.hostname,
-            port=parsed_url.port,
-            scheme=parsed_url.scheme,
-            token=config["session_key"],
-        )
-    # if it fails SSL verification, fall back
-    except SSLCertVerificationError:
-        logger.debug(
-            "Failed to connect to REST API (%s), ssl verification error",
-            config["server_uri"],
-        )
-        splunkclient = client.connect(
-            host=parsed_url.hostname,
-            port=parsed_url.port,
-            scheme=parsed_url.scheme,
-            token=config["session_key"],
-            verify=False,
-        )
+    rest_session = requests.Session()
+    splunkclient = client.connect(
+        host=parsed_url.hostname,
+        port=parsed_url.port,
+        scheme=parsed_url.scheme,
+        token=config["session_key"],
+        handler=rest_session_handler(rest_session),
+    )
 
     app_config = pull_config(
         splunkclient,
@@ -326,25 +446,15 @@ if __name__ == "__main__":
         logger,
     )
     application_token = get_password(splunkclient, "TA-pushover")
-
-    logger.debug("#" * 50)
-    logger.debug("app config")
-    logger.debug(
-        json.dumps(
-            app_config,
-            indent=4,
-            default=str,
-        )
-    )
-    logger.debug("#" * 50)
-    logger.debug("events")
-    logger.debug(
-        json.dumps(
-            config["result"],
-            indent=4,
-            default=str,
-        )
-    )
+    rest_session.close()
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("#" * 50)
+        logger.debug("app config")
+        logger.debug(json.dumps(redact(app_config), indent=4, default=str))
+        logger.debug("#" * 50)
+        logger.debug("events")
+        logger.debug(json.dumps(redact(config["result"]), indent=4, default=str))
 
     send_pushover_alert(
         logger,
@@ -0,0 +1,394 @@
+"""Local stand-in for the Pushover API, for load and fault testing.
+
+Serves the messages, app limits and receipts endpoints over plain HTTP on
+localhost, so ``PushoverClient(api_url=server.messages_url)`` (or the async
+engine) can be exercised offline and reproducibly:
+
+- response latency is drawn from a configurable distribution;
+- a share of message requests can be answered with 429 or 5xx;
+- the app quota is simulated, including the ``X-Limit-App-*`` headers and
+  429s once it is used up;
+- multipart image attachments are accepted up to the 2.5 MB limit;
+- every request is counted per endpoint and status.
+
+It can also run on its own for soak tests against a local client::
+
+    uv run python tests/fake_pushover.py --port 8080 --latency-ms 40 --error-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+LatencyFunction = Callable[[random.Random], float]
+
+DEFAULT_APP_LIMIT = 10000
+MAX_ATTACHMENT_BYTES = 2621440
+
+
+def no_latency(rng: random.Random) -> float:
+    del rng
+    return 0.0
+
+
+def fixed_latency(seconds: float) -> LatencyFunction:
+    return lambda rng: seconds
+
+
+def uniform_latency(low_seconds: float, high_seconds: float) -> LatencyFunction:
+    return lambda rng: rng.uniform(low_seconds, high_seconds)
+
+
+def lognormal_latency(median_seconds: float, sigma: float = 0.5) -> LatencyFunction:
+    """Long-tailed latency, the usual shape of real API response times."""
+    if median_seconds <= 0:
+        return no_latency
+    mu = math.log(median_seconds)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+class FakePushoverServer:
+    """Threaded fake of api.pushover.net, used as a context manager.
+
+    ``throttle_rate`` and ``error_rate`` are the shares of message requests
+    answered with 429 and with ``error_status`` respectively; ``retry_after``
+    is sent with both when set. ``acknowledge_after_seconds`` makes emergency
+    (priority 2) receipts acknowledge themselves after that long.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyFunction = no_latency,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: Optional[str] = None,
+        app_limit: int = DEFAULT_APP_LIMIT,
+        app_remaining: Optional[int] = None,
+        reset_seconds: int = 30 * 24 * 60 * 60,
+        acknowledge_after_seconds: Optional[float] = None,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.app_limit = app_limit
+        self.app_remaining = app_limit if app_remaining is None else app_remaining
+        self.reset_at = int(clock()) + reset_seconds
+        self.acknowledge_after_seconds = acknowledge_after_seconds
+        self._clock = clock
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.messages: List[Dict[str, str]] = []
+        self.receipts: Dict[str, Dict[str, Any]] = {}
+        self.request_counts: Counter[str] = Counter()
+        self.status_counts: Counter[int] = Counter()
+
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    @property
+    def messages_url(self) -> str:
+        return f"{self.url}/1/messages.json"
+
+    @property
+    def request_total(self) -> int:
+        with self._lock:
+            return sum(self.request_counts.values())
+
+    def start(self) -> "FakePushoverServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            name="fake-pushover",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakePushoverServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def record_status(self, status: int) -> None:
+        with self._lock:
+            self.status_counts[status] += 1
+
+    def _draw(self) -> Tuple[float, float]:
+        with self._lock:
+            return self.latency(self._random), self._random.random()
+
+    def _limit_headers(self) -> Dict[str, str]:
+        return {
+            "X-Limit-App-Limit": str(self.app_limit),
+            "X-Limit-App-Remaining": str(self.app_remaining),
+            "X-Limit-App-Reset": str(self.reset_at),
+        }
+
+    def _fault_headers(self) -> Dict[str, str]:
+        return {} if self.retry_after is None else {"Retry-After": self.retry_after}
+
+    def handle(
+        self, method: str, path: str, params: Dict[str, str]
+    ) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        """Answer one request; returns status, extra headers and JSON body."""
+        delay, fault = self._draw()
+        if delay > 0:
+            time.sleep(delay)
+        request_id = secrets.token_hex(16)
+
+        with self._lock:
+            if method == "POST" and path == "/1/messages.json":
+                self.request_counts["messages"] += 1
+                return self._message(params, request_id, fault)
+            if method == "GET" and path == "/1/apps/limits.json":
+                self.request_counts["limits"] += 1
+                return (
+                    200,
+                    {},
+                    {
+                        "status": 1,
+                        "limit": self.app_limit,
+                        "remaining": self.app_remaining,
+                        "reset": self.reset_at,
+                        "request": request_id,
+                    },
+                )
+            if path.startswith("/1/receipts/"):
+                self.request_counts["receipts"] += 1
+                return self._receipt(method, path[len("/1/receipts/") :], request_id)
+            self.request_counts["unknown"] += 1
+            return 404, {}, {"status": 0, "errors": ["not found"], "request": request_id}
+
+    def _message(
+        self, params: Dict[str, str], request_id: str, fault: float
+    ) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        if fault < self.throttle_rate:
+            return 429, self._fault_headers(), {"status": 0, "request": request_id}
+        if fault < self.throttle_rate + self.error_rate:
+            return self.error_status, self._fault_headers(), {"status": 0, "request": request_id}
+        users = [user for user in params.get("user", "").split(",") if user]
+        if self.app_remaining < max(len(users), 1):
+            return (
+                429,
+                self._limit_headers(),
+                {"status": 0, "errors": ["application is over its quota"], "request": request_id},
+            )
+
+        errors = [
+            f"{field} must be supplied"
+            for field in ("token", "user", "message")
+            if not params.get(field)
+        ]
+        if len(users) > 50:
+            errors.append("user can contain at most 50 keys")
+        if int(params.get("attachment_size") or 0) > MAX_ATTACHMENT_BYTES:
+            errors.append("attachment is too large")
+        priority = params.get("priority", "0")
+        if priority == "2":
+            if int(params.get("retry") or 0) < 30:
+                errors.append("retry must be at least 30 seconds")
+            if not 0 < int(params.get("expire") or 0) <= 10800:
+                errors.append("expire must be at most 10800 seconds")
+        if errors:
+            return 400, self._limit_headers(), {"status": 0, "errors": errors, "request": request_id}
+
+        # Every recipient counts against the app quota.
+        self.app_remaining -= len(users)
+        self.messages.append(params)
+        body: Dict[str, Any] = {"status": 1, "request": request_id}
+        if priority == "2":
+            receipt = secrets.token_hex(15)
+            now = self._clock()
+            self.receipts[receipt] = {
+                "token": params["token"],
+                "tags": set(filter(None, params.get("tags", "").split(","))),
+                "created_at": now,
+                "expires_at": now + int(params["expire"]),
+                "cancelled": False,
+            }
+            body["receipt"] = receipt
+        return 200, self._limit_headers(), body
+
+    def _receipt(
+        self, method: str, tail: str, request_id: str
+    ) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        if method == "POST" and tail.startswith("cancel_by_tag/") and tail.endswith(".json"):
+            tag = tail[len("cancel_by_tag/") : -len(".json")]
+            cancelled = 0
+            for receipt in self.receipts.values():
+                if tag in receipt["tags"] and not receipt["cancelled"]:
+                    receipt["cancelled"] = True
+                    cancelled += 1
+            return 200, {}, {"status": 1, "canceled": cancelled, "request": request_id}
+
+        receipt_id, _, action = tail.partition("/")
+        receipt_id = receipt_id[: -len(".json")] if receipt_id.endswith(".json") else receipt_id
+        if receipt_id not in self.receipts:
+            return 404, {}, {"status": 0, "errors": ["receipt not found"], "request": request_id}
+        receipt = self.receipts[receipt_id]
+        if method == "POST" and action == "cancel.json":
+            receipt["cancelled"] = True
+            return 200, {}, {"status": 1, "request": request_id}
+        if method != "GET" or action:
+            return 404, {}, {"status": 0, "errors": ["not found"], "request": request_id}
+
+        now = self._clock()
+        acknowledged_at = 0
+        if self.acknowledge_after_seconds is not None and not receipt["cancelled"]:
+            acknowledge_at = receipt["created_at"] + self.acknowledge_after_seconds
+            if acknowledge_at <= min(now, receipt["expires_at"]):
+                acknowledged_at = int(acknowledge_at)
+        return (
+            200,
+            {},
+            {
+                "status": 1,
+                "acknowledged": int(acknowledged_at > 0),
+                "acknowledged_at": acknowledged_at,
+                "acknowledged_by": "",
+                "acknowledged_by_device": "",
+                "last_delivered_at": int(receipt["created_at"]),
+                "expired": int(now >= receipt["expires_at"]),
+                "expires_at": int(receipt["expires_at"]),
+                "called_back": 0,
+                "called_back_at": 0,
+                "request": request_id,
+            },
+        )
+
+
+def _read_multipart(content_type: str, body: bytes) -> Dict[str, str]:
+    """Form fields of a multipart body; the attachment is summarised by name and size."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    params: Dict[str, str] = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True)
+        if not isinstance(name, str) or not isinstance(payload, bytes):
+            continue
+        if part.get_filename():
+            params[f"{name}_name"] = str(part.get_filename())
+            params[f"{name}_type"] = part.get_content_type()
+            params[f"{name}_size"] = str(len(payload))
+        else:
+            params[name] = payload.decode("utf-8")
+    return params
+
+
+def _read_params(handler: BaseHTTPRequestHandler) -> Dict[str, str]:
+    query = urlsplit(handler.path).query
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    length = int(handler.headers.get("Content-Length") or 0)
+    if length:
+        raw_body = handler.rfile.read(length)
+        body = raw_body.decode("utf-8", "replace")
+        if handler.headers.get_content_type() == "application/json":
+            params.update({key: str(value) for key, value in json.loads(body).items()})
+        elif handler.headers.get_content_type() == "multipart/form-data":
+            params.update(_read_multipart(handler.headers["Content-Type"], raw_body))
+        else:
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+    return params
+
+
+def _handler_for(server: FakePushoverServer) -> type:
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this every
+        # keep-alive response stalls on delayed ACKs.
+        disable_nagle_algorithm = True
+
+        def _respond(self, method: str) -> None:
+            status, headers, body = server.handle(
+                method, urlsplit(self.path).path, _read_params(self)
+            )
+            server.record_status(status)
+            encoded = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server naming
+            self._respond("GET")
+
+        def do_POST(self) -> None:  # noqa: N802 - http.server naming
+            self._respond("POST")
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            del format, args
+
+    return _Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="median latency")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--app-limit", type=int, default=DEFAULT_APP_LIMIT)
+    arguments = parser.parse_args()
+
+    server = FakePushoverServer(
+        latency=lognormal_latency(arguments.latency_ms / 1000),
+        throttle_rate=arguments.throttle_rate,
+        error_rate=arguments.error_rate,
+        app_limit=arguments.app_limit,
+        host=arguments.host,
+        port=arguments.port,
+    )
+    print(f"Fake Pushover API listening on {server.messages_url}")
+    with server:
+        try:
+            while True:
+                time.sleep(10)
+                print(
+                    f"requests={dict(server.request_counts)} "
+                    f"statuses={dict(server.status_counts)} remaining={server.app_remaining}"
+                )
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,30 +2,100 @@
 
 from __future__ import annotations
 
+import asyncio
+import csv
+import datetime
+import gzip
+import importlib.util
+import json
+import logging
 import os
+import shutil
+import socket
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Mapping, Optional
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
 
 import pytest
+import requests
+from urllib3.exceptions import MaxRetryError
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
+from package.bin.ta_pushover.attachments import AttachmentCache, MultipartBody  # noqa: E402
+from package.bin.ta_pushover.credential_cache import CredentialCache  # noqa: E402
+from package.bin.ta_pushover.delivery_service import (  # noqa: E402
+    DeliveryService,
+    shared_rate_scheduler,
+)
+from package.bin.ta_pushover.digest import DigestPacker, parse_separator  # noqa: E402
+from package.bin.ta_pushover.handoff import (  # noqa: E402
+    default_socket_path,
+    hand_off,
+    service_running,
+)
+from package.bin.ta_pushover.instrumentation import DeliveryMetrics  # noqa: E402
+from package.bin.ta_pushover.log_sampling import LogSampler  # noqa: E402
 from package.bin.ta_pushover.modalert_pushover_helper import process_event  # noqa: E402
+from package.bin.ta_pushover.outbox import (  # noqa: E402
+    DEFERRED_RESPONSE,
+    Outbox,
+    OutboxDeferral,
+    replay,
+)
+from package.bin.ta_pushover.pushover_async import AsyncPushoverClient  # noqa: E402
+from package.bin.ta_pushover.quota_ledger import QuotaLedger, token_key  # noqa: E402
 from package.bin.ta_pushover.pushover_common import (  # noqa: E402
     PushoverClient,
+    build_session,
     event_value_or_literal,
     extract_account_credentials,
     parse_priority,
+    redact,
+)
+from package.bin.ta_pushover.rate_limit import (  # noqa: E402
+    LEDGER_SYNC_SECONDS,
+    QuotaBudget,
+    QuotaExhaustedError,
+    RateScheduler,
 )
+from package.bin.ta_pushover.receipts import (  # noqa: E402
+    ReceiptClient,
+    ReceiptRecorder,
+    ReceiptStore,
+    poll_receipts,
+)
+from package.bin.ta_pushover.resolution import CompiledField, ResolutionPlan  # noqa: E402
+from package.bin.ta_pushover.results import iter_results_file, prefetch  # noqa: E402
+from package.bin.ta_pushover.send_queue import PrioritySendQueue  # noqa: E402
+from package.bin.ta_pushover.suppression import SuppressionStore  # noqa: E402
+from package.bin.ta_pushover.retry import (  # noqa: E402
+    RetryableError,
+    RetryPolicy,
+    RetryStats,
+    parse_retry_after,
+)
+from fake_pushover import FakePushoverServer, fixed_latency  # noqa: E402
 
 
 class _FakeResponse:
-    def __init__(self, status_code: int, payload: Dict[str, Any], text: str = "") -> None:
+    def __init__(
+        self,
+        status_code: int,
+        payload: Dict[str, Any],
+        text: str = "",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
         self.status_code = status_code
         self._payload = payload
         self.text = text
+        self.headers = dict(headers or {})
+        self.elapsed = datetime.timedelta(milliseconds=5)
 
     def json(self) -> Dict[str, Any]:
         return self._payload
@@ -43,6 +113,7 @@ class _FakeHelper:
         self._account = dict(account)
         self._events = list(events or [])
         self.logged: List[str] = []
+        self.results_file: Optional[str] = None
 
     def get_param(self, key: str) -> Optional[str]:
         return self._params.get(key)
@@ -75,9 +146,56 @@ def test_event_value_or_literal() -> None:
     assert event_value_or_literal("", event) is None
 
 
+def test_resolution_plan_matches_event_value_or_literal() -> None:
+    params = {
+        "message": "message",
+        "priority": "priority",
+        "title": "literal title",
+        "sound": "",
+        "html": "html",
+    }
+    plan = ResolutionPlan(params.get, {"token": "token", "user": "user"})
+    events: List[Dict[str, Any]] = [
+        {"message": "hello", "priority": 2, "html": "true"},
+        {"message": "hello", "priority": "-1", "title": "from event"},
+        {"priority": "0", "literal title": "from renamed field"},
+    ]
+
+    for event in events:
+        payload = plan.render(event)
+        assert payload["message"] == event_value_or_literal("message", event)
+        assert payload["title"] == event_value_or_literal("literal title", event)
+        assert payload["sound"] is None
+        assert payload["token"] == "token"
+    assert [plan.render(event)["priority"] for event in events] == [2, -1, 0]
+    assert [plan.render(event)["html"] for event in events] == [True, False, False]
+    assert plan.render(events[2])["message"] == "message"
+
+
+def test_resolution_plan_interpolates_result_tokens() -> None:
+    field = CompiledField("$result.host$ is $result.state$!", lambda value: value)
+    assert field.resolve({"host": "web1", "state": "down"}) == "web1 is down!"
+    assert field.resolve({"host": "web1"}) == "web1 is !"
+
+    priority = CompiledField("$result.urgency$", lambda value: parse_priority(value))
+    assert priority.resolve({"urgency": 1}) == 1
+
+
+def test_resolution_plan_validates_literals_lazily() -> None:
+    plan = ResolutionPlan({"message": "message", "priority": "urgency"}.get)
+    # "urgency" is not a valid priority literal, but every result supplies the field.
+    assert plan.render({"urgency": "-1"})["priority"] == -1
+    with pytest.raises(ValueError):
+        plan.render({})
+
+
 def test_extract_account_credentials_supports_ucc_and_legacy_shapes() -> None:
     assert extract_account_credentials({"user": "u", "app_token": "t"}) == ("u", "t")
     assert extract_account_credentials({"username": "u", "password": "t"}) == ("u", "t")
+    assert extract_account_credentials({"user": " u1, u2 ,u1,", "app_token": "t"}) == (
+        "u1,u2",
+        "t",
+    )
     with pytest.raises(ValueError):
         extract_account_credentials({"user": "u"})
 
@@ -85,13 +203,17 @@ def test_extract_account_credentials_supports_ucc_and_legacy_shapes() -> None:
 def test_pushover_client_send_success(monkeypatch: pytest.MonkeyPatch) -> None:
     captured: Dict[str, Any] = {}
 
-    def _fake_post(url: str, json: Dict[str, Any], timeout: int) -> _FakeResponse:
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self
         captured["url"] = url
-        captured["json"] = json
+        captured["json"] = json.loads(data)
+        captured["headers"] = headers
         captured["timeout"] = timeout
         return _FakeResponse(200, {"status": 1, "request": "abc123"})
 
-    monkeypatch.setattr("requests.post", _fake_post)
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
 
     response = PushoverClient().send(
         token="token",
@@ -106,17 +228,397 @@ def test_pushover_client_send_success(monkeypatch: pytest.MonkeyPatch) -> None:
     assert captured["json"]["priority"] == "1"
     assert captured["json"]["message"] == "hello"
     assert captured["json"]["sound"] == "none"
+    assert captured["headers"] == {"Content-Type": "application/json"}
 
 
 def test_pushover_client_send_failure(monkeypatch: pytest.MonkeyPatch) -> None:
-    def _fake_post(url: str, json: Dict[str, Any], timeout: int) -> _FakeResponse:
-        del url, json, timeout
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
         return _FakeResponse(400, {"status": 0, "errors": ["bad request"]})
 
-    monkeypatch.setattr("requests.post", _fake_post)
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+
+    with pytest.raises(ValueError, match="Pushover rejected message"):
+        PushoverClient().send(token="token", user="user", message="hello")
+
+
+def test_pushover_client_reuses_pooled_session(monkeypatch: pytest.MonkeyPatch) -> None:
+    sessions: List[requests.Session] = []
+
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del url, data, headers, timeout
+        sessions.append(self)
+        return _FakeResponse(200, {"status": 1})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+
+    with PushoverClient(pool_size=2, verify=False) as client:
+        client.send(token="token", user="user", message="one")
+        client.send(token="token", user="user", message="two")
+
+    assert len(sessions) == 2
+    assert sessions[0] is sessions[1]
+    assert sessions[0].verify is False
+    with pytest.raises(ValueError):
+        build_session(pool_size=0)
+
+
+def test_pushover_client_leaves_shared_session_open() -> None:
+    closed: List[bool] = []
+
+    class _TrackingSession(requests.Session):
+        def close(self) -> None:
+            closed.append(True)
+            super().close()
+
+    shared = _TrackingSession()
+    with PushoverClient(session=shared) as client:
+        assert client.session is shared
+    assert not closed
+
+
+def test_pushover_client_tracks_quota_headers(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
+        return _FakeResponse(
+            200,
+            {"status": 1},
+            headers={
+                "X-Limit-App-Limit": "10000",
+                "X-Limit-App-Remaining": "7496",
+                "X-Limit-App-Reset": "1393653600",
+            },
+        )
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+
+    client = PushoverClient()
+    assert client.rate_scheduler.budget is None
+    client.send(token="token", user="user", message="hello")
+    assert client.rate_scheduler.budget == QuotaBudget(10000, 7496, 1393653600)
+
+
+def test_rate_scheduler_paces_remaining_quota() -> None:
+    now = [1000.0]
+    scheduler = RateScheduler(burst=2, max_wait_seconds=60, clock=lambda: now[0])
+    # No headers seen yet, so nothing to pace against.
+    assert scheduler.reserve() == 0
+
+    # 100 messages left over 1000 seconds is one message every 10 seconds.
+    scheduler.update_from_headers(
+        {
+            "x-limit-app-limit": "10000",
+            "x-limit-app-remaining": "100",
+            "x-limit-app-reset": "2000",
+        }
+    )
+    assert scheduler.refill_rate() == pytest.approx(0.1)
+    # The burst goes out immediately, then sends are spaced by the refill rate.
+    assert scheduler.reserve() == 0
+    assert scheduler.reserve() == 0
+    assert scheduler.reserve() == pytest.approx(1000 / 98)
+    budget = scheduler.budget
+    assert budget is not None and budget.remaining == 97
+
+    now[0] += 30
+    assert scheduler.reserve() == 0
+
+
+def test_rate_scheduler_paces_only_near_the_limit() -> None:
+    now = [0.0]
+    scheduler = RateScheduler(burst=1, max_wait_seconds=5, clock=lambda: now[0])
+    scheduler.update_from_headers(
+        {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": "1002",
+            "X-Limit-App-Reset": "1000000",
+        }
+    )
+    # Well above a tenth of the limit, sends are not spread over the month.
+    assert [scheduler.reserve() for _ in range(2)] == [0, 0]
+    assert scheduler.reserve() == 0
+    with pytest.raises(QuotaExhaustedError, match="over the 5s limit"):
+        scheduler.reserve()
+
+
+def test_rate_scheduler_defers_beyond_max_wait() -> None:
+    now = [0.0]
+    scheduler = RateScheduler(burst=1, max_wait_seconds=5, clock=lambda: now[0])
+    scheduler.update_from_headers(
+        {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": "10",
+            "X-Limit-App-Reset": "1000",
+        }
+    )
+    assert scheduler.reserve() == 0
+    with pytest.raises(QuotaExhaustedError, match="over the 5s limit"):
+        scheduler.reserve()
+    # Emergencies are never refused; Pushover gets the final word.
+    assert scheduler.reserve(urgent=True) == 0
+
+    scheduler.update_from_headers(
+        {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": "0",
+            "X-Limit-App-Reset": "1000",
+        }
+    )
+    with pytest.raises(QuotaExhaustedError, match="used up"):
+        scheduler.reserve()
+    assert scheduler.reserve(urgent=True) == 0
+
+
+def test_quota_ledger_shares_budget_between_schedulers(tmp_path: Path) -> None:
+    path = str(tmp_path / "quota.ledger")
+    now = [1000.0]
+
+    def _scheduler(app_token: str) -> RateScheduler:
+        ledger = QuotaLedger(path, app_token, clock=lambda: now[0])
+        return RateScheduler(burst=2, max_wait_seconds=2000, clock=lambda: now[0], ledger=ledger)
+
+    first = _scheduler("azGDORePK8gMaC0QOYAMyEEuzJnyUi")
+    second = _scheduler("azGDORePK8gMaC0QOYAMyEEuzJnyUi")
+    other_app = _scheduler("bzGDORePK8gMaC0QOYAMyEEuzJnyUi")
+    first.update_from_headers(
+        {"X-Limit-App-Limit": "10000", "X-Limit-App-Remaining": "3", "X-Limit-App-Reset": "2000"}
+    )
+
+    # The second process has never seen a response, yet paces against the shared budget.
+    assert second.reserve() == 0
+    assert second.budget == QuotaBudget(10000, 2, 2000)
+    assert first.reserve() == 0
+    # The shared burst of 2 is used up, so the third send waits for a refill.
+    assert second.reserve() == pytest.approx(1000)
+    with pytest.raises(QuotaExhaustedError, match="used up"):
+        first.reserve()
+    assert other_app.reserve() == 0
+
+    ledger = first.ledger
+    assert ledger is not None and ledger.recent_sends() == 3
+    assert "azGDORe" not in Path(path).read_text()
+
+
+def test_quota_ledger_serialises_concurrent_reservations(tmp_path: Path) -> None:
+    path = str(tmp_path / "quota.ledger")
+    RateScheduler(ledger=QuotaLedger(path, "token")).update_from_headers(
+        {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": "100",
+            "X-Limit-App-Reset": str(int(time.time()) + 3600),
+        }
+    )
+    reserved: List[int] = []
+
+    def _process() -> None:
+        scheduler = RateScheduler(ledger=QuotaLedger(path, "token"))
+        count = 0
+        while True:
+            try:
+                scheduler.reserve()
+            except QuotaExhaustedError:
+                break
+            count += 1
+        reserved.append(count)
+
+    threads = [threading.Thread(target=_process) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(reserved) == 100
+
+
+def test_quota_ledger_is_synced_rarely_far_from_the_limit(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    now = [1000.0]
+    ledger = QuotaLedger(str(tmp_path / "quota.ledger"), "token", clock=lambda: now[0])
+    locked: List[float] = []
+    entry = ledger.entry
+
+    def _counted_entry() -> Any:
+        locked.append(now[0])
+        return entry()
+
+    monkeypatch.setattr(ledger, "entry", _counted_entry)
+    scheduler = RateScheduler(burst=5, clock=lambda: now[0], ledger=ledger)
+
+    def _headers(remaining: int) -> Dict[str, str]:
+        return {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": str(remaining),
+            "X-Limit-App-Reset": "5000",
+        }
+
+    scheduler.update_from_headers(_headers(9000))
+    for _ in range(500):
+        assert scheduler.reserve() == 0
+        scheduler.update_from_headers(_headers(9000))
+    assert len(locked) == 1
+    now[0] += LEDGER_SYNC_SECONDS
+    scheduler.reserve()
+    assert len(locked) == 2
+    assert scheduler.recent_sends() == 501
+
+    # Near the pacing threshold every booking goes through the ledger again.
+    scheduler.update_from_headers(_headers(1500))
+    locked.clear()
+    for _ in range(3):
+        scheduler.reserve()
+    assert len(locked) == 3
+
+    # Sends are kept as per-second counts, written whole through a rename.
+    stored = json.loads((tmp_path / "quota.ledger").read_text())
+    assert len(stored[token_key("token")]["sends"]) == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "quota.ledger",
+        "quota.ledger.lock",
+    ]
+
+
+def test_pushover_client_retries_throttling(monkeypatch: pytest.MonkeyPatch) -> None:
+    responses = [
+        _FakeResponse(429, {"status": 0}, headers={"Retry-After": "2"}),
+        _FakeResponse(503, {}, text="<html>unavailable</html>"),
+        _FakeResponse(200, {"status": 1}),
+    ]
+    slept: List[float] = []
+
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    monkeypatch.setattr(time, "sleep", slept.append)
+
+    stats = RetryStats()
+    client = PushoverClient(
+        retry_policy=RetryPolicy(base_delay_seconds=1, random_source=lambda: 0.5),
+        retry_stats=stats,
+    )
+    assert client.send(token="token", user="user", message="hello")["status"] == 1
+    # Retry-After is honoured, then attempt 2 backs off by half of 2 ** 1 seconds.
+    assert slept == [2.0, 1.0]
+    assert stats.retries == 2
+    assert stats.backoff_seconds == 3.0
+
+
+def test_pushover_client_does_not_retry_rejections(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: List[int] = []
+
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
+        calls.append(1)
+        return _FakeResponse(400, {"status": 0, "errors": ["user key is invalid"]})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
 
     with pytest.raises(ValueError, match="Pushover rejected message"):
         PushoverClient().send(token="token", user="user", message="hello")
+    assert len(calls) == 1
+
+
+def test_pushover_client_gives_up_after_max_attempts(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
+        # What requests raises when the connection could not be made at all.
+        raise requests.ConnectionError(
+            MaxRetryError(None, url="/1/messages.json", reason=OSError("connection refused"))  # type: ignore[arg-type]
+        )
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    monkeypatch.setattr(time, "sleep", lambda delay: None)
+
+    stats = RetryStats()
+    client = PushoverClient(retry_policy=RetryPolicy(max_attempts=3), retry_stats=stats)
+    with pytest.raises(RetryableError, match="connection refused"):
+        client.send(token="token", user="user", message="hello")
+    assert stats.retries == 2
+    assert stats.exhausted == 1
+
+
+def test_requests_that_may_have_been_delivered_are_not_retried() -> None:
+    stats = RetryStats()
+    with FakePushoverServer(latency=fixed_latency(0.5)) as server:
+        client = PushoverClient(
+            api_url=server.messages_url,
+            timeout_seconds=0.1,
+            retry_policy=RetryPolicy(max_attempts=3, base_delay_seconds=0),
+            retry_stats=stats,
+        )
+        with pytest.raises(ValueError, match="after it was sent"):
+            client.send(token="token", user="user", message="hello")
+
+        async def _send() -> Dict[str, Any]:
+            async with AsyncPushoverClient(
+                api_url=server.messages_url,
+                timeout_seconds=0.1,
+                retry_policy=RetryPolicy(max_attempts=3, base_delay_seconds=0),
+                retry_stats=stats,
+            ) as async_client:
+                return await async_client.send(token="token", user="user", message="hello")
+
+        with pytest.raises(ValueError, match="after it was sent"):
+            asyncio.run(_send())
+        time.sleep(0.5)
+
+    assert stats.retries == 0
+    assert server.request_counts["messages"] == 2
+
+
+def test_async_client_retries_failed_connects() -> None:
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+
+    stats = RetryStats()
+
+    async def _send() -> Dict[str, Any]:
+        async with AsyncPushoverClient(
+            api_url=f"http://127.0.0.1:{port}/1/messages.json",
+            retry_policy=RetryPolicy(max_attempts=3, base_delay_seconds=0),
+            retry_stats=stats,
+        ) as client:
+            return await client.send(token="token", user="user", message="hello")
+
+    with pytest.raises(RetryableError):
+        asyncio.run(_send())
+    assert stats.retries == 2
+
+
+def test_retry_policy_backoff() -> None:
+    policy = RetryPolicy(
+        max_attempts=5,
+        base_delay_seconds=1,
+        max_delay_seconds=4,
+        random_source=lambda: 1.0,
+    )
+    error = RetryableError("busy")
+    assert [policy.backoff_seconds(attempt, error) for attempt in range(1, 6)] == [
+        1,
+        2,
+        4,
+        4,
+        None,
+    ]
+    assert policy.backoff_seconds(1, RetryableError("busy", retry_after=60)) is None
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after(
+        "Wed, 21 Oct 2015 07:28:10 GMT", clock=lambda: 1445412480.0
+    ) == pytest.approx(10)
 
 
 def test_alert_process_event_sends(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -161,16 +663,1738 @@ def test_alert_process_event_sends(monkeypatch: pytest.MonkeyPatch) -> None:
     assert sent_payloads[0]["title"] == "my title"
 
 
-def test_alert_process_event_errors_on_missing_account_data() -> None:
+def test_alert_process_event_concurrent_delivery(monkeypatch: pytest.MonkeyPatch) -> None:
+    lock = threading.Lock()
+    sent_messages: List[str] = []
+    active = [0, 0]  # current, peak
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+            sent_messages.append(kwargs["message"])
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
     helper = _FakeHelper(
-        params={"account": "prod", "message": "hello"},
-        account={"user": "user_only"},
-        events=[],
+        params={"account": "prod", "message": "message", "delivery_workers": "3"},
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": f"event {index}"} for index in range(10)],
     )
-    with pytest.raises(ValueError, match="application token"):
+
+    assert process_event(helper) == 0
+    assert sorted(sent_messages) == sorted(f"event {index}" for index in range(10))
+    assert active[1] <= 3
+    assert helper.logged[-1] == (
+        "Sent 10 Pushover message(s) using account 'prod' (0 retried, 0.0s in backoff)."
+    )
+
+
+def test_alert_process_event_concurrent_stops_after_failure(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    attempted: List[str] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        attempted.append(kwargs["message"])
+        if kwargs["message"] == "event 0":
+            raise ValueError("Pushover rejected message: ['bad']")
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
+    taken: List[str] = []
+
+    def _events() -> Iterator[Dict[str, str]]:
+        for index in range(50):
+            taken.append(f"event {index}")
+            yield {"message": f"event {index}"}
+
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "message", "delivery_workers": "2"},
+        account={"user": "user_key", "app_token": "app_token"},
+    )
+    monkeypatch.setattr(helper, "get_events", _events)
+
+    with pytest.raises(ValueError, match="Pushover rejected message"):
+        process_event(helper)
+    assert len(attempted) < 50
+    # Nothing rendered is left behind unsent once the failure is seen.
+    assert sorted(attempted) == sorted(taken)
+
+
+def test_alert_process_event_rejects_invalid_delivery_workers() -> None:
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "hello", "delivery_workers": "0"},
+        account={"user": "user_key", "app_token": "app_token"},
+    )
+    with pytest.raises(ValueError, match="delivery_workers"):
         process_event(helper)
 
 
+async def _run_fake_api(
+    handler_payloads: List[Dict[str, Any]],
+    connections: List[int],
+    client_factory: Any,
+) -> Any:
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connections.append(1)
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            length = 0
+            for line in head.decode("latin-1").split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            payload = json.loads(await reader.readexactly(length))
+            handler_payloads.append(payload)
+            if payload["message"] == "truncate":
+                # Starts answering, then drops the connection halfway through.
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 30\r\n\r\n{\"sta")
+                await writer.drain()
+                break
+            if payload["message"] == "reject":
+                body = b'{"status": 0, "errors": ["message rejected"]}'
+            else:
+                body = b'{"status": 1, "request": "abc"}'
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(_handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        return await client_factory(f"http://127.0.0.1:{port}/1/messages.json")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_async_client_sends_over_pooled_connections() -> None:
+    payloads: List[Dict[str, Any]] = []
+    connections: List[int] = []
+
+    async def _send(api_url: str) -> int:
+        async with AsyncPushoverClient(api_url=api_url, concurrency=4) as client:
+            return await client.send_all(
+                {"token": "token", "user": "user", "message": f"event {index}", "priority": 1}
+                for index in range(20)
+            )
+
+    sent_count = asyncio.run(_run_fake_api(payloads, connections, _send))
+
+    assert sent_count == 20
+    assert len(payloads) == 20
+    assert payloads[0]["priority"] == "1"
+    assert len(connections) <= 4
+
+
+def test_async_client_does_not_resend_answered_requests() -> None:
+    payloads: List[Dict[str, Any]] = []
+    connections: List[int] = []
+
+    async def _send(api_url: str) -> None:
+        async with AsyncPushoverClient(
+            api_url=api_url,
+            concurrency=1,
+            retry_policy=RetryPolicy(max_attempts=3, base_delay_seconds=0),
+        ) as client:
+            await client.send(token="token", user="user", message="first")
+            # Goes out on the kept-alive connection, which the server cuts mid-response.
+            with pytest.raises(ValueError, match="after it was sent"):
+                await client.send(token="token", user="user", message="truncate")
+
+    asyncio.run(_run_fake_api(payloads, connections, _send))
+
+    assert [payload["message"] for payload in payloads] == ["first", "truncate"]
+    assert len(connections) == 1
+
+
+def test_async_client_reports_rejections() -> None:
+    async def _send(api_url: str) -> int:
+        async with AsyncPushoverClient(api_url=api_url, concurrency=2) as client:
+            return await client.send_all(
+                [{"token": "token", "user": "user", "message": "reject"}]
+            )
+
+    with pytest.raises(ValueError, match="Pushover rejected message"):
+        asyncio.run(_run_fake_api([], [], _send))
+
+
+def test_async_client_stops_taking_payloads_after_failure() -> None:
+    taken: List[str] = []
+    attempted: List[str] = []
+
+    def _payloads() -> Iterator[Dict[str, Any]]:
+        for index in range(50):
+            taken.append(f"event {index}")
+            yield {"token": "token", "user": "user", "message": f"event {index}"}
+
+    async def _send(**payload: Any) -> Dict[str, Any]:
+        attempted.append(payload["message"])
+        await asyncio.sleep(0)
+        if payload["message"] == "event 0":
+            raise ValueError("Pushover rejected message: ['bad']")
+        return {"status": 1}
+
+    async def _send_all() -> int:
+        async with AsyncPushoverClient(concurrency=2) as client:
+            return await client.send_all(_payloads(), _send)
+
+    with pytest.raises(ValueError, match="Pushover rejected message"):
+        asyncio.run(_send_all())
+    assert len(attempted) < 50
+    assert attempted == taken
+
+
+def test_async_client_shares_validation() -> None:
+    async def _send() -> Dict[str, Any]:
+        return await AsyncPushoverClient().send(
+            token="token", user="user", message="x" * 1025
+        )
+
+    with pytest.raises(ValueError, match="Length of message is too long"):
+        asyncio.run(_send())
+
+
+def test_alert_process_event_async_engine(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent_messages: List[str] = []
+
+    async def _fake_send(self: AsyncPushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        assert self.concurrency == 100
+        await asyncio.sleep(0)
+        sent_messages.append(kwargs["message"])
+        return {"status": 1}
+
+    monkeypatch.setattr(AsyncPushoverClient, "send", _fake_send)
+
+    helper = _FakeHelper(
+        params={
+            "account": "prod",
+            "message": "message",
+            "delivery_engine": "async",
+            "delivery_workers": "100",
+        },
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": f"event {index}"} for index in range(5)],
+    )
+
+    assert process_event(helper) == 0
+    assert len(sent_messages) == 5
+    assert helper.logged[-1] == (
+        "Sent 5 Pushover message(s) using account 'prod' (0 retried, 0.0s in backoff)."
+    )
+
+
+def test_async_engine_is_not_used_behind_a_proxy(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.example.com:3128")
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    monkeypatch.delenv("no_proxy", raising=False)
+    with pytest.raises(ValueError, match="use the sync engine"):
+        AsyncPushoverClient()
+
+    sent_messages: List[str] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        sent_messages.append(kwargs["message"])
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+    helper = _FakeHelper(
+        params={
+            "account": "prod",
+            "message": "message",
+            "delivery_engine": "async",
+            "delivery_workers": "100",
+        },
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": f"event {index}"} for index in range(3)],
+    )
+    assert process_event(helper) == 0
+    assert len(sent_messages) == 3
+    assert (
+        "The async delivery engine cannot send through the configured proxy, "
+        "using the sync engine." in helper.logged
+    )
+
+    monkeypatch.setenv("NO_PROXY", "api.pushover.net")
+    AsyncPushoverClient()
+
+
+def test_async_client_schedules_off_the_event_loop() -> None:
+    loop_threads: List[int] = []
+    scheduler_threads: List[int] = []
+
+    class _RecordingScheduler(RateScheduler):
+        def reserve(self, urgent: bool = False) -> float:
+            scheduler_threads.append(threading.get_ident())
+            return super().reserve(urgent)
+
+        def update_from_headers(self, headers: Mapping[str, str]) -> None:
+            scheduler_threads.append(threading.get_ident())
+            super().update_from_headers(headers)
+
+    async def _send(api_url: str) -> int:
+        loop_threads.append(threading.get_ident())
+        async with AsyncPushoverClient(
+            api_url=api_url, concurrency=2, rate_scheduler=_RecordingScheduler()
+        ) as client:
+            return await client.send_all(
+                {"token": "token", "user": "user", "message": f"event {index}"}
+                for index in range(4)
+            )
+
+    assert asyncio.run(_run_fake_api([], [], _send)) == 4
+    assert len(scheduler_threads) == 8
+    assert loop_threads[0] not in scheduler_threads
+
+
+def test_alert_process_event_coalesces_duplicates(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent_payloads: List[Dict[str, Any]] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        sent_payloads.append(kwargs)
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "message", "title": "title", "coalesce": "1"},
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[
+            {"message": "disk full", "title": "host1"},
+            {"message": "disk full", "title": "host2"},
+            {"message": "disk full", "title": "host1"},
+            {"message": "x" * 1024, "title": "host1"},
+            {"message": "x" * 1024, "title": "host1"},
+            {"message": "disk full", "title": "host1"},
+        ],
+    )
+
+    assert process_event(helper) == 0
+    assert [(payload["message"], payload["title"]) for payload in sent_payloads] == [
+        ("disk full (\u00d73)", "host1"),
+        ("disk full", "host2"),
+        ("x" * 1019 + " (\u00d72)", "host1"),
+    ]
+    assert helper.logged[-1].startswith("Sent 3 Pushover message(s)")
+
+
+def test_digest_packer_fills_messages_greedily() -> None:
+    payloads = [
+        {"message": f"line {index:03d}", "title": f"title {index}", "priority": index % 2}
+        for index in range(300)
+    ]
+    digests = list(DigestPacker(separator="\n").pack(payloads))
+
+    assert len(digests) == 3
+    assert all(len(digest["message"]) <= 1024 for digest in digests)
+    assert digests[0]["title"] == "title 0"
+    assert digests[0]["priority"] == 1
+    assert "\n".join(digest["message"] for digest in digests).split("\n") == [
+        payload["message"] for payload in payloads
+    ]
+
+
+def test_digest_packer_summarises_overflow() -> None:
+    payloads = [{"message": "x" * 400, "priority": 0} for _ in range(5)]
+    payloads.append({"message": "page me", "priority": 2})
+    digests = list(DigestPacker(separator=" | ", max_messages=2).pack(payloads))
+
+    assert len(digests) == 2
+    assert digests[0]["message"] == " | ".join(["x" * 400] * 2)
+    assert digests[1]["message"] == " | ".join(["x" * 400] * 2) + " | +2 more"
+    assert digests[1]["priority"] == 2
+    assert parse_separator("\\n--\\n") == "\n--\n"
+
+
+def test_alert_process_event_digest(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent_payloads: List[Dict[str, Any]] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        sent_payloads.append(kwargs)
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
+    helper = _FakeHelper(
+        params={
+            "account": "prod",
+            "message": "message",
+            "digest": "1",
+            "digest_separator": "\\n",
+        },
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": f"host{index} is down"} for index in range(50)],
+    )
+
+    assert process_event(helper) == 0
+    assert len(sent_payloads) == 1
+    assert sent_payloads[0]["message"].count("\n") == 49
+
+
+def _write_results_file(path: Path, rows: List[Dict[str, str]]) -> str:
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as results_handle:
+        writer = csv.DictWriter(results_handle, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_iter_results_file_projects_columns(tmp_path: Path) -> None:
+    results_file = _write_results_file(
+        tmp_path / "results.csv.gz",
+        [
+            {"message": "one", "host": "web1", "_raw": "x" * 100, "__mv_host": "", "rid": "0"},
+            {"message": "two", "host": "web2", "_raw": "y" * 100, "__mv_host": "", "rid": "1"},
+        ],
+    )
+
+    assert list(iter_results_file(results_file, frozenset({"message"}))) == [
+        {"message": "one", "rid": "0"},
+        {"message": "two", "rid": "1"},
+    ]
+    assert list(iter_results_file(results_file))[1] == {
+        "message": "two",
+        "host": "web2",
+        "_raw": "y" * 100,
+        "rid": "1",
+    }
+
+
+def test_prefetch_applies_backpressure() -> None:
+    produced: List[int] = []
+
+    def _rows() -> Iterator[int]:
+        for index in range(100):
+            produced.append(index)
+            yield index
+
+    consumed = prefetch(_rows(), max_items=5)
+    assert next(consumed) == 0
+    time.sleep(0.05)
+    # One item handed out, five queued and one waiting to be queued.
+    assert len(produced) <= 7
+    assert list(consumed) == list(range(1, 100))
+
+
+def test_prefetch_reraises_reader_errors() -> None:
+    def _rows() -> Iterator[int]:
+        yield 1
+        raise OSError("Not a gzipped file")
+
+    with pytest.raises(OSError, match="Not a gzipped file"):
+        list(prefetch(_rows()))
+
+
+def test_alert_process_event_streams_results_file(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    sent_payloads: List[Dict[str, Any]] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        sent_payloads.append(kwargs)
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "$result.host$ is down", "title": "title"},
+        account={"user": "user_key", "app_token": "app_token"},
+    )
+    helper.results_file = _write_results_file(
+        tmp_path / "results.csv.gz",
+        [{"host": f"web{index}", "title": "Outage", "_raw": "-"} for index in range(3)],
+    )
+
+    assert process_event(helper) == 0
+    assert [payload["message"] for payload in sent_payloads] == [
+        "web0 is down",
+        "web1 is down",
+        "web2 is down",
+    ]
+    assert sent_payloads[0]["title"] == "Outage"
+
+
+def test_outbox_stores_payloads_without_secrets(tmp_path: Path) -> None:
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    outbox.put("prod", {"token": "secret", "user": "key", "message": "one", "priority": 1})
+    outbox.put("prod", {"token": "secret", "user": "key", "message": "two", "priority": 0})
+
+    entries = outbox.peek(10)
+    assert [entry.payload for entry in entries] == [
+        {"message": "one", "priority": 1},
+        {"message": "two", "priority": 0},
+    ]
+    outbox.close()
+    assert b"secret" not in (tmp_path / "outbox.sqlite3").read_bytes()
+
+
+def test_outbox_enforces_caps(tmp_path: Path) -> None:
+    now = [1000.0]
+    outbox = Outbox(
+        str(tmp_path / "outbox.sqlite3"),
+        max_rows=5,
+        max_bytes=400,
+        max_age_seconds=60,
+        clock=lambda: now[0],
+    )
+    for index in range(8):
+        outbox.put("prod", {"message": f"message {index}"})
+    assert [entry.payload["message"] for entry in outbox.peek(10)] == [
+        f"message {index}" for index in range(3, 8)
+    ]
+
+    outbox.put("prod", {"message": "x" * 300})
+    assert [entry.payload["message"][:9] for entry in outbox.peek(10)] == [
+        "message 5",
+        "message 6",
+        "message 7",
+        "x" * 9,
+    ]
+
+    now[0] += 120
+    outbox.put("prod", {"message": "fresh"})
+    assert [entry.payload["message"] for entry in outbox.peek(10)] == ["fresh"]
+
+
+def test_outbox_keeps_its_totals_while_draining(tmp_path: Path) -> None:
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"), max_rows=5, max_bytes=10_000)
+    for index in range(5):
+        outbox.put("prod", {"message": f"old {index}"})
+    outbox.remove([entry.entry_id for entry in outbox.peek(3)])
+    # Room for three again: nothing is dropped to make it.
+    for index in range(3):
+        outbox.put("prod", {"message": f"new {index}"})
+    assert [entry.payload["message"] for entry in outbox.peek(10)] == [
+        "old 3",
+        "old 4",
+        "new 0",
+        "new 1",
+        "new 2",
+    ]
+    outbox.put("prod", {"message": "one too many"})
+    assert len(outbox) == 5
+    assert outbox.peek(1)[0].payload["message"] == "old 4"
+
+
+def test_outbox_replay_keeps_order(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    for message in ("one", "bad", "two", "three"):
+        outbox.put("prod", {"message": message})
+
+    sent: List[Dict[str, Any]] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        if kwargs["message"] == "bad":
+            raise ValueError("Pushover rejected message: ['bad']")
+        if kwargs["message"] == "three":
+            raise RetryableError("Pushover returned retryable HTTP status 503")
+        sent.append(kwargs)
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
+    result = replay(outbox, PushoverClient(), lambda account: ("user_key", "app_token"))
+
+    assert (result.sent, result.rejected, result.remaining) == (2, 1, 1)
+    assert [payload["message"] for payload in sent] == ["one", "two"]
+    assert sent[0]["token"] == "app_token"
+    assert outbox.peek(10)[0].attempts == 1
+
+
+def test_outbox_replay_keeps_entries_of_unresolved_accounts(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    for account, message in (("gone", "one"), ("prod", "two"), ("gone", "three")):
+        outbox.put(account, {"message": message})
+
+    sent: List[str] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        sent.append(kwargs["message"])
+        return {"status": 1}
+
+    def _resolve(account: str) -> Tuple[str, str]:
+        if account == "gone":
+            raise ValueError("Account 'gone' was not found")
+        return ("user_key", "app_token")
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+
+    result = replay(outbox, PushoverClient(), _resolve, batch_size=1)
+
+    assert sent == ["two"]
+    assert (result.sent, result.rejected, result.remaining) == (1, 0, 2)
+    assert [(entry.payload["message"], entry.attempts) for entry in outbox.peek(10)] == [
+        ("one", 1),
+        ("three", 1),
+    ]
+
+
+def test_outbox_replay_is_paced_by_the_shared_quota(tmp_path: Path) -> None:
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    for message in ("one", "two"):
+        outbox.put("prod", {"message": message})
+    ledger = QuotaLedger(str(tmp_path / "quota.ledger"), "app_token")
+    # An alert process already spent the budget this app token shares.
+    RateScheduler(ledger=ledger).update_from_headers(
+        {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": "0",
+            "X-Limit-App-Reset": str(int(time.time()) + 3600),
+        }
+    )
+    tokens: List[str] = []
+
+    def _scheduler_for(app_token: str) -> RateScheduler:
+        tokens.append(app_token)
+        return RateScheduler(burst=10, ledger=ledger)
+
+    result = replay(
+        outbox,
+        PushoverClient(api_url="http://127.0.0.1:9/1/messages.json"),
+        lambda account: ("user_key", "app_token"),
+        rate_scheduler_for=_scheduler_for,
+    )
+
+    assert tokens == ["app_token"]
+    assert (result.sent, result.rejected, result.remaining) == (0, 0, 2)
+    assert outbox.peek(1)[0].attempts == 1
+
+
+def test_alert_process_event_defers_to_outbox(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    attempts: List[str] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        attempts.append(kwargs["message"])
+        if kwargs["message"] == "event 0":
+            return {"status": 1}
+        raise RetryableError("Pushover request failed: connection refused")
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+    monkeypatch.setenv("SPLUNK_HOME", str(tmp_path))
+
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "message", "outbox": "1"},
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": f"event {index}"} for index in range(5)],
+    )
+
+    assert process_event(helper) == 0
+    # The circuit opens after the first failure, the rest are not attempted.
+    assert attempts == ["event 0", "event 1"]
+    assert "Deferred 4 Pushover message(s) to the outbox for later delivery." in helper.logged
+    assert helper.logged[-1].startswith("Sent 1 Pushover message(s)")
+
+    outbox = Outbox(str(tmp_path / "var" / "lib" / "splunk" / "TA-pushover" / "outbox.sqlite3"))
+    assert [entry.payload["message"] for entry in outbox.peek(10)] == [
+        f"event {index}" for index in range(1, 5)
+    ]
+
+
+def test_credential_cache_expires_and_follows_account_changes(tmp_path: Path) -> None:
+    now = [1000.0]
+    conf_path = tmp_path / "ta_pushover_account.conf"
+    conf_path.write_text("[prod]\n")
+    cache = CredentialCache(watched_paths=[str(conf_path)], ttl_seconds=60, clock=lambda: now[0])
+
+    assert cache.get("prod") is None
+    cache.put("prod", ("user_key", "app_token_value"))
+    assert cache.get("prod") == ("user_key", "app_token_value")
+    # Nothing is kept on disk.
+    assert [path.name for path in tmp_path.iterdir()] == ["ta_pushover_account.conf"]
+
+    now[0] += 61
+    assert cache.get("prod") is None
+
+    cache.put("prod", ("user_key", "app_token_value"))
+    conf_path.write_text("[prod]\napp_token = ********\n")
+    assert cache.get("prod") is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_alert_process_event_looks_the_account_up_every_run(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    sent: List[Tuple[str, str]] = []
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        sent.append((kwargs["token"], kwargs["user"]))
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+    monkeypatch.setenv("SPLUNK_HOME", str(tmp_path))
+
+    # Each alert run is a fresh process with nothing carried over, so every
+    # run asks splunkd and an edited account takes effect right away.
+    helpers = [
+        _FakeHelper(
+            params={"account": "prod", "message": "hello"},
+            account={"user": "user_key", "app_token": app_token},
+        )
+        for app_token in ("old_token", "new_token")
+    ]
+    for helper in helpers:
+        lookups: List[str] = []
+        lookup = helper.get_user_credential_by_account_id
+
+        def _counted(account_id: str, lookup: Any = lookup, lookups: List[str] = lookups) -> Any:
+            lookups.append(account_id)
+            return lookup(account_id)
+
+        monkeypatch.setattr(helper, "get_user_credential_by_account_id", _counted)
+        assert process_event(helper) == 0
+        assert lookups == ["prod"]
+        assert not any("cache" in line for line in helper.logged)
+    assert sent == [("old_token", "user_key"), ("new_token", "user_key")]
+
+
+def test_alert_process_event_errors_on_missing_account_data() -> None:
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "hello"},
+        account={"user": "user_only"},
+        events=[],
+    )
+    with pytest.raises(ValueError, match="application token"):
+        process_event(helper)
+
+
+def test_fake_pushover_simulates_quota_headers() -> None:
+    with FakePushoverServer(app_limit=100) as server:
+        with PushoverClient(api_url=server.messages_url) as client:
+            for index in range(3):
+                client.send(token="token", user="user", message=f"event {index}")
+            with pytest.raises(ValueError, match="Pushover rejected message"):
+                client.send(token="token", user="", message="no user")
+
+        limits = requests.get(f"{server.url}/1/apps/limits.json", params={"token": "token"})
+
+    assert [message["message"] for message in server.messages] == [
+        "event 0",
+        "event 1",
+        "event 2",
+    ]
+    budget = client.rate_scheduler.budget
+    assert budget is not None and (budget.limit, budget.remaining) == (100, 97)
+    assert limits.json()["remaining"] == 97
+    assert server.request_counts == {"messages": 4, "limits": 1}
+    assert server.status_counts == {200: 4, 400: 1}
+
+
+def test_fake_pushover_fault_injection_is_retried() -> None:
+    retry_stats = RetryStats()
+    with FakePushoverServer(throttle_rate=0.3, error_rate=0.2, retry_after="0", seed=7) as server:
+        with PushoverClient(
+            api_url=server.messages_url,
+            retry_policy=RetryPolicy(max_attempts=20, base_delay_seconds=0),
+            retry_stats=retry_stats,
+        ) as client:
+            for index in range(20):
+                client.send(token="token", user="user", message=f"event {index}")
+
+    assert len(server.messages) == 20
+    assert server.status_counts[429] > 0 and server.status_counts[503] > 0
+    assert retry_stats.retries == server.status_counts[429] + server.status_counts[503]
+    assert server.request_total == 20 + retry_stats.retries
+
+
+def test_fake_pushover_receipts() -> None:
+    with FakePushoverServer(acknowledge_after_seconds=0) as server:
+        response = requests.post(
+            server.messages_url,
+            data={
+                "token": "token",
+                "user": "user",
+                "message": "down",
+                "priority": "2",
+                "retry": "60",
+                "expire": "3600",
+                "tags": "host01",
+            },
+        )
+        receipt = response.json()["receipt"]
+        status = requests.get(f"{server.url}/1/receipts/{receipt}.json").json()
+        cancelled = requests.post(f"{server.url}/1/receipts/cancel_by_tag/host01.json").json()
+
+    assert status["acknowledged"] == 1 and status["expired"] == 0
+    assert cancelled["canceled"] == 1
+
+
+def test_delivery_metrics_time_sends_and_errors() -> None:
+    metrics = DeliveryMetrics()
+    with FakePushoverServer(throttle_rate=0.4, retry_after="0", seed=3) as server:
+        with PushoverClient(
+            api_url=server.messages_url,
+            retry_policy=RetryPolicy(max_attempts=20, base_delay_seconds=0),
+            metrics=metrics,
+        ) as client:
+            for index in range(5):
+                client.send(token="token", user="user", message=f"event {index}")
+
+    throttled = server.status_counts[429]
+    assert throttled > 0
+    assert (metrics.sent, metrics.failed, metrics.attempts) == (5, 0, 5 + throttled)
+    assert metrics.errors == {"RetryableError": throttled}
+    assert metrics.new_connections == 1
+    assert sum(metrics.buckets) == 5
+    assert {"build", "rate_wait", "network", "client"} <= set(metrics.phase_seconds)
+
+    summary = metrics.summary(engine="sync")
+    assert summary.startswith("engine=sync sent=5 failed=0 ")
+    assert f'errors="RetryableError:{throttled}"' in summary
+
+
+def test_async_delivery_metrics_time_connections() -> None:
+    metrics = DeliveryMetrics()
+
+    async def _send(api_url: str) -> int:
+        async with AsyncPushoverClient(api_url=api_url, concurrency=2, metrics=metrics) as client:
+            return await client.send_all(
+                {"token": "token", "user": "user", "message": f"event {index}"}
+                for index in range(6)
+            )
+
+    with FakePushoverServer() as server:
+        assert asyncio.run(_send(server.messages_url)) == 6
+
+    assert (metrics.sent, metrics.attempts) == (6, 6)
+    assert 1 <= metrics.new_connections <= 2
+    assert {"build", "rate_wait", "queue", "connect", "request"} <= set(metrics.phase_seconds)
+
+
+def test_alert_process_event_logs_delivery_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, headers, timeout
+        if json.loads(data)["message"] == "reject":
+            return _FakeResponse(400, {"status": 0, "errors": ["user key is invalid"]})
+        return _FakeResponse(200, {"status": 1})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "message", "instrumentation": "1"},
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": "hello"}, {"message": "again"}, {"message": "reject"}],
+    )
+    with pytest.raises(ValueError, match="user key is invalid"):
+        process_event(helper)
+
+    summary = helper.logged[-1]
+    assert summary.startswith(
+        "Pushover delivery metrics: engine=sync workers=1 retries=0 sent=2 failed=1 attempts=3 "
+    )
+    assert "latency_ms_le_25=3" in summary
+    assert "phase_render_ms=" in summary
+    assert summary.endswith('errors="ValueError:1"')
+
+
+def test_payload_debug_log_is_lazy_and_redacted(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    import package.bin.ta_pushover.pushover_common as pushover_common
+
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
+        return _FakeResponse(200, {"status": 1})
+
+    def _no_redact(data: Mapping[str, Any]) -> Dict[str, Any]:
+        raise AssertionError("payload serialised with debug logging off")
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    token = "azGDORePK8gMaC0QOYAMyEEuzJnyUi"
+    user = "uQiRzpo4DXghDmr9QzzfQu27cmVRsG"
+
+    with PushoverClient(logger=logging.getLogger("test_redaction")) as client:
+        caplog.set_level(logging.INFO, logger="test_redaction")
+        with monkeypatch.context() as patched:
+            patched.setattr(pushover_common, "redact", _no_redact)
+            client.send(token=token, user=user, message="hi")
+
+        caplog.set_level(logging.DEBUG, logger="test_redaction")
+        client.send(token=token, user=user, message="hi")
+
+    assert token not in caplog.text and user not in caplog.text
+    assert '"token": "****nyUi", "user": "****VRsG"' in caplog.text
+    assert redact({"user": "short", "message": "hi", "token": ""}) == {
+        "user": "****",
+        "message": "hi",
+        "token": "",
+    }
+
+
+def test_log_sampler_limits_each_kind() -> None:
+    sampler = LogSampler(limit=2)
+    assert [sampler.allow("http_status") for _ in range(4)] == [True, True, False, False]
+    assert sampler.allow("retry")
+    assert sampler.suppressed == {"http_status": 2}
+    assert LogSampler(limit=None).suppressed == {}
+    with pytest.raises(ValueError):
+        LogSampler(limit=-1)
+
+
+def test_alert_process_event_samples_per_event_logs(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, data, headers, timeout
+        return _FakeResponse(200, {"status": 1})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    caplog.set_level(logging.INFO)
+
+    helper = _FakeHelper(
+        params={"account": "prod", "message": "message", "per_event_log_limit": "2"},
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[{"message": f"event {index}"} for index in range(5)],
+    )
+    assert process_event(helper) == 0
+
+    assert caplog.text.count("Pushover HTTP status: 200") == 2
+    assert (
+        "Suppressed 3 per-event log line(s) over the limit of 2 per kind (http_status=3)."
+        in helper.logged
+    )
+
+
+def test_build_payload_emergency_fields() -> None:
+    payload = PushoverClient.build_payload(
+        token="token", user="user", message="down", priority=2, tags="host01, db,host01"
+    )
+    assert (payload["retry"], payload["expire"], payload["tags"]) == ("60", "3600", "host01,db")
+    assert "retry" not in PushoverClient.build_payload(
+        token="token", user="user", message="down", priority=1, retry=30
+    )
+    with pytest.raises(ValueError, match="retry"):
+        PushoverClient.build_payload(token="token", user="user", message="m", priority=2, retry=10)
+    with pytest.raises(ValueError, match="expire"):
+        PushoverClient.build_payload(
+            token="token", user="user", message="m", priority=2, expire=20000
+        )
+
+
+def test_message_encodes_like_a_dict_payload() -> None:
+    payload = PushoverClient.build_payload(
+        token="token", user="a,b", message="disk \u00e9 \"full\"", title="t", html=True
+    )
+    expected = {
+        "token": "token",
+        "user": "a,b",
+        "message": "disk \u00e9 \"full\"",
+        "priority": "0",
+        "title": "t",
+        "html": "1",
+    }
+    assert payload == expected
+    assert json.loads(payload.encode()) == expected
+    assert payload.encode() is payload.encode()
+    assert not hasattr(payload, "__dict__")
+
+    batch = payload.replace(user="c")
+    assert json.loads(batch.encode()) == dict(expected, user="c")
+    assert payload["user"] == "a,b"
+
+    payload["attachment"] = "/tmp/chart.png"
+    assert "attachment" not in json.loads(payload.encode())
+    del payload["title"]
+    assert "title" not in payload
+    with pytest.raises(ValueError, match="Length of title is too long 251 > 250"):
+        payload["title"] = "x" * 251
+    with pytest.raises(KeyError):
+        payload["colour"] = "red"
+
+
+def test_receipts_are_polled_until_acknowledged(tmp_path: Path) -> None:
+    def _resolve(account: str) -> tuple[str, str]:
+        assert account == "prod"
+        return "user", "token"
+
+    now = [1000.0]
+    store = ReceiptStore(str(tmp_path / "receipts.sqlite3"), clock=lambda: now[0])
+    recorder = ReceiptRecorder(store, "prod")
+    with FakePushoverServer(acknowledge_after_seconds=45, clock=lambda: now[0]) as server:
+        with PushoverClient(api_url=server.messages_url) as client:
+            send = recorder.wrap(client.send)
+            send(token="token", user="user", message="disk full", priority=2, tags="host01")
+            send(token="token", user="user", message="db down", priority=2, tags="db,host02")
+            send(token="token", user="user", message="fyi", priority=0)
+        assert (recorder.recorded, len(store)) == (2, 2)
+
+        receipts_url = f"{server.url}/1/receipts"
+        with ReceiptClient(api_url=receipts_url, request_interval_seconds=0) as receipts:
+            # Not due until a poll interval has passed.
+            assert poll_receipts(store, receipts, _resolve) == (0, 0, 0, 2)
+            assert server.request_counts["receipts"] == 0
+
+            now[0] += 30
+            assert poll_receipts(store, receipts, _resolve) == (0, 0, 0, 2)
+            assert receipts.cancel_by_tag("token", "db") == 1
+            assert store.remove_tagged("prod", "db") == 1
+
+            now[0] += 30
+            assert poll_receipts(store, receipts, _resolve) == (1, 0, 0, 0)
+        assert server.request_counts["receipts"] == 4
+    store.close()
+
+
+def test_deferred_emergencies_are_tracked_once_replayed(tmp_path: Path) -> None:
+    now = [1000.0]
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    store = ReceiptStore(str(tmp_path / "receipts.sqlite3"), clock=lambda: now[0])
+    logger = logging.getLogger(__name__)
+
+    def _unavailable(**payload: Any) -> Dict[str, Any]:
+        raise RetryableError("Pushover returned retryable HTTP status 503")
+
+    send = OutboxDeferral(outbox, "prod", logger, track_receipts=True).wrap(
+        ReceiptRecorder(store, "prod").wrap(_unavailable)
+    )
+    assert send(message="disk full", priority=2, tags="host01") == DEFERRED_RESPONSE
+    assert send(message="fyi", priority=0) == DEFERRED_RESPONSE
+    OutboxDeferral(outbox, "prod", logger).defer({"message": "untracked", "priority": 2})
+    assert len(store) == 0
+
+    with FakePushoverServer(acknowledge_after_seconds=45, clock=lambda: now[0]) as server:
+        with PushoverClient(api_url=server.messages_url) as client:
+            result = replay(outbox, client, lambda account: ("user", "token"), receipts=store)
+        assert (result.sent, result.remaining) == (3, 0)
+        assert len(store) == 1
+
+        def _splunkd_down(account: str) -> Tuple[str, str]:
+            raise requests.ConnectionError("splunkd is restarting")
+
+        now[0] += 30
+        receipts_url = f"{server.url}/1/receipts"
+        with ReceiptClient(api_url=receipts_url, request_interval_seconds=0) as receipts:
+            # An account that cannot be looked up right now is not a reason to give up.
+            assert poll_receipts(store, receipts, _splunkd_down) == (0, 0, 0, 1)
+            now[0] += 30
+            assert poll_receipts(store, receipts, lambda account: ("user", "token")) == (
+                1,
+                0,
+                0,
+                0,
+            )
+    store.close()
+    outbox.close()
+
+
+def test_alert_process_event_tracks_and_cancels_emergencies(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    posted: List[str] = []
+
+    def _fake_post(self: requests.Session, url: str, **kwargs: Any) -> _FakeResponse:
+        del self, kwargs
+        posted.append(url)
+        if "cancel_by_tag" in url:
+            return _FakeResponse(200, {"status": 1, "canceled": 1})
+        return _FakeResponse(200, {"status": 1, "receipt": f"r{len(posted)}"})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    monkeypatch.setenv("SPLUNK_HOME", str(tmp_path))
+    params = {
+        "account": "prod",
+        "message": "message",
+        "priority": "2",
+        "tags": "$result.host$",
+        "track_receipts": "1",
+    }
+    events = [{"message": "down", "host": "host01"}, {"message": "down", "host": "host02"}]
+
+    helper = _FakeHelper(params=params, account={"user": "u", "app_token": "t"}, events=events)
+    assert process_event(helper) == 0
+    assert "Tracking 2 emergency Pushover receipt(s) until acknowledged." in helper.logged
+    store = ReceiptStore(str(tmp_path / "var" / "lib" / "splunk" / "TA-pushover" / "receipts.sqlite3"))
+    assert len(store) == 2
+
+    posted.clear()
+    helper = _FakeHelper(
+        params=dict(params, cancel_emergency="1"),
+        account={"user": "u", "app_token": "t"},
+        events=events + [{"host": "host01"}],
+    )
+    assert process_event(helper) == 0
+    assert posted == [
+        "https://api.pushover.net/1/receipts/cancel_by_tag/host01.json",
+        "https://api.pushover.net/1/receipts/cancel_by_tag/host02.json",
+    ]
+    assert helper.logged[-1] == (
+        "Cancelled 2 emergency Pushover message(s) tagged host01, host02 using account 'prod'."
+    )
+    assert len(store) == 0
+    store.close()
+
+
+@pytest.fixture
+def short_splunk_home(monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    # Unix socket paths are limited to about 100 bytes, too few for tmp_path.
+    splunk_home = tempfile.mkdtemp(prefix="tap-")
+    monkeypatch.setenv("SPLUNK_HOME", splunk_home)
+    yield splunk_home
+    shutil.rmtree(splunk_home, ignore_errors=True)
+
+
+def test_alert_process_event_hands_off_to_delivery_service(short_splunk_home: str) -> None:
+    events = [{"message": f"event {index}"} for index in range(3)]
+    with FakePushoverServer() as server:
+        with PushoverClient(api_url=server.messages_url) as client:
+            with DeliveryService(client, lambda account: ("user_key", "app_token")) as service:
+                # No account record: the alert must not look its credentials up.
+                helper = _FakeHelper(
+                    params={"account": "prod", "message": "message"}, account={}, events=events
+                )
+                assert process_event(helper) == 0
+            # Leaving the service drains its queue.
+
+    assert helper.logged[-1] == (
+        "Handed 3 Pushover message(s) to the delivery service using account 'prod'."
+    )
+    assert sorted(message["message"] for message in server.messages) == [
+        "event 0",
+        "event 1",
+        "event 2",
+    ]
+    assert {(message["token"], message["user"]) for message in server.messages} == {
+        ("app_token", "user_key")
+    }
+    assert (service.accepted, service.sent, service.failed) == (3, 3, 0)
+    assert not os.path.exists(service.socket_path)
+
+
+def test_alert_process_event_falls_back_to_direct_sends(
+    monkeypatch: pytest.MonkeyPatch, short_splunk_home: str
+) -> None:
+    posted: List[str] = []
+
+    def _fake_post(self: requests.Session, url: str, **kwargs: Any) -> _FakeResponse:
+        del self, url
+        posted.append(json.loads(kwargs["data"])["message"])
+        return _FakeResponse(200, {"status": 1})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    events = [{"message": f"event {index}"} for index in range(3)]
+    params = {"account": "prod", "message": "message"}
+    account = {"user": "user_key", "app_token": "app_token"}
+
+    # A socket left behind by a service that is no longer running.
+    os.makedirs(os.path.dirname(default_socket_path()))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(default_socket_path())
+    assert os.path.exists(default_socket_path())
+    helper = _FakeHelper(params=params, account=account, events=events)
+    assert process_event(helper) == 0
+    assert posted == ["event 0", "event 1", "event 2"]
+    # Found stale and removed, so later alerts do not probe it again.
+    assert not os.path.exists(default_socket_path())
+
+    # A full service takes nothing; everything it turned down is still sent.
+    with PushoverClient() as client:
+        with DeliveryService(client, lambda account: ("u", "t"), max_queued=0):
+            result = hand_off(events, "prod", batch_size=2)
+            assert result.accepted == 0
+            assert list(result.remaining or []) == events
+
+            posted.clear()
+            helper = _FakeHelper(params=params, account=account, events=events)
+            assert process_event(helper) == 0
+    assert posted == ["event 0", "event 1", "event 2"]
+    assert helper.logged[-1] == (
+        "Sent 3 Pushover message(s) using account 'prod' (0 retried, 0.0s in backoff)."
+    )
+
+
+def test_delivery_service_paces_each_app_token(
+    monkeypatch: pytest.MonkeyPatch, short_splunk_home: str
+) -> None:
+    def _fake_post(self: requests.Session, url: str, **kwargs: Any) -> _FakeResponse:
+        del self, url
+        token = json.loads(kwargs["data"])["token"]
+        return _FakeResponse(
+            200,
+            {"status": 1},
+            headers={
+                "X-Limit-App-Limit": "10000",
+                "X-Limit-App-Remaining": "0" if token == "spent_token" else "9000",
+                "X-Limit-App-Reset": str(int(time.time()) + 3600),
+            },
+        )
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    accounts = {"spent": ("u", "spent_token"), "fresh": ("u", "fresh_token")}
+    with PushoverClient(rate_scheduler_for=shared_rate_scheduler) as client:
+        with DeliveryService(client, accounts.__getitem__) as service:
+            assert hand_off([{"message": "first"}], "spent").accepted == 1
+        with DeliveryService(client, accounts.__getitem__) as service:
+            assert hand_off([{"message": "over quota"}], "spent").accepted == 1
+            assert hand_off([{"message": "other app"}], "fresh").accepted == 1
+    assert (service.sent, service.failed) == (1, 1)
+
+    # The budget went through the host-wide ledger an alert process reads too.
+    alert_scheduler = RateScheduler(ledger=QuotaLedger.for_app("spent_token"))
+    with pytest.raises(QuotaExhaustedError):
+        alert_scheduler.reserve()
+
+
+def test_delivery_service_always_logs_failures(
+    monkeypatch: pytest.MonkeyPatch, short_splunk_home: str, caplog: pytest.LogCaptureFixture
+) -> None:
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        raise ValueError(f"Pushover rejected message: {kwargs['message']}")
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+    caplog.set_level(logging.INFO)
+    events = [{"message": f"event {index}"} for index in range(3)]
+    with PushoverClient(log_sampler=LogSampler(limit=1)) as client:
+        with DeliveryService(client, lambda account: ("u", "t")) as service:
+            assert service_running(service.socket_path)
+            assert hand_off(events, "prod").accepted == 3
+        client.log_sampler.log(client.logger, logging.INFO, "http_status", "status %s", 200)
+        client.log_sampler.log(client.logger, logging.INFO, "http_status", "status %s", 200)
+        service.start_log_window()
+        client.log_sampler.log(client.logger, logging.INFO, "http_status", "status %s", 200)
+
+    failures = [record for record in caplog.records if "delivery for account" in record.message]
+    assert len(failures) == 3
+    assert (
+        "Left out Pushover log lines over the limit of 1 per kind (http_status: 1)."
+        in caplog.messages
+    )
+    assert caplog.messages.count("status 200") == 2
+
+
+def test_suppression_store_expires_and_stays_bounded(tmp_path: Path) -> None:
+    now = [1000.0]
+    store = SuppressionStore(
+        str(tmp_path / "suppression.sqlite3"), max_entries=10, clock=lambda: now[0]
+    )
+    assert store.claim("incident", 60)
+    assert not store.claim("incident", 60)
+    now[0] += 61
+    assert store.claim("incident", 60)
+    store.release("incident")
+    assert store.claim("incident", 60)
+
+    for index in range(20):
+        now[0] += 1
+        assert store.claim(f"other{index}", 60)
+    assert len(store) <= 10
+    # The most recent fingerprints are kept, the ones closest to expiry went first.
+    assert not store.claim("other19", 60)
+    assert store.claim("other0", 60)
+    store.close()
+
+
+def test_alert_process_event_suppresses_repeats(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    responses = [_FakeResponse(200, {"status": 1})]
+    posted: List[str] = []
+
+    def _fake_post(self: requests.Session, url: str, **kwargs: Any) -> _FakeResponse:
+        del self, url
+        posted.append(json.loads(kwargs["data"])["message"])
+        return responses[0]
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    monkeypatch.setenv("SPLUNK_HOME", str(tmp_path))
+    account = {"user": "user_key", "app_token": "app_token"}
+
+    def _run(message: str, events: List[Dict[str, str]]) -> _FakeHelper:
+        helper = _FakeHelper(
+            params={
+                "account": "prod",
+                "message": message,
+                "title": "$result.host$",
+                "suppress_window": "600",
+            },
+            account=account,
+            events=events,
+        )
+        process_event(helper)
+        return helper
+
+    down = [{"message": "down", "host": "host01"}, {"message": "down", "host": "host02"}]
+    _run("message", down)
+    # Another search firing for the same incident, plus one new host.
+    helper = _run("message", down + [{"message": "down", "host": "host03"}])
+    assert posted == ["down", "down", "down"]
+    assert "Suppressed 2 Pushover message(s) already sent within the last 600s." in helper.logged
+
+    # A rejected send is not remembered, so the next firing tries again.
+    responses[0] = _FakeResponse(400, {"status": 0, "errors": ["invalid"]})
+    with pytest.raises(ValueError, match="invalid"):
+        _run("new", [{"message": "new", "host": "host04"}])
+    responses[0] = _FakeResponse(200, {"status": 1})
+    _run("new", [{"message": "new", "host": "host04"}])
+    assert posted[-2:] == ["new", "new"]
+
+    with pytest.raises(ValueError, match="suppress_fields"):
+        process_event(
+            _FakeHelper(
+                params={
+                    "account": "prod",
+                    "message": "m",
+                    "suppress_window": "60",
+                    "suppress_fields": "token",
+                },
+                account=account,
+            )
+        )
+
+
+def test_suppression_claims_only_messages_that_were_sent(
+    monkeypatch: pytest.MonkeyPatch, short_splunk_home: str
+) -> None:
+    posted: List[str] = []
+    failing = {"event 1", "event 2"}
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        if kwargs["message"] in failing:
+            raise RetryableError("Pushover request failed: connection reset")
+        posted.append(kwargs["message"])
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+    events = [{"message": f"event {index}"} for index in range(3)]
+    params = {"account": "prod", "message": "message", "suppress_window": "600"}
+    account = {"user": "user_key", "app_token": "app_token"}
+
+    # The delivery service takes the run but only gets the first message out.
+    with PushoverClient() as client:
+        with DeliveryService(client, lambda account: ("user_key", "app_token")) as service:
+            assert process_event(_FakeHelper(params=params, account={}, events=events)) == 0
+    assert posted == ["event 0"]
+    assert (service.sent, service.failed) == (1, 2)
+
+    # The next run, sending directly, only leaves out what was really sent.
+    failing.clear()
+    helper = _FakeHelper(params=params, account=account, events=events)
+    assert process_event(helper) == 0
+    assert posted == ["event 0", "event 1", "event 2"]
+    assert "Suppressed 1 Pushover message(s) already sent within the last 600s." in helper.logged
+    assert any(line.startswith("Sent 2 Pushover message(s)") for line in helper.logged)
+
+
+def test_priority_send_queue_orders_and_sheds(tmp_path: Path) -> None:
+    payloads = [
+        {"message": name, "priority": priority}
+        for name, priority in [("a", -1), ("b", 2), ("c", 0), ("d", -1), ("e", 2), ("f", -2)]
+    ]
+    assert [payload["message"] for payload in PrioritySendQueue(payloads, RateScheduler())] == [
+        "b",
+        "e",
+        "c",
+        "a",
+        "d",
+        "f",
+    ]
+
+    # Quota for three more sends: the lowest priorities go to the outbox.
+    scheduler = RateScheduler()
+    scheduler.update_from_headers(
+        {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": "3",
+            "X-Limit-App-Reset": str(int(time.time()) + 3600),
+        }
+    )
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    send_queue = PrioritySendQueue(payloads, scheduler, outbox=outbox, account="prod")
+    assert [payload["message"] for payload in send_queue] == ["b", "e", "c"]
+    assert send_queue.shed == {-2: 1, -1: 2}
+    assert list(send_queue.shed_reasons) == ["quota"]
+    assert [entry.payload["message"] for entry in outbox.peek(10)] == ["f", "d", "a"]
+    outbox.close()
+
+    # Past the deadline, only emergencies still go out; the rest is dropped.
+    send_queue = PrioritySendQueue(
+        payloads, RateScheduler(), deadline_at=10.0, clock=lambda: 11.0
+    )
+    assert [payload["message"] for payload in send_queue] == ["b", "e"]
+    assert send_queue.shed == {-2: 1, -1: 2, 0: 1}
+    assert list(send_queue.shed_reasons) == ["delivery deadline"]
+
+
+def test_alert_process_event_priority_queue_leaves_no_claims(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    posted: List[str] = []
+    failing = {"a"}
+
+    def _fake_send(self: PushoverClient, **kwargs: Any) -> Dict[str, Any]:
+        del self
+        if kwargs["message"] in failing:
+            raise ValueError("Pushover rejected message: ['invalid']")
+        posted.append(kwargs["message"])
+        return {"status": 1}
+
+    monkeypatch.setattr(PushoverClient, "send", _fake_send)
+    monkeypatch.setenv("SPLUNK_HOME", str(tmp_path))
+    events = [
+        {"message": name, "priority": priority}
+        for name, priority in [("b", "0"), ("a", "1"), ("c", "0"), ("d", "-1")]
+    ]
+
+    def _run() -> _FakeHelper:
+        helper = _FakeHelper(
+            params={
+                "account": "prod",
+                "message": "$result.message$",
+                "priority": "$result.priority$",
+                "priority_order": "1",
+                "suppress_window": "600",
+            },
+            account={"user": "user_key", "app_token": "app_token"},
+            events=events,
+        )
+        process_event(helper)
+        return helper
+
+    # The whole queue is buffered, then the run stops at the first message.
+    with pytest.raises(ValueError, match="invalid"):
+        _run()
+    assert posted == []
+
+    failing.clear()
+    helper = _run()
+    assert posted == ["a", "b", "c", "d"]
+    assert not any(line.startswith("Suppressed") for line in helper.logged)
+
+
+def test_alert_process_event_sends_by_priority(monkeypatch: pytest.MonkeyPatch) -> None:
+    posted: List[str] = []
+    reset_at = str(int(time.time()) + 3600)
+
+    def _fake_post(self: requests.Session, url: str, **kwargs: Any) -> _FakeResponse:
+        del self, url
+        posted.append(json.loads(kwargs["data"])["message"])
+        remaining = max(0, 2 - len(posted))
+        return _FakeResponse(
+            200,
+            {"status": 1},
+            headers={
+                "X-Limit-App-Limit": "10000",
+                "X-Limit-App-Remaining": str(remaining),
+                "X-Limit-App-Reset": reset_at,
+            },
+        )
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    monkeypatch.delenv("SPLUNK_HOME", raising=False)
+    helper = _FakeHelper(
+        params={
+            "account": "prod",
+            "message": "$result.message$",
+            "priority": "$result.priority$",
+            "quota_burst": "0",
+            "priority_order": "1",
+        },
+        account={"user": "user_key", "app_token": "app_token"},
+        events=[
+            {"message": "info", "priority": "-1"},
+            {"message": "page one", "priority": "2"},
+            {"message": "debug", "priority": "-2"},
+            {"message": "warning", "priority": "0"},
+            {"message": "page two", "priority": "2"},
+        ],
+    )
+
+    assert process_event(helper) == 0
+    # The quota left room for two sends, both taken by the pages in result order.
+    assert posted == ["page one", "page two"]
+    assert (
+        "Shed 3 low-priority Pushover message(s) to stay within the quota "
+        "(priority -2: 1, -1: 1, 0: 1), dropped." in helper.logged
+    )
+
+
+def test_alert_process_event_skips_what_the_quota_cannot_fit(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    posted: List[str] = []
+    reset_at = str(int(time.time()) + 3600)
+
+    def _fake_post(self: requests.Session, url: str, **kwargs: Any) -> _FakeResponse:
+        del self, url
+        posted.append(json.loads(kwargs["data"])["message"])
+        return _FakeResponse(
+            200,
+            {"status": 1},
+            headers={
+                "X-Limit-App-Limit": "10000",
+                "X-Limit-App-Remaining": "5",
+                "X-Limit-App-Reset": reset_at,
+            },
+        )
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    monkeypatch.delenv("SPLUNK_HOME", raising=False)
+    params = {
+        "account": "prod",
+        "message": "$result.message$",
+        "priority": "$result.priority$",
+        "quota_burst": "1",
+    }
+    events = [
+        {"message": "one", "priority": "0"},
+        {"message": "two", "priority": "0"},
+        {"message": "three", "priority": "0"},
+        {"message": "page", "priority": "2"},
+    ]
+
+    # Without the opt-in a send the quota cannot fit fails the run.
+    helper = _FakeHelper(
+        params=params, account={"user": "user_key", "app_token": "app_token"}, events=events
+    )
+    with pytest.raises(QuotaExhaustedError):
+        process_event(helper)
+    assert posted == ["one", "two"]
+
+    # The third slot is minutes away: skipped and logged, not a failed run. The
+    # emergency after it is never held back by the pacing.
+    posted.clear()
+    helper = _FakeHelper(
+        params=dict(params, skip_over_quota="1"),
+        account={"user": "user_key", "app_token": "app_token"},
+        events=events,
+    )
+    assert process_event(helper) == 0
+    assert posted == ["one", "two", "page"]
+    assert any(
+        line.startswith("Skipped 1 Pushover message(s) the quota could not fit")
+        for line in helper.logged
+    )
+    assert any(line.startswith("Sent 3 Pushover message(s)") for line in helper.logged)
+
+
+def test_recipients_are_packed_into_batches() -> None:
+    recipients = [f"user{index:026d}" for index in range(120)]
+    with FakePushoverServer() as server:
+        with PushoverClient(api_url=server.messages_url) as client:
+            response = client.send(token="token", user=",".join(recipients), message="down")
+
+    assert server.request_counts["messages"] == 3
+    assert [len(message["user"].split(",")) for message in server.messages] == [50, 50, 20]
+    assert server.app_remaining == server.app_limit - 120
+    assert response["status"] == 1
+    assert response["recipients"] == dict.fromkeys(recipients, "sent")
+
+
+def test_recipient_batch_failures_are_reported(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _fake_post(
+        self: requests.Session, url: str, data: bytes, headers: Dict[str, str], timeout: int
+    ) -> _FakeResponse:
+        del self, url, headers, timeout
+        if "bad" in json.loads(data)["user"]:
+            return _FakeResponse(400, {"status": 0, "errors": ["user identifier is invalid"]})
+        return _FakeResponse(200, {"status": 1})
+
+    monkeypatch.setattr(requests.Session, "post", _fake_post)
+    recipients = [f"good{index}" for index in range(50)] + ["bad"]
+    with PushoverClient() as client:
+        response = client.send(token="token", user=",".join(recipients), message="down")
+        with pytest.raises(ValueError, match="user identifier is invalid"):
+            client.send(token="token", user="bad,bad2", message="down")
+
+    assert response["recipients"]["good0"] == "sent"
+    assert response["recipients"]["bad"].startswith("failed: Pushover rejected message")
+
+
+def test_async_client_packs_recipients() -> None:
+    recipients = [f"user{index:026d}" for index in range(60)]
+
+    async def _send(api_url: str) -> Dict[str, Any]:
+        async with AsyncPushoverClient(api_url=api_url) as client:
+            return await client.send(token="token", user=",".join(recipients), message="down")
+
+    with FakePushoverServer() as server:
+        response = asyncio.run(_send(server.messages_url))
+
+    assert server.request_counts["messages"] == 2
+    assert response["recipients"] == dict.fromkeys(recipients, "sent")
+
+
+def test_multipart_body_streams_attachment(tmp_path: Path) -> None:
+    image = tmp_path / "chart.png"
+    image.write_bytes(os.urandom(200 * 1024))
+    attachment = AttachmentCache([str(tmp_path)]).prepare(str(image))
+    assert attachment is not None
+
+    body = MultipartBody({"message": "disk full"}, attachment, boundary="b0undary")
+    chunks = list(body)
+    assert len(chunks) == 6  # head, four 64 KiB reads of the image, tail
+    assert max(len(chunk) for chunk in chunks[1:-1]) <= 64 * 1024
+    assert sum(len(chunk) for chunk in chunks) == len(body)
+    assert chunks[0].startswith(b'--b0undary\r\nContent-Disposition: form-data; name="message"')
+    assert b'filename="chart.png"\r\nContent-Type: image/png' in chunks[0]
+    # A retry iterates again from the start of the file.
+    assert b"".join(body) == b"".join(chunks)
+
+
+def test_attachment_cache_checks_paths_once(tmp_path: Path) -> None:
+    image = tmp_path / "chart.png"
+    image.write_bytes(b"png")
+    (tmp_path / "secrets.conf").write_text("[stanza]")
+    cache = AttachmentCache([str(tmp_path / "dispatch")])
+    with pytest.raises(ValueError, match="outside the allowed directories"):
+        cache.prepare(str(image))
+
+    cache = AttachmentCache([str(tmp_path)])
+    with pytest.raises(ValueError, match="not a supported image type"):
+        cache.prepare(str(tmp_path / "secrets.conf"))
+    with pytest.raises(ValueError, match="cannot be read"):
+        cache.prepare(str(tmp_path / "missing.png"))
+
+    assert cache.prepare(str(image)) == cache.prepare(str(tmp_path / "." / "chart.png"))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_oversized_attachment_without_pillow_is_left_off(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    if importlib.util.find_spec("PIL") is not None:
+        pytest.skip("Pillow is installed, oversized images are downscaled")
+    image = tmp_path / "chart.png"
+    image.write_bytes(b"\0" * 2048)
+    cache = AttachmentCache([str(tmp_path)], max_bytes=1024)
+    assert cache.prepare(str(image)) is None
+    assert "install Pillow to downscale it" in caplog.text
+
+
+def test_oversized_attachment_is_downscaled(tmp_path: Path) -> None:
+    image_module = pytest.importorskip("PIL.Image")
+    image = tmp_path / "chart.png"
+    image_module.frombytes("RGB", (600, 600), os.urandom(600 * 600 * 3)).save(image)
+    cache = AttachmentCache([str(tmp_path)], max_bytes=64 * 1024)
+    attachment = cache.prepare(str(image))
+    assert attachment is not None
+    assert attachment.size <= 64 * 1024
+    assert (attachment.filename, attachment.content_type) == ("chart.jpg", "image/jpeg")
+    cache.close()
+    assert not os.path.exists(attachment.path)
+
+
+def test_clients_send_attachments_as_multipart(tmp_path: Path) -> None:
+    image = tmp_path / "chart.png"
+    image.write_bytes(os.urandom(100 * 1024))
+    attachments = AttachmentCache([str(tmp_path)])
+
+    async def _send_async(api_url: str) -> int:
+        async with AsyncPushoverClient(api_url=api_url, attachments=attachments) as client:
+            return await client.send_all(
+                [{"token": "token", "user": "user", "message": "async", "attachment": str(image)}]
+            )
+
+    with FakePushoverServer() as server:
+        with PushoverClient(api_url=server.messages_url, attachments=attachments) as client:
+            for index in range(2):
+                client.send(
+                    token="token", user="user", message=f"sync {index}", attachment=str(image)
+                )
+            client.send(token="token", user="user", message="no attachment")
+        assert asyncio.run(_send_async(server.messages_url)) == 1
+
+    attached = [message for message in server.messages if "attachment_size" in message]
+    assert [message["message"] for message in attached] == ["sync 0", "sync 1", "async"]
+    assert {message["attachment_size"] for message in attached} == {str(100 * 1024)}
+    assert attached[0]["attachment_name"] == "chart.png"
+    assert attached[0]["attachment_type"] == "image/png"
+    assert "_attachment_filename" not in attached[0]
+    assert (attachments.hits, attachments.misses) == (2, 1)
+
+
+def test_async_client_reads_attachments_off_the_event_loop(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    image = tmp_path / "chart.png"
+    image.write_bytes(os.urandom(300 * 1024))
+    loop_threads: List[int] = []
+    disk_threads: List[int] = []
+
+    class _RecordingCache(AttachmentCache):
+        def prepare(self, path: str) -> Any:
+            disk_threads.append(threading.get_ident())
+            return super().prepare(path)
+
+    stream = MultipartBody.__iter__
+
+    def _recording_stream(self: MultipartBody) -> Iterator[bytes]:
+        for chunk in stream(self):
+            disk_threads.append(threading.get_ident())
+            yield chunk
+
+    monkeypatch.setattr(MultipartBody, "__iter__", _recording_stream)
+
+    async def _send(api_url: str) -> int:
+        loop_threads.append(threading.get_ident())
+        attachments = _RecordingCache([str(tmp_path)])
+        async with AsyncPushoverClient(api_url=api_url, attachments=attachments) as client:
+            return await client.send_all(
+                [{"token": "token", "user": "user", "message": "chart", "attachment": str(image)}]
+            )
+
+    with FakePushoverServer() as server:
+        assert asyncio.run(_send(server.messages_url)) == 1
+    assert server.messages[0]["attachment_size"] == str(300 * 1024)
+    # The cache check, the multipart head, five 64 KiB chunks and the tail.
+    assert len(disk_threads) == 8
+    assert loop_threads[0] not in disk_threads
+
+
+def test_alert_helper_defers_heavy_imports() -> None:
+    script = (
+        "import sys\n"
+        f"sys.path.insert(0, {str(REPO_ROOT / 'package' / 'bin')!r})\n"
+        "from ta_pushover.modalert_pushover_helper import process_event\n"
+        "class Helper:\n"
+        "    def get_param(self, key):\n"
+        "        return {'account': 'prod'}.get(key)\n"
+        "    def log_info(self, message):\n"
+        "        pass\n"
+        "try:\n"
+        "    process_event(Helper())\n"
+        "except ValueError:\n"
+        "    pass\n"
+        "print(sorted({'asyncio', 'requests', 'sqlite3'} & set(sys.modules)))\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, check=True, text=True
+    )
+    assert completed.stdout.strip() == "[]"
+
+
 def test_live_pushover_send_if_configured() -> None:
     token = os.getenv("PUSHOVER_TOKEN")
     user = os.getenv("PUSHOVER_USER")